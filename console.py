@@ -2,8 +2,10 @@
 """Module for the entry point of the command interpreter."""
 
 import cmd
+from datetime import datetime
 from models.base_model import BaseModel
 from models import storage
+from models.engine.file_storage import ConflictError
 import re
 import json
 
@@ -14,6 +16,15 @@ class HBNBCommand(cmd.Cmd):
 
     prompt = "(hbnb) "
 
+    def onecmd(self, line):
+        """Runs a command, reporting the objects another process
+        changed meanwhile instead of exiting."""
+        try:
+            return super().onecmd(line)
+        except ConflictError as e:
+            print("** {} **".format(e))
+            return False
+
     def default(self, line):
         """Catch commands if nothing else matches then."""
         # print("DEF:::", line)
@@ -22,7 +33,7 @@ class HBNBCommand(cmd.Cmd):
     def _precmd(self, line):
         """Intercepts commands to test for class.syntax()"""
         # print("PRECMD:::", line)
-        match = re.search(r"^(\w*)\.(\w+)(?:\(([^)]*)\))$", line)
+        match = re.search(r"^(\w*)\.(\w+)(?:\((.*)\))$", line)
         if not match:
             return line
         classname = match.group(1)
@@ -67,11 +78,12 @@ class HBNBCommand(cmd.Cmd):
                 print("** no instance found **")
             else:
                 attributes = storage.attributes()[classname]
-                for attribute, value in d.items():
-                    if attribute in attributes:
-                        value = attributes[attribute](value)
-                    setattr(storage.all()[key], attribute, value)
-                storage.all()[key].save()
+                with storage.transaction():
+                    for attribute, value in d.items():
+                        if attribute in attributes:
+                            value = attributes[attribute](value)
+                        setattr(storage.all()[key], attribute, value)
+                    storage.all()[key].save()
 
     def do_EOF(self, line):
         """Handles End Of File character.
@@ -135,7 +147,7 @@ class HBNBCommand(cmd.Cmd):
                 if key not in storage.all():
                     print("** no instance found **")
                 else:
-                    del storage.all()[key]
+                    storage.delete(storage.all()[key])
                     storage.save()
 
     def do_all(self, line):
@@ -146,13 +158,27 @@ class HBNBCommand(cmd.Cmd):
             if words[0] not in storage.classes():
                 print("** class doesn't exist **")
             else:
-                nl = [str(obj) for key, obj in storage.all().items()
-                      if type(obj).__name__ == words[0]]
+                nl = [str(obj) for obj in storage.all(words[0]).values()]
                 print(nl)
         else:
             new_list = [str(obj) for key, obj in storage.all().items()]
             print(new_list)
 
+    def do_search(self, line):
+        """Prints the instances of a class matching words, best first.
+        """
+        words = line.split(' ', 1)
+        if not words[0]:
+            print("** class name missing **")
+        elif words[0] not in storage.classes():
+            print("** class doesn't exist **")
+        elif len(words) < 2 or not words[1].strip():
+            print("** search text missing **")
+        elif words[0] not in storage.texts():
+            print("** class has no text **")
+        else:
+            print([str(obj) for obj in storage.search(words[0], words[1])])
+
     def do_count(self, line):
         """Counts the instances of a class.
         """
@@ -162,10 +188,61 @@ class HBNBCommand(cmd.Cmd):
         elif words[0] not in storage.classes():
             print("** class doesn't exist **")
         else:
-            matches = [
-                k for k in storage.all() if k.startswith(
-                    words[0] + '.')]
-            print(len(matches))
+            print(storage.count(words[0]))
+
+    def do_aggregate(self, line):
+        """Prints metrics such as avg(price_by_night) of the instances
+        of a class, grouped by an attribute such as city_id if given.
+        """
+        words = line.split(' ', 1)
+        if not words[0]:
+            print("** class name missing **")
+        elif words[0] not in storage.classes():
+            print("** class doesn't exist **")
+        else:
+            terms = re.findall(r"\w+\([^)]*\)|\w+",
+                               words[1] if len(words) > 1 else "")
+            group_by = None
+            if terms and "(" not in terms[0]:
+                group_by = terms.pop(0)
+            metrics = {term: term for term in terms} or \
+                {"count()": "count()"}
+            try:
+                found = storage.aggregate(words[0], group_by, metrics)
+            except ValueError as e:
+                print("** {} **".format(e))
+                return
+            if group_by is None:
+                print([found])
+            else:
+                print([dict({group_by: value}, **row)
+                       for value, row in found.items()])
+
+    def do_bgsave(self, line):
+        """Saves the instances to disk from a background process.
+        """
+        try:
+            pid = storage.bgsave()
+        except RuntimeError:
+            print("** background save already in progress **")
+        except ValueError:
+            print("** background save not supported **")
+        else:
+            if pid is None:
+                print("Saved")
+            else:
+                print("Background saving started")
+
+    def do_lastsave(self, line):
+        """Prints the time of the last save and the background save state.
+        """
+        status = storage.bgsave_status()
+        last_save = status["last_save"]
+        print("last_save: {}".format(
+            datetime.fromtimestamp(last_save).isoformat() if last_save
+            else "never"))
+        print("in_progress: {}".format(status["in_progress"]))
+        print("last_status: {}".format(status["last_status"] or "none"))
 
     def do_update(self, line):
         """Updates an instance by adding or updating attribute.
@@ -1,5 +1,22 @@
 #!/usr/bin/python3
 """Initializes the package"""
+from os import getenv
 from models.engine.file_storage import FileStorage
-storage = FileStorage()
+
+if getenv("HBNB_TYPE_STORAGE") == "db":
+    from models.engine.db_storage import DBStorage
+    storage = DBStorage(getenv("HBNB_SQLITE_DB"))
+else:
+    flush_delay = getenv("HBNB_STORAGE_FLUSH_DELAY")
+    storage = FileStorage(journal=getenv("HBNB_STORAGE_JOURNAL") == "1",
+                          sharded=getenv("HBNB_STORAGE_SHARDED") == "1",
+                          lazy=getenv("HBNB_STORAGE_LAZY") == "1",
+                          flush_delay=float(flush_delay) if flush_delay
+                          else None,
+                          fsync=getenv("HBNB_STORAGE_FSYNC") or "no",
+                          codec=getenv("HBNB_STORAGE_CODEC") or "json",
+                          compression=getenv("HBNB_STORAGE_COMPRESSION"),
+                          shared=getenv("HBNB_STORAGE_SHARED") == "1",
+                          threadsafe=getenv(
+                              "HBNB_STORAGE_THREADSAFE") == "1")
 storage.reload()
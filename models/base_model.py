@@ -34,6 +34,16 @@ class BaseModel:
             self.updated_at = datetime.now()
             storage.new(self)
 
+    def __setattr__(self, name, value):
+        """Flags the instance as changed and sets an attribute
+
+        The storage is told first, so that a transaction can keep the
+        attributes as they were.
+        """
+
+        storage.touch(self)
+        super().__setattr__(name, value)
+
     def __str__(self):
         """Returns official string representation"""
 
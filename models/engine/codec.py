@@ -0,0 +1,356 @@
+#!/usr/bin/python3
+"""Module for the codecs FileStorage writes its files with."""
+import bz2
+import contextlib
+import datetime
+import gzip
+import io
+import json
+import lzma
+import pickle
+import struct
+import uuid
+
+
+class JSONCodec:
+
+    """Codec of the JSON files, one object per line"""
+    name = "json"
+    magic = b"{"
+
+    def dump(self, items, f):
+        """Writes the (key, dict) pairs of items to the binary file f"""
+        self.write(((k, json.dumps(v)) for k, v in items), f)
+
+    def write(self, texts, f, offsets=None):
+        """Writes the (key, JSON text) pairs of texts to the binary file f
+
+        Args:
+            - texts: iterable of keys and the JSON text of their dict
+            - f: binary file written
+            - offsets: dict getting the (offset, length) of the text of
+              every key, if given
+        """
+        f.write(b"{\n")
+        first = True
+        for k, text in texts:
+            if not first:
+                f.write(b",\n")
+            first = False
+            f.write((json.dumps(k) + ": ").encode("utf-8"))
+            data = text.encode("utf-8")
+            if offsets is not None:
+                offsets[k] = (f.tell(), len(data))
+            f.write(data)
+        f.write(b"\n}\n")
+
+    def load(self, f):
+        """Yields the (key, dict) pairs stored in the binary file f"""
+        from models.engine.file_storage import read_entries
+        text = io.TextIOWrapper(f, encoding="utf-8")
+        try:
+            for k, v, _ in read_entries(text):
+                yield k, v
+        finally:
+            text.detach()
+
+
+class BinaryCodec:
+
+    """Codec of a compact binary format
+
+    Each value starts with a tag byte. Integers are zigzag varints,
+    created_at and updated_at are microseconds since the epoch, and
+    uuids take 16 bytes. Short strings, uuids included, go to a string
+    table the first time they are written and are referred to by their
+    position afterwards, so attribute names and repeated ids such as
+    state_id or city_id are stored once. The table is built as the
+    file is read, so files can be read as a stream.
+    """
+    name = "binary"
+    magic = b"HBNB\x00bin1"
+    intern_length = 64
+    dates = ("created_at", "updated_at")
+    epoch = datetime.datetime(1970, 1, 1)
+    (NONE, FALSE, TRUE, INT, FLOAT, STR, NEW_STR, NEW_UUID, REF, DATE,
+     LIST, DICT) = range(12)
+    RECORD = 1
+    END = 0
+
+    def dump(self, items, f):
+        """Writes the (key, dict) pairs of items to the binary file f"""
+        table = {}
+        out = bytearray(self.magic)
+        for k, v in items:
+            classname, _, uid = k.partition(".")
+            out.append(self.RECORD)
+            self.__value(out, table, classname)
+            self.__value(out, table, uid)
+            self.__value(out, table, v)
+            if len(out) >= 1 << 16:
+                f.write(out)
+                out.clear()
+        out.append(self.END)
+        f.write(out)
+
+    def __value(self, out, table, v, date=False):
+        """Appends the encoding of v to out"""
+        if v is None:
+            out.append(self.NONE)
+        elif v is True or v is False:
+            out.append(self.TRUE if v else self.FALSE)
+        elif isinstance(v, int):
+            out.append(self.INT)
+            self.__varint(out, v << 1 if v >= 0 else (-v << 1) - 1)
+        elif isinstance(v, float):
+            out.append(self.FLOAT)
+            out += struct.pack("<d", v)
+        elif isinstance(v, str):
+            if date and self.__date(out, v):
+                return
+            self.__string(out, table, v)
+        elif isinstance(v, (list, tuple)):
+            out.append(self.LIST)
+            self.__varint(out, len(v))
+            for item in v:
+                self.__value(out, table, item)
+        elif isinstance(v, dict):
+            out.append(self.DICT)
+            self.__varint(out, len(v))
+            for name, item in v.items():
+                self.__string(out, table, name)
+                self.__value(out, table, item, name in self.dates)
+        else:
+            raise TypeError("cannot encode {}".format(type(v).__name__))
+
+    def __date(self, out, v):
+        """Appends v as a timestamp if it reads back the same"""
+        try:
+            dt = datetime.datetime.fromisoformat(v)
+        except ValueError:
+            return False
+        if dt.tzinfo is not None or dt.isoformat() != v:
+            return False
+        out.append(self.DATE)
+        micros = (dt - self.epoch) // datetime.timedelta(microseconds=1)
+        self.__varint(out, micros << 1 if micros >= 0
+                      else (-micros << 1) - 1)
+        return True
+
+    def __string(self, out, table, v):
+        """Appends v, through the string table if it is short"""
+        if len(v) > self.intern_length:
+            data = v.encode("utf-8")
+            out.append(self.STR)
+            self.__varint(out, len(data))
+            out += data
+            return
+        position = table.get(v)
+        if position is not None:
+            out.append(self.REF)
+            self.__varint(out, position)
+            return
+        table[v] = len(table)
+        if len(v) == 36 and self.__is_uuid(v):
+            out.append(self.NEW_UUID)
+            out += uuid.UUID(v).bytes
+            return
+        data = v.encode("utf-8")
+        out.append(self.NEW_STR)
+        self.__varint(out, len(data))
+        out += data
+
+    @staticmethod
+    def __is_uuid(v):
+        """Tells whether v is a uuid in its canonical form"""
+        try:
+            return str(uuid.UUID(v)) == v
+        except ValueError:
+            return False
+
+    @staticmethod
+    def __varint(out, n):
+        """Appends the unsigned integer n, 7 bits per byte"""
+        while n > 0x7f:
+            out.append(n & 0x7f | 0x80)
+            n >>= 7
+        out.append(n)
+
+    def load(self, f):
+        """Yields the (key, dict) pairs stored in the binary file f"""
+        reader = _Reader(f)
+        if reader.read(len(self.magic)) != self.magic:
+            raise ValueError("not a binary storage file")
+        table = []
+        while reader.byte() == self.RECORD:
+            classname = self.__read(reader, table)
+            uid = self.__read(reader, table)
+            yield "{}.{}".format(classname, uid), self.__read(reader, table)
+
+    def __read(self, reader, table):
+        """Returns the next value of reader"""
+        tag = reader.byte()
+        if tag == self.REF:
+            return table[reader.varint()]
+        if tag == self.NEW_STR or tag == self.STR:
+            v = reader.read(reader.varint()).decode("utf-8")
+            if tag == self.NEW_STR:
+                table.append(v)
+            return v
+        if tag == self.NEW_UUID:
+            v = str(uuid.UUID(bytes=reader.read(16)))
+            table.append(v)
+            return v
+        if tag == self.DICT:
+            d = {}
+            for _ in range(reader.varint()):
+                name = self.__read(reader, table)
+                d[name] = self.__read(reader, table)
+            return d
+        if tag == self.LIST:
+            return [self.__read(reader, table)
+                    for _ in range(reader.varint())]
+        if tag == self.INT or tag == self.DATE:
+            n = reader.varint()
+            n = n >> 1 if not n & 1 else -((n + 1) >> 1)
+            if tag == self.INT:
+                return n
+            return (self.epoch +
+                    datetime.timedelta(microseconds=n)).isoformat()
+        if tag == self.FLOAT:
+            return struct.unpack("<d", reader.read(8))[0]
+        if tag == self.NONE:
+            return None
+        if tag == self.FALSE or tag == self.TRUE:
+            return tag == self.TRUE
+        raise ValueError("unknown tag {}".format(tag))
+
+
+class _Reader:
+
+    """Buffered reads of bytes and varints from a binary file"""
+
+    def __init__(self, f, size=1 << 16):
+        """Initializes the reader of f"""
+        self.f = f
+        self.size = size
+        self.buffer = b""
+        self.position = 0
+
+    def read(self, n):
+        """Returns the next n bytes"""
+        end = self.position + n
+        if end > len(self.buffer):
+            self.buffer = self.buffer[self.position:] + \
+                self.f.read(max(n, self.size))
+            self.position = 0
+            end = n
+            if end > len(self.buffer):
+                raise ValueError("truncated binary storage file")
+        data = self.buffer[self.position:end]
+        self.position = end
+        return data
+
+    def byte(self):
+        """Returns the next byte"""
+        if self.position < len(self.buffer):
+            self.position += 1
+            return self.buffer[self.position - 1]
+        return self.read(1)[0]
+
+    def varint(self):
+        """Returns the next unsigned varint"""
+        n = 0
+        shift = 0
+        while True:
+            b = self.byte()
+            n |= (b & 0x7f) << shift
+            if b < 0x80:
+                return n
+            shift += 7
+
+
+class PickleCodec:
+
+    """Codec of a stream of pickles, protocol 5
+
+    Only load files you wrote yourself: unpickling runs code chosen by
+    whoever wrote the file.
+    """
+    name = "pickle"
+    magic = b"\x80\x05"
+
+    def dump(self, items, f):
+        """Writes the (key, dict) pairs of items to the binary file f"""
+        pickler = pickle.Pickler(f, protocol=5)
+        for item in items:
+            pickler.dump(item)
+            pickler.clear_memo()
+        pickler.dump(None)
+
+    def load(self, f):
+        """Yields the (key, dict) pairs stored in the binary file f"""
+        unpickler = pickle.Unpickler(f)
+        while True:
+            item = unpickler.load()
+            if item is None:
+                return
+            yield item
+
+
+CODECS = {codec.name: codec
+          for codec in (JSONCodec(), BinaryCodec(), PickleCodec())}
+
+
+def detect(head, codec="json"):
+    """Returns the codec of the file whose first bytes are head
+
+    Anything that does not start with the magic bytes of a codec is
+    read as JSON, which may start with white space. Unpickling runs
+    code, so a pickle is only read by a store of the pickle codec.
+
+    Args:
+        - head: first bytes of the file
+        - codec: name of the codec of the store reading the file
+    """
+    for found in CODECS.values():
+        if head.startswith(found.magic):
+            if found.name == "pickle" and codec != "pickle":
+                raise ValueError("refusing to unpickle a file read by a "
+                                 "{} store".format(codec))
+            return found
+    return CODECS["json"]
+
+
+COMPRESSIONS = {"gzip": b"\x1f\x8b", "bz2": b"BZh", "lzma": b"\xfd7zXZ\x00"}
+
+
+def compressor(f, compression):
+    """Returns a context manager of a file compressing into f
+
+    Closing it finishes the compressed stream but leaves f open. With
+    compression None the data goes to f unchanged.
+    """
+    if compression is None:
+        return contextlib.nullcontext(f)
+    if compression == "gzip":
+        return gzip.GzipFile(fileobj=f, mode="wb", compresslevel=6, mtime=0)
+    if compression == "bz2":
+        return bz2.BZ2File(f, "wb")
+    return lzma.LZMAFile(f, "wb")
+
+
+def decompressor(f):
+    """Returns f, or a file decompressing f as it is read
+
+    The compression is told by the first bytes of f, which must be a
+    buffered binary file.
+    """
+    head = f.peek(6)[:6]
+    if head.startswith(COMPRESSIONS["gzip"]):
+        return gzip.GzipFile(fileobj=f, mode="rb")
+    if head.startswith(COMPRESSIONS["bz2"]):
+        return bz2.BZ2File(f, "rb")
+    if head.startswith(COMPRESSIONS["lzma"]):
+        return lzma.LZMAFile(f, "rb")
+    return f
@@ -0,0 +1,368 @@
+#!/usr/bin/python3
+"""Module for DBStorage class."""
+import contextlib
+import datetime
+import json
+import sqlite3
+import time
+import weakref
+from collections.abc import MutableMapping
+from models.engine.file_storage import FileStorage
+from models.engine.index import ColumnIndex, TextIndex, parse_metrics
+
+
+class DBStorage:
+
+    """Class for storing and retrieving data in a SQLite database"""
+    __db_path = "hbnb.db"
+    __types = {str: "TEXT", int: "INTEGER", float: "REAL",
+               list: "TEXT", datetime.datetime: "TEXT"}
+
+    classes = FileStorage.classes
+    attributes = FileStorage.attributes
+    relations = FileStorage.relations
+    texts = FileStorage.texts
+
+    def __init__(self, db_path=None):
+        """Initializes the storage
+
+        Args:
+            - db_path: path of the SQLite database file
+        """
+        self.db_path = db_path or DBStorage.__db_path
+        self.__conn = None
+        self.__cache = weakref.WeakValueDictionary()
+        self.__dirty = {}
+        self.__deleted = set()
+        self.__objects = DBObjects(self)
+        self.__last_save = None
+        self.__images = None
+
+    def all(self, cls=None):
+        """returns a mapping of every stored object by <class name>.id
+
+        Args:
+            - cls: class or class name whose objects are loaded and
+              returned in a dictionary
+        """
+        if cls is None:
+            return self.__objects
+        if not isinstance(cls, str):
+            cls = cls.__name__
+        return {key: self.get(key) for key in self.keys(cls)}
+
+    def snapshot(self, cls=None):
+        """returns a copy of the objects, or of the objects of cls"""
+        if cls is None:
+            return {key: self.get(key) for key in self.keys()}
+        return self.all(cls)
+
+    def items(self, cls=None):
+        """returns an iterator over the (key, object) pairs of snapshot()
+        """
+        return iter(self.snapshot(cls).items())
+
+    def count(self, cls=None):
+        """returns the number of objects, or of objects of cls"""
+        if cls is None:
+            return len(self.__objects)
+        if not isinstance(cls, str):
+            cls = cls.__name__
+        return sum(1 for _ in self.keys(cls))
+
+    def children(self, parent, parent_id, child):
+        """returns the objects of class child referencing parent_id"""
+        if not isinstance(parent, str):
+            parent = parent.__name__
+        if not isinstance(child, str):
+            child = child.__name__
+        for attribute, classname in self.relations().get(child, {}).items():
+            if classname == parent:
+                break
+        else:
+            raise ValueError("{} has no reference to {}".format(
+                child, parent))
+        objects = {}
+        for key, obj in list(self.__dirty.items()):
+            if key.startswith(child + ".") and \
+                    getattr(obj, attribute, None) == parent_id:
+                objects[key] = obj
+        for uid, in self.__conn.execute(
+                'SELECT id FROM "{}" WHERE "{}" = ?'.format(child, attribute),
+                (parent_id,)):
+            key = "{}.{}".format(child, uid)
+            if key not in self.__dirty and key not in self.__deleted:
+                objects[key] = self.get(key)
+        return objects
+
+    def search(self, cls, text, limit=None):
+        """returns the objects of cls whose free text best matches text"""
+        if not isinstance(cls, str):
+            cls = cls.__name__
+        if cls not in self.texts():
+            raise ValueError("{} has no text to search".format(cls))
+        objects = self.all(cls)
+        index = TextIndex(cls, self.texts()[cls])
+        for key, obj in objects.items():
+            index.add(key, obj)
+        return [objects[key] for _, key in index.search(text, limit)]
+
+    def aggregate(self, cls, group_by=None, metrics=None):
+        """returns metrics over the objects of cls, as FileStorage"""
+        if not isinstance(cls, str):
+            cls = cls.__name__
+        metrics = parse_metrics(metrics or {"count": "count()"})
+        numbers = {attribute: kind for attribute, kind in
+                   self.attributes().get(cls, {}).items()
+                   if kind in (int, float)}
+        if not numbers:
+            raise ValueError("{} has no numeric attributes".format(cls))
+        columns = ColumnIndex(cls, numbers,
+                              list(self.relations().get(cls, {})))
+        for key, obj in self.all(cls).items():
+            columns.add(key, obj)
+        return columns.aggregate(metrics, group_by)
+
+    def new(self, obj):
+        """adds obj to the current session"""
+        key = "{}.{}".format(type(obj).__name__, obj.id)
+        self.__record(key)
+        self.__cache[key] = obj
+        self.__dirty[key] = obj
+        self.__deleted.discard(key)
+
+    def touch(self, obj):
+        """flags obj as changed since the last save"""
+        key = "{}.{}".format(type(obj).__name__, obj.__dict__.get("id"))
+        if self.__cache.get(key) is obj:
+            self.__record(key)
+            self.__dirty[key] = obj
+
+    def delete(self, obj=None):
+        """deletes obj from the current session"""
+        if obj is None:
+            return
+        key = "{}.{}".format(type(obj).__name__, obj.id)
+        self.__record(key)
+        self.__cache.pop(key, None)
+        self.__dirty.pop(key, None)
+        self.__deleted.add(key)
+
+    def bulk_new(self, objs):
+        """adds every object of objs and saves once, returns the number
+        of objects added"""
+        added = 0
+        for obj in objs:
+            self.new(obj)
+            added += 1
+        if added:
+            self.save()
+        return added
+
+    def bulk_delete(self, keys):
+        """deletes the objects under keys and saves once, returns the
+        number of objects deleted"""
+        found = [key for key in keys if key in self.__objects]
+        for key in found:
+            self.__record(key)
+            self.__cache.pop(key, None)
+            self.__dirty.pop(key, None)
+            self.__deleted.add(key)
+        if found:
+            self.save()
+        return len(found)
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """groups the changes of a with block into a single save, as
+        FileStorage.transaction() does"""
+        if self.__images is not None:
+            yield self
+            return
+        images = self.__images = {}
+        dirty = dict(self.__dirty)
+        deleted = set(self.__deleted)
+        try:
+            yield self
+        except BaseException:
+            self.__images = None
+            for key, image in images.items():
+                if image is None:
+                    self.__cache.pop(key, None)
+                else:
+                    obj, attributes = image
+                    obj.__dict__.clear()
+                    obj.__dict__.update(attributes)
+                    self.__cache[key] = obj
+            self.__dirty = dirty
+            self.__deleted = deleted
+            raise
+        finally:
+            self.__images = None
+        self.save()
+
+    def __record(self, key):
+        """Keeps the object under key and its attributes before its
+        first change in the transaction"""
+        if self.__images is None or key in self.__images:
+            return
+        obj = self.__cache.get(key)
+        self.__images[key] = None if obj is None else \
+            (obj, dict(obj.__dict__))
+
+    def save(self):
+        """writes the changes of the current session in one transaction"""
+        if self.__images is not None:
+            return
+        with self.__conn:
+            for key, obj in self.__dirty.items():
+                self.__conn.execute(*self.__upsert(obj))
+            for key in self.__deleted:
+                classname, uid = key.split(".", 1)
+                self.__conn.execute(
+                    'DELETE FROM "{}" WHERE id = ?'.format(classname),
+                    (uid,))
+        self.__dirty = {}
+        self.__deleted = set()
+        self.__last_save = time.time()
+
+    def bgsave(self):
+        """writes the current session; SQLite commits need no snapshot"""
+        self.save()
+        return None
+
+    def bgsave_status(self):
+        """returns the state of the background save, as FileStorage"""
+        return {"in_progress": False, "pid": None, "started": None,
+                "last_save": self.__last_save,
+                "last_status": "ok" if self.__last_save else None}
+
+    def reload(self):
+        """creates the tables and starts a new session"""
+        if self.__conn is not None:
+            self.__conn.close()
+        self.__conn = sqlite3.connect(self.db_path)
+        with self.__conn:
+            for classname in self.classes():
+                self.__conn.execute(self.__schema(classname))
+                for column in self.columns(classname):
+                    if column.endswith("_id"):
+                        self.__conn.execute(
+                            'CREATE INDEX IF NOT EXISTS "{0}_{1}" '
+                            'ON "{0}" ("{1}")'.format(classname, column))
+        self.__cache = weakref.WeakValueDictionary()
+        self.__dirty = {}
+        self.__deleted = set()
+
+    def columns(self, classname):
+        """Returns the declared attributes and types of classname"""
+        attributes = self.attributes()
+        columns = dict(attributes["BaseModel"])
+        if classname != "BaseModel":
+            columns.update(attributes[classname])
+        return columns
+
+    def get(self, key):
+        """Returns the object stored under key, or None"""
+        if key in self.__deleted:
+            return None
+        obj = self.__cache.get(key)
+        if obj is not None:
+            return obj
+        classname, _, uid = key.partition(".")
+        if classname not in self.classes():
+            return None
+        columns = list(self.columns(classname))
+        row = self.__conn.execute(
+            'SELECT {}, extra FROM "{}" WHERE id = ?'.format(
+                ", ".join('"{}"'.format(c) for c in columns), classname),
+            (uid,)).fetchone()
+        if row is None:
+            return None
+        kwargs = json.loads(row[-1]) if row[-1] else {}
+        types = self.columns(classname)
+        for column, value in zip(columns, row):
+            if value is not None:
+                if types[column] is list:
+                    value = json.loads(value)
+                kwargs[column] = value
+        obj = self.classes()[classname](**kwargs)
+        self.__cache[key] = obj
+        return obj
+
+    def keys(self, classname=None):
+        """Yields the key of every stored object, or of classname's"""
+        if classname is not None and classname not in self.classes():
+            return
+        for key in self.__dirty:
+            if classname is None or key.startswith(classname + "."):
+                yield key
+        for name in [classname] if classname else self.classes():
+            for uid, in self.__conn.execute(
+                    'SELECT id FROM "{}"'.format(name)):
+                key = "{}.{}".format(name, uid)
+                if key not in self.__dirty and key not in self.__deleted:
+                    yield key
+
+    def __schema(self, classname):
+        """Returns the CREATE TABLE statement of classname"""
+        columns = ['"{}" {}'.format(c, DBStorage.__types[t])
+                   for c, t in self.columns(classname).items()]
+        columns[0] += " PRIMARY KEY"
+        columns.append("extra TEXT")
+        return 'CREATE TABLE IF NOT EXISTS "{}" ({})'.format(
+            classname, ", ".join(columns))
+
+    def __upsert(self, obj):
+        """Returns the INSERT statement and values that store obj"""
+        classname = type(obj).__name__
+        d = obj.to_dict()
+        del d["__class__"]
+        types = self.columns(classname)
+        values = []
+        for column, kind in types.items():
+            value = d.pop(column, None)
+            if kind is list and value is not None:
+                value = json.dumps(value)
+            values.append(value)
+        values.append(json.dumps(d) if d else None)
+        sql = 'INSERT OR REPLACE INTO "{}" ({}, extra) VALUES ({})'.format(
+            classname, ", ".join('"{}"'.format(c) for c in types),
+            ", ".join("?" * len(values)))
+        return sql, values
+
+
+class DBObjects(MutableMapping):
+
+    """Mapping view of a DBStorage, loading objects on access"""
+
+    def __init__(self, storage):
+        """Initializes the view over storage"""
+        self.storage = storage
+
+    def __getitem__(self, key):
+        """Returns the object stored under key"""
+        obj = self.storage.get(key)
+        if obj is None:
+            raise KeyError(key)
+        return obj
+
+    def __contains__(self, key):
+        """Tells whether an object is stored under key"""
+        return self.storage.get(key) is not None
+
+    def __setitem__(self, key, obj):
+        """Adds obj to the storage"""
+        self.storage.new(obj)
+
+    def __delitem__(self, key):
+        """Deletes the object stored under key"""
+        self.storage.delete(self[key])
+
+    def __iter__(self):
+        """Iterates over the stored keys"""
+        return self.storage.keys()
+
+    def __len__(self):
+        """Returns the number of stored objects"""
+        return sum(1 for _ in self.storage.keys())
@@ -1,8 +1,245 @@
 #!/usr/bin/python3
 """Module for FileStorage class."""
+import asyncio
+import contextlib
 import datetime
+import io
 import json
+import atexit
+import logging
+import multiprocessing
 import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from models.engine.codec import CODECS, COMPRESSIONS, compressor, \
+    decompressor, detect
+from models.engine.hamt import HAMT
+from models.engine.index import BitmapIndex, ClassIndex, ColumnIndex, \
+    ForeignKeyIndex, GeoIndex, RangeIndex, TextIndex, parse_metrics
+from models.engine.query import Query
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+def read_entries(f):
+    """Yields (key, dict, JSON text) for each object in the file f
+
+    Files written by FileStorage hold one object per line, whose JSON
+    text is kept so unchanged objects are not serialized again.
+    Any other JSON document is read whole, without the text.
+    """
+    head = f.readline()
+    if head != "{\n":
+        for k, v in json.loads(head + f.read()).items():
+            yield k, v, None
+        return
+    decoder = json.JSONDecoder()
+    for line in f:
+        line = line.rstrip("\n").rstrip(",")
+        if line == "}":
+            break
+        if not line:
+            continue
+        key, end = decoder.raw_decode(line)
+        fragment = line[end + 2:]
+        yield key, json.loads(fragment), fragment
+
+
+def load_shard(path, codec="json"):
+    """Returns a list of (key, object, JSON text) read from path
+
+    The compression and codec of the file are told by its first bytes,
+    and the file is decoded as it is read. Only JSON files give the
+    JSON text of their objects. Pickles are read only if codec, the
+    codec of the store, is "pickle".
+    """
+    classes = FileStorage().classes()
+    with open(path, "rb") as raw, decompressor(raw) as f:
+        codec = detect(f.peek(16)[:16], codec)
+        if codec.name != "json":
+            return [(k, classes[v["__class__"]](**v), None)
+                    for k, v in codec.load(f)]
+        with io.TextIOWrapper(f, encoding="utf-8") as text:
+            return [(k, classes[v["__class__"]](**v), fragment)
+                    for k, v, fragment in read_entries(text)]
+
+
+class Stub:
+
+    """Location of an object that was not decoded yet"""
+    __slots__ = ("path", "offset", "length")
+
+    def __init__(self, path, offset, length):
+        """Initializes the location of the JSON text in path"""
+        self.path = path
+        self.offset = offset
+        self.length = length
+
+    def read(self, files=None):
+        """Returns the JSON text, reusing the open files if given"""
+        if files is None:
+            with open(self.path, "rb") as f:
+                f.seek(self.offset)
+                return f.read(self.length).decode("utf-8")
+        if self.path not in files:
+            files[self.path] = open(self.path, "rb")
+        f = files[self.path]
+        f.seek(self.offset)
+        return f.read(self.length).decode("utf-8")
+
+
+class FileLock:
+
+    """Advisory lock on a file, shared between processes"""
+
+    def __init__(self, path, exclusive=True):
+        """Initializes the lock of path, exclusive or shared"""
+        self.path = path
+        self.exclusive = exclusive
+        self.f = None
+
+    def __enter__(self):
+        """Waits for the lock and takes it"""
+        self.f = open(self.path, "a")
+        fcntl.flock(self.f.fileno(),
+                    fcntl.LOCK_EX if self.exclusive else fcntl.LOCK_SH)
+        return self
+
+    def __exit__(self, *exc):
+        """Releases the lock"""
+        fcntl.flock(self.f.fileno(), fcntl.LOCK_UN)
+        self.f.close()
+
+
+class ReadWriteLock:
+
+    """Lock held by many readers at once or by a single writer
+
+    A with statement takes it for writing, read() for reading. The
+    writer may take it again for writing or reading, and readers may
+    read again, but a reader cannot become the writer. Waiting writers
+    go before threads that start reading.
+    """
+
+    def __init__(self):
+        """Initializes the lock, free"""
+        self.__condition = threading.Condition(threading.Lock())
+        self.__readers = {}
+        self.__writer = None
+        self.__writes = 0
+        self.__waiting = 0
+
+    def __enter__(self):
+        """Waits until no one else holds the lock and takes it to write"""
+        me = threading.get_ident()
+        with self.__condition:
+            if self.__writer == me:
+                self.__writes += 1
+                return self
+            if me in self.__readers:
+                raise RuntimeError("cannot write while reading")
+            self.__waiting += 1
+            while self.__writer is not None or self.__readers:
+                self.__condition.wait()
+            self.__waiting -= 1
+            self.__writer = me
+            self.__writes = 1
+        return self
+
+    def __exit__(self, *exc):
+        """Releases the lock taken to write"""
+        with self.__condition:
+            self.__writes -= 1
+            if not self.__writes:
+                self.__writer = None
+                self.__condition.notify_all()
+
+    @contextlib.contextmanager
+    def read(self):
+        """Holds the lock to read for the duration of a with block"""
+        me = threading.get_ident()
+        with self.__condition:
+            if self.__writer != me and me not in self.__readers:
+                while self.__writer is not None or self.__waiting:
+                    self.__condition.wait()
+            self.__readers[me] = self.__readers.get(me, 0) + 1
+        try:
+            yield self
+        finally:
+            with self.__condition:
+                self.__readers[me] -= 1
+                if not self.__readers[me]:
+                    del self.__readers[me]
+                    self.__condition.notify_all()
+
+
+class LazyObjects(dict):
+
+    """Dictionary of objects decoded the first time they are read
+
+    Threads reading the same key at once may each decode it, but only
+    the first object stored is kept and returned to all of them.
+    """
+
+    def __init__(self, hydrate):
+        """Initializes an empty dictionary
+
+        Args:
+            - hydrate: function building the object from (key, Stub)
+        """
+        super().__init__()
+        self.hydrate = hydrate
+        self.lock = threading.Lock()
+
+    def __getitem__(self, key):
+        """Returns the object under key, decoding it if needed"""
+        stub = super().__getitem__(key)
+        if type(stub) is not Stub:
+            return stub
+        obj = self.hydrate(key, stub)
+        with self.lock:
+            stored = super().get(key)
+            if stored is stub:
+                super().__setitem__(key, obj)
+            elif stored is not None:
+                obj = stored
+        return obj
+
+    def __iter__(self):
+        """Iterates over the keys without decoding anything"""
+        return super().__iter__()
+
+    def get(self, key, default=None):
+        """Returns the object under key or default"""
+        if key in self:
+            return self[key]
+        return default
+
+    def values(self):
+        """Returns the list of objects, decoding all of them"""
+        return [self[k] for k in self]
+
+    def items(self):
+        """Returns the list of (key, object), decoding all of them"""
+        return [(k, self[k]) for k in self]
+
+    def copy(self):
+        """Returns a plain dictionary of the decoded objects"""
+        return dict(self.items())
+
+
+class ConflictError(Exception):
+
+    """Raised when objects were changed by another process meanwhile"""
+
+    def __init__(self, keys):
+        """Initializes the error with the keys in conflict"""
+        super().__init__("changed by another process: {}".format(
+            ", ".join(sorted(keys))))
+        self.keys = sorted(keys)
 
 
 class FileStorage:
@@ -10,21 +247,1181 @@ class FileStorage:
     """Class for storing and retrieving data"""
     __file_path = "file.json"
     __objects = {}
+    __map = None
+    __tracked = None
+    __dirty = set()
+    __deleted = set()
+    __fragments = {}
+    __stale_shards = None
+    __partitions = None
+    __indexes = {}
+    __unindexed = {}
+    __log_records = 0
+    __lock = threading.RLock()
+    __index_lock = threading.Lock()
+    __written = 0
+    __synced = 0
+    __sync_lock = threading.Lock()
+    __fsync_policies = ("always", "everysec", "no")
+    __bgsave = None
+    __bgsave_status = None
+    __last_save = None
+    __versions = {}
+    __generation = 0
+    __transaction = None
+    __transaction_thread = None
+
+    def __init__(self, journal=False, compact_every=1000, sharded=False,
+                 workers=None, lazy=False, flush_delay=None,
+                 flush_every=None, fsync="no", codec="json",
+                 compression=None, shared=False, threadsafe=False):
+        """Initializes the storage settings
+
+        Args:
+            - journal: append changes to a log file instead of
+              rewriting the whole JSON file on every save
+            - compact_every: number of log records after which the
+              log is folded back into the JSON file
+            - sharded: keep one <class name>.json file per class
+              next to the JSON file instead of a single file
+            - workers: number of processes reloading the shards,
+              defaults to one per CPU
+            - lazy: only read an index of byte offsets on reload and
+              decode each object the first time it is accessed
+            - flush_delay: if set, save() only requests a write, which a
+              background thread performs flush_delay seconds after the
+              first request, folding in every save() made meanwhile
+            - flush_every: number of requests that triggers the write
+              before flush_delay is over
+            - fsync: when writes reach the disk: "always" before save()
+              or flush() returns, "everysec" from a background thread
+              once per second, "no" whenever the OS decides
+            - codec: format of the files written, "json", "binary" or
+              "pickle"; reload() reads any of them, except that pickles
+              are only read by a "pickle" store
+            - compression: None, "gzip", "bz2" or "lzma" to compress the
+              files as they are written; reload() tells them apart
+            - shared: let several processes use the files at once;
+              writes take a lock file, and each object carries a
+              version so that concurrent changes are merged, or
+              refused with ConflictError when they touch the same
+              object
+            - threadsafe: let threads read at the same time while
+              writes wait for them and run one at a time; iterate over
+              snapshot() or items() rather than all() meanwhile
+        """
+        if fsync not in FileStorage.__fsync_policies:
+            raise ValueError("fsync must be one of {}".format(
+                ", ".join(FileStorage.__fsync_policies)))
+        if codec not in CODECS:
+            raise ValueError("codec must be one of {}".format(
+                ", ".join(CODECS)))
+        if compression is not None and compression not in COMPRESSIONS:
+            raise ValueError("compression must be one of {}".format(
+                ", ".join(COMPRESSIONS)))
+        if shared and (journal or lazy or fcntl is None):
+            raise ValueError("shared storage needs file locks and full "
+                             "writes, without journal or lazy mode")
+        if lazy and (codec != "json" or compression is not None):
+            raise ValueError("lazy objects are read from uncompressed "
+                             "JSON files")
+        self.journal = journal
+        self.compact_every = compact_every
+        self.sharded = sharded
+        self.workers = workers
+        self.lazy = lazy
+        self.flush_delay = flush_delay
+        self.flush_every = flush_every
+        self.fsync = fsync
+        self.codec = CODECS[codec]
+        self.compression = compression
+        self.shared = shared
+        self.threadsafe = threadsafe
+        if threadsafe and type(FileStorage.__lock) is not ReadWriteLock:
+            FileStorage.__lock = ReadWriteLock()
+        self.__syncer = None
+        self.__apending = None
+        self.__arunning = None
+        self.__requests = 0
+        self.__since = None
+        self.__writer = None
+        self.__wakeup = threading.Condition()
 
-    def all(self):
-        """returns the dictionary __objects"""
-        return FileStorage.__objects
+    def all(self, cls=None):
+        """returns the dictionary __objects, or the objects of cls only
+
+        Args:
+            - cls: class or class name to filter on
+        """
+        if cls is None:
+            return FileStorage.__objects
+        with self.__reading():
+            objects = FileStorage.__objects
+            return {k: objects[k] for k in self.__partition(cls)
+                    if k in objects}
+
+    def count(self, cls=None):
+        """returns the number of objects, or of objects of cls"""
+        if cls is None:
+            return len(FileStorage.__objects)
+        with self.__reading():
+            return len(self.__partition(cls))
+
+    def snapshot(self, cls=None):
+        """returns the objects as they are now, or the objects of cls
+
+        The objects are kept in a persistent map as well, which new()
+        and delete() replace with a changed copy sharing all but a few
+        of its nodes; the map of the moment is the snapshot, and
+        taking it costs nothing. The map is built on the first call
+        after a reload, which decodes every object in lazy mode. The
+        objects of cls are copied to a dictionary.
+
+        Only changes made through the storage are tracked. Objects
+        added to or removed from the dictionary of all() directly are
+        noticed only by the size of the dictionary: the map is rebuilt
+        when the sizes differ, and a change leaving the size as it was
+        is not seen until the next reload.
+        """
+        if cls is not None:
+            return self.all(cls)
+        objects = FileStorage.__objects
+        snapshot = FileStorage.__map
+        if FileStorage.__tracked is objects and snapshot is not None and \
+                len(snapshot) == len(objects):
+            return snapshot
+        with FileStorage.__lock:
+            self.__sync()
+            objects = FileStorage.__objects
+            if FileStorage.__map is None or \
+                    len(FileStorage.__map) != len(objects):
+                FileStorage.__map = HAMT(objects.items())
+            return FileStorage.__map
+
+    def items(self, cls=None):
+        """returns an iterator over the (key, object) pairs of snapshot()
+        """
+        return iter(self.snapshot(cls).items())
+
+    def __reading(self):
+        """Returns a context holding the lock to read in thread-safe mode
+        """
+        if self.threadsafe:
+            return FileStorage.__lock.read()
+        return contextlib.nullcontext()
+
+    def __partition(self, cls):
+        """Returns the keys of the objects of cls"""
+        self.__sync()
+        if FileStorage.__partitions is None:
+            FileStorage.__partitions = ClassIndex(FileStorage.__objects)
+        if not isinstance(cls, str):
+            cls = cls.__name__
+        return FileStorage.__partitions.get(cls)
 
     def new(self, obj):
         """sets in __objects the obj with key <obj class name>.id"""
         key = "{}.{}".format(type(obj).__name__, obj.id)
+        with FileStorage.__lock:
+            self.__sync()
+            self.__add(key, obj)
+
+    def bulk_new(self, objs):
+        """adds every object of objs and saves once, returns the number
+        of objects added
+
+        Objects built from keyword arguments are not added by their
+        constructor; this adds any number of them for a single save,
+        and the indexes take them in at their next lookup.
+
+        Args:
+            - objs: iterable of objects
+        """
+        added = 0
+        with FileStorage.__lock:
+            self.__sync()
+            for obj in objs:
+                self.__add("{}.{}".format(type(obj).__name__, obj.id), obj)
+                added += 1
+            if added:
+                self.save()
+        return added
+
+    def __add(self, key, obj):
+        """Sets obj under key and flags it for the save and indexes"""
+        self.__record(key)
         FileStorage.__objects[key] = obj
+        if FileStorage.__map is not None:
+            FileStorage.__map = FileStorage.__map.set(key, obj)
+        FileStorage.__dirty.add(key)
+        FileStorage.__deleted.discard(key)
+        self.__stale(type(obj).__name__)
+        if FileStorage.__partitions is not None:
+            FileStorage.__partitions.add(key)
+        self.__unindex(key)
+
+    def touch(self, obj):
+        """flags obj as changed since the last save"""
+        key = "{}.{}".format(type(obj).__name__, obj.__dict__.get("id"))
+        if dict.get(FileStorage.__objects, key) is not obj:
+            return
+        with FileStorage.__lock:
+            self.__sync()
+            self.__record(key)
+            FileStorage.__dirty.add(key)
+            self.__stale(type(obj).__name__)
+            self.__unindex(key)
+
+    def delete(self, obj=None):
+        """deletes obj from __objects if it's inside"""
+        if obj is None:
+            return
+        key = "{}.{}".format(type(obj).__name__, obj.id)
+        with FileStorage.__lock:
+            self.__sync()
+            self.__remove(key)
+
+    def bulk_delete(self, keys):
+        """deletes the objects under keys and saves once, returns the
+        number of objects deleted
+
+        Args:
+            - keys: iterable of <class name>.id keys; keys of no
+              object are skipped
+        """
+        with FileStorage.__lock:
+            self.__sync()
+            deleted = sum(self.__remove(key) for key in keys)
+            if deleted:
+                self.save()
+        return deleted
+
+    def __remove(self, key):
+        """Deletes the object under key, tells whether there was one"""
+        self.__record(key)
+        if FileStorage.__objects.pop(key, None) is None:
+            return False
+        if FileStorage.__map is not None:
+            FileStorage.__map = FileStorage.__map.discard(key)
+        FileStorage.__fragments.pop(key, None)
+        FileStorage.__dirty.discard(key)
+        FileStorage.__deleted.add(key)
+        self.__stale(key.partition(".")[0])
+        if FileStorage.__partitions is not None:
+            FileStorage.__partitions.remove(key)
+        self.__unindex(key)
+        return True
+
+    def children(self, parent, parent_id, child):
+        """returns the objects of class child referencing parent_id
+
+        Args:
+            - parent: class or class name of the referenced object
+            - parent_id: id of the referenced object
+            - child: class or class name of the referencing objects
+        """
+        if not isinstance(parent, str):
+            parent = parent.__name__
+        if not isinstance(child, str):
+            child = child.__name__
+        for attribute, classname in self.relations().get(child, {}).items():
+            if classname == parent:
+                break
+        else:
+            raise ValueError("{} has no reference to {}".format(
+                child, parent))
+        with self.__reading():
+            index = self.__index("{}.{}".format(child, attribute))
+            objects = FileStorage.__objects
+            return {k: objects[k] for k in index.get(parent_id)}
+
+    def __index(self, name):
+        """Returns the index called name, up to date with the objects
+
+        Each index is built the first time it is used, from the objects
+        of its class only. After that, new() and delete() and attribute
+        changes flag the keys to index again, one set of keys per index,
+        and each index takes in its own keys here before its lookups.
+        Readers of thread-safe mode take turns at this.
+        """
+        self.__sync()
+        classname = name.partition(".")[0]
+        with FileStorage.__index_lock:
+            index = FileStorage.__indexes.get(name)
+            if index is None:
+                index = self.__new_index(name)
+                if index is None:
+                    return None
+                objects = FileStorage.__objects
+                for k in self.__partition(classname):
+                    if k in objects:
+                        index.add(k, objects[k])
+                self.__settle(index)
+                FileStorage.__indexes[name] = index
+                FileStorage.__unindexed.setdefault(classname, {})[name] = \
+                    set()
+                return index
+            pending = FileStorage.__unindexed[classname]
+            if pending[name]:
+                objects = FileStorage.__objects
+                for k in pending[name]:
+                    index.remove(k)
+                    if k in objects:
+                        index.add(k, objects[k])
+                self.__settle(index)
+                pending[name] = set()
+            return index
+
+    def __new_index(self, name):
+        """Returns a new empty index called name, or None if there is
+        no such index
+
+        Indexes are named <class name>.<attribute>: the text attribute
+        of a class gets a TextIndex, location a GeoIndex over latitude
+        and longitude, numbers a RangeIndex, lists a BitmapIndex,
+        columns the ColumnIndex of the numbers and the id attributes a
+        ForeignKeyIndex.
+        """
+        classname, _, attribute = name.partition(".")
+        fields = self.attributes().get(classname, {})
+        relations = self.relations().get(classname, {})
+        if self.texts().get(classname) == attribute:
+            return TextIndex(classname, attribute)
+        if attribute == "location" and \
+                {"latitude", "longitude"} <= set(fields):
+            return GeoIndex(classname)
+        if fields.get(attribute) in (int, float):
+            return RangeIndex(classname, attribute)
+        if fields.get(attribute) is list:
+            return BitmapIndex(classname, attribute)
+        if attribute == "columns":
+            numbers = {field: kind for field, kind in fields.items()
+                       if kind in (int, float)}
+            if numbers:
+                return ColumnIndex(classname, numbers, list(relations))
+        if attribute in relations:
+            return ForeignKeyIndex(classname, attribute)
+        return None
+
+    def __unindex(self, key):
+        """Flags key to be indexed again by the indexes of its class"""
+        pending = FileStorage.__unindexed.get(key.partition(".")[0])
+        if pending:
+            for keys in pending.values():
+                keys.add(key)
+
+    def __settle(self, index):
+        """Merges in the changes a range or bitmap index set aside, so
+        that lookups do not change it"""
+        if isinstance(index, (RangeIndex, BitmapIndex)):
+            index.settle()
+
+    def nearby(self, latitude, longitude, radius):
+        """returns the places within radius km of a point, nearest first"""
+        with self.__reading():
+            index = self.__index("Place.location")
+            return self.__places(index.nearby(latitude, longitude, radius))
+
+    def nearest(self, latitude, longitude, k=1):
+        """returns the k places nearest to a point, nearest first"""
+        with self.__reading():
+            index = self.__index("Place.location")
+            return self.__places(index.nearest(latitude, longitude, k))
+
+    def within(self, south, west, north, east):
+        """returns the places inside a box of latitudes and longitudes
+
+        The box crosses the antimeridian when west is greater than east.
+        """
+        with self.__reading():
+            index = self.__index("Place.location")
+            objects = FileStorage.__objects
+            return [objects[k]
+                    for k in index.within(south, west, north, east)]
+
+    def columnar(self, cls="Place"):
+        """returns the columns of the numeric attributes of cls
+
+        The ColumnIndex computes means and histograms in passes over
+        whole columns. It is a copy of the columns as they are now, so
+        threads changing the objects meanwhile leave it as it is; call
+        columnar() again to see their changes.
+        """
+        with self.__reading():
+            return self.__columns(cls).copy()
+
+    def __columns(self, cls):
+        """Returns the ColumnIndex of cls, up to date with the objects"""
+        if not isinstance(cls, str):
+            cls = cls.__name__
+        columns = self.__index("{}.columns".format(cls))
+        if columns is None:
+            raise ValueError("{} has no numeric attributes".format(cls))
+        return columns
+
+    def aggregate(self, cls, group_by=None, metrics=None):
+        """returns metrics over the objects of cls, by value of group_by
+
+        Args:
+            - cls: class or class name of the objects
+            - group_by: reference attribute such as city_id, None to
+              aggregate every object together
+            - metrics: dict of names to "function(attribute)" or
+              (function, attribute); the functions are count, sum, avg,
+              min, max, median and percentiles such as p90. Defaults to
+              {"count": "count()"}
+        The metrics are computed over the columns of cls. With group_by,
+        a dict of each value to its metrics is returned.
+        """
+        metrics = parse_metrics(metrics or {"count": "count()"})
+        with self.__reading():
+            return self.__columns(cls).aggregate(metrics, group_by)
+
+    def with_amenities(self, amenity_ids):
+        """returns the places offering every amenity in amenity_ids"""
+        with self.__reading():
+            index = self.__index("Place.amenity_ids")
+            objects = FileStorage.__objects
+            return [objects[k] for k in index.having(amenity_ids)]
+
+    def search(self, cls, text, limit=None):
+        """returns the objects of cls whose free text best matches text
+
+        The objects are ranked by BM25 over the words of text.
+        """
+        if not isinstance(cls, str):
+            cls = cls.__name__
+        if cls not in self.texts():
+            raise ValueError("{} has no text to search".format(cls))
+        with self.__reading():
+            index = self.__index("{}.{}".format(cls, self.texts()[cls]))
+            return self.__places(index.search(text, limit))
+
+    def __places(self, found):
+        """Returns the objects of the (distance or score, key) pairs"""
+        objects = FileStorage.__objects
+        return [objects[k] for _, k in found]
+
+    def query(self, cls, where=None, order_by=None, limit=None, offset=0):
+        """returns the objects of cls matching where, in order
+
+        Args:
+            - cls: class or class name of the objects
+            - where: dict of attribute to value, (operator, value)
+              tuple or list of such tuples, all of which must match;
+              operators are ==, !=, <, <=, >, >=, in and contains
+            - order_by: attribute to sort on, "-attribute" for
+              descending order
+            - limit: maximum number of objects to return
+            - offset: number of matching objects to skip
+        """
+        query = self.__query(cls, where, order_by, limit, offset)
+        with self.__reading():
+            plan, keys = self.__plan(query)
+            objects = FileStorage.__objects
+            return query.run(objects[k] for k in keys if k in objects)
+
+    def explain(self, cls, where=None, order_by=None, limit=None, offset=0):
+        """returns the plan query() would follow for the same arguments"""
+        query = self.__query(cls, where, order_by, limit, offset)
+        with self.__reading():
+            return self.__plan(query)[0]
+
+    def __query(self, cls, where, order_by, limit, offset):
+        """Returns the Query built from the arguments of query()"""
+        if not isinstance(cls, str):
+            cls = cls.__name__
+        return Query(cls, where, order_by, limit, offset)
+
+    def __plan(self, query):
+        """Returns the plan of query and the keys it starts from
+
+        The index of each attribute in the conditions is asked for the
+        keys passing the tests on that attribute; the smallest answer
+        wins over the scan of the whole class partition.
+        """
+        keys = self.__partition(query.classname)
+        plan = {"class": query.classname,
+                "access": "scan",
+                "index": None,
+                "condition": None,
+                "rows": len(keys)}
+        tests = {}
+        for attribute, op, value in query.conditions:
+            tests.setdefault(attribute, []).append((op, value))
+        for attribute, attribute_tests in tests.items():
+            name = "{}.{}".format(query.classname, attribute)
+            index = self.__index(name)
+            if index is None:
+                continue
+            found = index.lookup(attribute_tests)
+            if found is not None and len(found) < plan["rows"]:
+                keys = found
+                plan.update(access="index", index=name,
+                            condition=attribute_tests, rows=len(found))
+        plan.update(filter=query.conditions, order_by=query.order_by,
+                    offset=query.offset, limit=query.limit)
+        return plan, keys
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """groups the changes of a with block into a single save
+
+        Inside the block save() and flush() write nothing, and other
+        threads wait to change the objects. The changes are saved
+        once when the block ends. If it raises, the objects added or
+        deleted are put back and the attributes of those changed are
+        restored. A transaction started inside another joins it.
+        """
+        with FileStorage.__lock:
+            if FileStorage.__transaction is not None:
+                yield self
+                return
+            self.__sync()
+            images = FileStorage.__transaction = {}
+            FileStorage.__transaction_thread = threading.get_ident()
+            dirty = set(FileStorage.__dirty)
+            deleted = set(FileStorage.__deleted)
+            try:
+                yield self
+            except BaseException:
+                FileStorage.__transaction = None
+                self.__rollback(images, dirty, deleted)
+                raise
+            finally:
+                FileStorage.__transaction = None
+                FileStorage.__transaction_thread = None
+            self.save()
+
+    def __in_transaction(self):
+        """Tells whether this thread runs a transaction"""
+        return FileStorage.__transaction is not None and \
+            FileStorage.__transaction_thread == threading.get_ident()
+
+    def __record(self, key):
+        """Keeps what key held before its first change in the
+        transaction: None, or the object, its attributes and text"""
+        images = FileStorage.__transaction
+        if images is None or key in images:
+            return
+        value = dict.get(FileStorage.__objects, key)
+        if value is None:
+            images[key] = None
+        else:
+            images[key] = (value, None if type(value) is Stub
+                           else dict(value.__dict__),
+                           FileStorage.__fragments.get(key))
+
+    def __rollback(self, images, dirty, deleted):
+        """Puts back the objects as images recorded them"""
+        objects = FileStorage.__objects
+        partitions = FileStorage.__partitions
+        for key, image in images.items():
+            if image is None:
+                if objects.pop(key, None) is not None:
+                    FileStorage.__fragments.pop(key, None)
+                    if partitions is not None:
+                        partitions.remove(key)
+                    if FileStorage.__map is not None:
+                        FileStorage.__map = FileStorage.__map.discard(key)
+            else:
+                value, attributes, fragment = image
+                if attributes is not None:
+                    value.__dict__.clear()
+                    value.__dict__.update(attributes)
+                if partitions is not None and key not in objects:
+                    partitions.add(key)
+                dict.__setitem__(objects, key, value)
+                if fragment is not None:
+                    FileStorage.__fragments[key] = fragment
+                if FileStorage.__map is not None:
+                    FileStorage.__map = FileStorage.__map.set(key, value)
+            self.__stale(key.partition(".")[0])
+            self.__unindex(key)
+        FileStorage.__dirty = dirty
+        FileStorage.__deleted = deleted
 
     def save(self):
-        """ serializes __objects to the JSON file (path: __file_path)"""
-        with open(FileStorage.__file_path, "w", encoding="utf-8") as f:
-            d = {k: v.to_dict() for k, v in FileStorage.__objects.items()}
-            json.dump(d, f)
+        """ serializes __objects to the JSON file (path: __file_path)
+
+        With flush_delay set, the write is left to the background
+        writer thread; use flush() to write at once. In a transaction
+        the write waits for the transaction to end.
+        """
+        if self.__in_transaction():
+            return
+        if self.flush_delay is None:
+            self.flush()
+            return
+        with self.__wakeup:
+            self.__requests += 1
+            if self.__since is None:
+                self.__since = time.monotonic()
+            if self.__writer is None or not self.__writer.is_alive():
+                if self.__writer is None:
+                    atexit.register(self.__flush_at_exit)
+                self.__writer = threading.Thread(
+                    target=self.__write_behind, name="FileStorage writer",
+                    daemon=True)
+                self.__writer.start()
+            self.__wakeup.notify()
+
+    def __write_behind(self):
+        """Runs the background writer: waits for save() requests and
+        flushes them together
+
+        A flush that fails is logged and tried again flush_delay later,
+        with whatever was saved meanwhile.
+        """
+        while True:
+            with self.__wakeup:
+                while not self.__requests:
+                    self.__wakeup.wait()
+                while self.__requests and \
+                        (self.flush_every is None or
+                         self.__requests < self.flush_every):
+                    left = self.__since + self.flush_delay - time.monotonic()
+                    if left <= 0:
+                        break
+                    self.__wakeup.wait(left)
+                if not self.__requests:
+                    continue
+            try:
+                self.flush()
+            except Exception:
+                logging.getLogger(__name__).exception(
+                    "background write of %s failed", FileStorage.__file_path)
+                with self.__wakeup:
+                    self.__requests += 1
+                    if self.__since is None:
+                        self.__since = time.monotonic()
+
+    def __flush_at_exit(self):
+        """Writes what the background writer did not write yet"""
+        with FileStorage.__lock:
+            if self.__requests:
+                self.flush()
+
+    def flush(self):
+        """writes the changes made since the last write to disk
+
+        In log mode, with fsync "always", callers flushing at the same
+        time share a single fsync of the log.
+        """
+        if self.__in_transaction():
+            return
+        with FileStorage.__lock:
+            with self.__wakeup:
+                self.__requests = 0
+                self.__since = None
+            self.__sync()
+            if not self.journal:
+                self.compact()
+                return
+            records = []
+            for key in FileStorage.__dirty:
+                obj = FileStorage.__objects.get(key)
+                if obj is not None:
+                    records.append(json.dumps(
+                        {"op": "set", "key": key, "value": obj.to_dict()}))
+                    FileStorage.__fragments.pop(key, None)
+            for key in FileStorage.__deleted:
+                records.append(json.dumps({"op": "del", "key": key}))
+            FileStorage.__dirty = set()
+            FileStorage.__deleted = set()
+            if not records:
+                return
+            with open(self.log_path(), "ab+") as f:
+                self.__mend_log(f)
+                f.write("".join(r + "\n" for r in records).encode("utf-8"))
+            FileStorage.__written += 1
+            written = FileStorage.__written
+            FileStorage.__log_records += len(records)
+            if FileStorage.__log_records >= self.compact_every:
+                self.compact()
+        if self.fsync == "always":
+            self.__fsync_log(written)
+        elif self.fsync == "everysec" and self.__syncer is None:
+            self.__syncer = threading.Thread(
+                target=self.__fsync_every_second, name="FileStorage fsync",
+                daemon=True)
+            self.__syncer.start()
+
+    def __fsync_log(self, written):
+        """Makes the log durable up to the append numbered written
+
+        The caller holding the sync lock fsyncs every append made so
+        far, so those waiting behind it usually find their own append
+        already synced.
+        """
+        with FileStorage.__sync_lock:
+            if FileStorage.__synced >= written:
+                return
+            target = FileStorage.__written
+            try:
+                fd = os.open(self.log_path(), os.O_RDONLY)
+            except FileNotFoundError:
+                pass  # compacted into a synced snapshot
+            else:
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+            FileStorage.__synced = max(FileStorage.__synced, target)
+
+    def __fsync_every_second(self):
+        """Runs the background fsync of the log for everysec"""
+        while True:
+            time.sleep(1)
+            if FileStorage.__synced < FileStorage.__written:
+                self.__fsync_log(FileStorage.__written)
+
+    async def asave(self):
+        """awaitable flush() run in the default executor
+
+        Callers arriving while a flush runs share the single flush that
+        follows it, so a burst of asave() writes at most twice.
+        """
+        loop = asyncio.get_running_loop()
+        task = self.__apending
+        if task is None or task.get_loop() is not loop:
+            task = self.__apending = loop.create_task(
+                self.__aflush(self.__arunning))
+        await asyncio.shield(task)
+
+    async def __aflush(self, previous):
+        """Runs flush() in the executor once previous is over"""
+        loop = asyncio.get_running_loop()
+        if previous is not None and previous.get_loop() is loop and \
+                not previous.done():
+            await asyncio.wait([previous])
+        self.__apending = None
+        self.__arunning = asyncio.current_task()
+        await loop.run_in_executor(None, self.flush)
+
+    async def aget(self, cls, id):
+        """returns the object of cls with id, or None, without blocking
+
+        Args:
+            - cls: class or class name of the object
+            - id: id of the object
+        """
+        if not isinstance(cls, str):
+            cls = cls.__name__
+        key = "{}.{}".format(cls, id)
+        return await asyncio.get_running_loop().run_in_executor(
+            None, FileStorage.__objects.get, key)
+
+    async def aiter(self, cls=None, batch=100):
+        """yields the objects, or the objects of cls, without blocking
+
+        Objects are read batch at a time in the executor, so that lazy
+        objects are decoded off the event loop.
+        """
+        loop = asyncio.get_running_loop()
+        objects = FileStorage.__objects
+        keys = list(objects if cls is None else self.__partition(cls))
+        for i in range(0, len(keys), batch):
+            found = await loop.run_in_executor(
+                None, lambda keys: [objects.get(k) for k in keys],
+                keys[i:i + batch])
+            for obj in found:
+                if obj is not None:
+                    yield obj
+
+    async def areload(self):
+        """awaitable reload() run in the default executor"""
+        await asyncio.get_running_loop().run_in_executor(None, self.reload)
+
+    def compact(self):
+        """writes every object to the JSON file and empties the log
+
+        Objects that did not change since they were last written reuse
+        their cached JSON text, so only dirty objects go through
+        to_dict() and json.dumps(). A background save in progress is
+        waited for first, so that it cannot replace the newer file.
+
+        In shared mode the changes written meanwhile by other processes
+        are merged in first. Objects changed both here and there keep
+        the other version: ConflictError is raised with their keys
+        once the rest is written.
+        """
+        conflicts = []
+        with FileStorage.__lock:
+            self.__reap(wait=True)
+            self.__sync()
+            with self.__file_lock(exclusive=True):
+                if self.shared:
+                    conflicts, versions, generation = self.__merge()
+                self.__snapshot()
+                if self.shared:
+                    self.__write_versions(versions, generation)
+            FileStorage.__stale_shards = set()
+            FileStorage.__dirty = set()
+            FileStorage.__deleted = set()
+            FileStorage.__log_records = 0
+            FileStorage.__last_save = time.time()
+            if self.fsync != "no":
+                FileStorage.__synced = FileStorage.__written
+            if os.path.isfile(self.log_path()):
+                os.remove(self.log_path())
+        if conflicts:
+            raise ConflictError(conflicts)
+
+    def __file_lock(self, exclusive):
+        """Returns a context holding the lock file in shared mode"""
+        if not self.shared:
+            return contextlib.nullcontext()
+        return FileLock(self.lock_path(), exclusive)
+
+    def __merge(self):
+        """Brings in the objects other processes wrote since the last
+        sync, returns the keys in conflict and the versions read
+
+        A key is in conflict when it changed here while its version on
+        disk moved past the one this process last saw. Objects in the
+        files without a saved version, written before shared mode, are
+        at version 0, and objects missing from the files were deleted.
+        """
+        generation, versions = self.__read_versions()
+        if generation == FileStorage.__generation:
+            return [], versions, generation
+        found = {}
+        for entries in self.__load(self.__paths()):
+            for k, obj, fragment in entries:
+                found[k] = (obj, fragment)
+        versions = {k: versions.get(k, 0) for k in found}
+        mine = FileStorage.__versions
+        dirty = FileStorage.__dirty
+        deleted = FileStorage.__deleted
+        conflicts = [k for k in dirty if versions.get(k) != mine.get(k)]
+        conflicts += [k for k in deleted if versions.get(k) is not None
+                      and versions.get(k) != mine.get(k)]
+        changed = (dirty | deleted).difference(conflicts)
+        incoming = [k for k in set(versions).union(mine)
+                    if versions.get(k) != mine.get(k) and k not in changed]
+        objects = FileStorage.__objects
+        for k in incoming:
+            obj, fragment = found.get(k, (None, None))
+            if obj is None and k in objects:
+                self.delete(objects[k])
+            elif obj is not None:
+                self.new(obj)
+            FileStorage.__dirty.discard(k)
+            FileStorage.__deleted.discard(k)
+            FileStorage.__fragments.pop(k, None)
+            if fragment is not None:
+                FileStorage.__fragments[k] = fragment
+            if k in versions:
+                mine[k] = versions[k]
+            else:
+                mine.pop(k, None)
+        return conflicts, versions, generation
+
+    def __write_versions(self, versions, generation):
+        """Bumps the versions of the objects written by this process
+        and saves the versions of every object next to the files
+
+        Objects without a version yet get version 0, so that other
+        processes can tell their deletion from their absence.
+        """
+        mine = FileStorage.__versions
+        for k in FileStorage.__dirty:
+            mine[k] = versions.get(k, 0) + 1
+        FileStorage.__versions = {k: mine.get(k, versions.get(k, 0))
+                                  for k in FileStorage.__objects}
+        FileStorage.__generation = generation + 1
+        tmp = self.version_path() + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"generation": FileStorage.__generation,
+                       "versions": FileStorage.__versions}, f)
+        os.replace(tmp, self.version_path())
+
+    def __read_versions(self):
+        """Returns the generation and versions saved next to the files"""
+        try:
+            with open(self.version_path(), "r", encoding="utf-8") as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            return 0, {}
+        return saved["generation"], saved["versions"]
+
+    def __snapshot(self):
+        """Serializes the dirty objects and writes the JSON file"""
+        objects = FileStorage.__objects
+        fragments = FileStorage.__fragments
+        dirty = FileStorage.__dirty
+        if self.codec.name == "json":
+            for k, v in dict.items(objects):
+                if type(v) is not Stub and (k in dirty or
+                                            k not in fragments):
+                    fragments[k] = json.dumps(v.to_dict())
+        if self.sharded:
+            self.__write_shards()
+        else:
+            self.__write(FileStorage.__file_path, objects)
+
+    def bgsave(self):
+        """writes the JSON file from a forked child process
+
+        The child serializes the copy-on-write image of the objects as
+        they were at the fork, while this process goes on serving
+        requests. In log mode the log is flushed before the fork, and
+        the part of it the snapshot covers is dropped once the child
+        succeeds. Returns the pid of the child, or None if the platform
+        cannot fork and the file was written in the foreground.
+        """
+        if self.lazy:
+            raise ValueError("lazy objects are read from the file that "
+                             "a background save would replace")
+        if self.shared:
+            raise ValueError("shared storage merges on every write, "
+                             "which a background save cannot do")
+        if not hasattr(os, "fork"):
+            self.compact()
+            return None
+        with FileStorage.__lock:
+            self.__reap()
+            if FileStorage.__bgsave is not None:
+                raise RuntimeError("a background save is in progress")
+            self.__sync()
+            log_size = 0
+            if self.journal:
+                self.flush()
+                if os.path.isfile(self.log_path()):
+                    log_size = os.path.getsize(self.log_path())
+            pid = os.fork()
+            if pid == 0:
+                status = 1
+                try:
+                    self.__snapshot()
+                    status = 0
+                finally:
+                    os._exit(status)
+            FileStorage.__bgsave = {"pid": pid, "started": time.time(),
+                                    "log_size": log_size,
+                                    "log_records": FileStorage.__log_records}
+        return pid
+
+    def bgsave_status(self):
+        """returns the state of the background save
+
+        The dict holds in_progress, the pid and start time of the
+        running child, the time of the last successful write, and
+        whether the last background save was "ok" or "err".
+        """
+        with FileStorage.__lock:
+            self.__reap()
+            job = FileStorage.__bgsave or {}
+            return {"in_progress": bool(job),
+                    "pid": job.get("pid"),
+                    "started": job.get("started"),
+                    "last_save": FileStorage.__last_save,
+                    "last_status": FileStorage.__bgsave_status}
+
+    def __reap(self, wait=False):
+        """Collects the background save if it is over, or waits for it"""
+        job = FileStorage.__bgsave
+        if job is None:
+            return
+        try:
+            pid, status = os.waitpid(job["pid"], 0 if wait else os.WNOHANG)
+        except ChildProcessError:
+            pid, status = job["pid"], 1
+        if pid == 0:
+            return
+        FileStorage.__bgsave = None
+        if os.waitstatus_to_exitcode(status) != 0:
+            FileStorage.__bgsave_status = "err"
+            return
+        FileStorage.__bgsave_status = "ok"
+        FileStorage.__last_save = job["started"]
+        if job["log_size"]:
+            self.__trim_log(job["log_size"], job["log_records"])
+
+    def __mend_log(self, f):
+        """Makes the log open as f end with a newline
+
+        A crash can leave the last record without its newline. If the
+        record is whole it gets its newline, otherwise it is cut off,
+        so that the next append starts a line of its own.
+        """
+        end = f.seek(0, os.SEEK_END)
+        if not end:
+            return
+        f.seek(end - 1)
+        if f.read(1) == b"\n":
+            return
+        start = end
+        while start:
+            f.seek(max(0, start - 4096))
+            chunk = f.read(start - max(0, start - 4096))
+            newline = chunk.rfind(b"\n")
+            start -= len(chunk)
+            if newline >= 0:
+                start += newline + 1
+                break
+        f.seek(start)
+        try:
+            json.loads(f.read())
+        except ValueError:
+            f.truncate(start)
+        else:
+            f.seek(0, os.SEEK_END)
+            f.write(b"\n")
+
+    def __trim_log(self, size, records):
+        """Drops the first size bytes of the log, made of records"""
+        path = self.log_path()
+        tmp = path + ".tmp"
+        with open(path, "rb") as f, open(tmp, "wb") as out:
+            f.seek(size)
+            out.write(f.read())
+        os.replace(tmp, path)
+        FileStorage.__log_records = max(0, FileStorage.__log_records -
+                                        records)
+
+    def __sync(self):
+        """Forgets the change tracking if __objects was replaced"""
+        if FileStorage.__tracked is not FileStorage.__objects:
+            FileStorage.__tracked = FileStorage.__objects
+            FileStorage.__map = None
+            FileStorage.__dirty = set()
+            FileStorage.__deleted = set()
+            FileStorage.__fragments = {}
+            FileStorage.__stale_shards = None
+            FileStorage.__partitions = None
+            FileStorage.__indexes = {}
+            FileStorage.__unindexed = {}
+            FileStorage.__versions = {}
+            FileStorage.__generation = 0
+
+    def __stale(self, classname):
+        """Flags the shard of classname as out of date"""
+        if FileStorage.__stale_shards is not None:
+            FileStorage.__stale_shards.add(classname)
+
+    def __write(self, path, keys):
+        """Writes the objects under keys to path with the store codec
+
+        The objects go to a temporary file, compressed as they are
+        written if compression is set, which then replaces path. JSON
+        files reuse the cached text of the objects; other codecs
+        serialize every object again. In lazy mode the byte offset of
+        every object is saved to an index next to path, and the stubs
+        are moved to it.
+        """
+        objects = FileStorage.__objects
+        offsets = {}
+        stubs = []
+        files = {}
+        tmp = path + ".tmp"
+        try:
+            with open(tmp, "wb") as raw:
+                with compressor(raw, self.compression) as f:
+                    if self.codec.name == "json":
+                        self.codec.write(self.__texts(keys, stubs, files),
+                                         f, offsets)
+                    else:
+                        self.codec.dump(((k, objects[k].to_dict())
+                                         for k in keys), f)
+                if self.fsync != "no":
+                    raw.flush()
+                    os.fsync(raw.fileno())
+        finally:
+            for f in files.values():
+                f.close()
+        os.replace(tmp, path)
+        if self.fsync != "no":
+            self.__fsync_directory(path)
+        for k, stub in stubs:
+            stub.path = path
+            stub.offset, stub.length = offsets[k]
+        if self.lazy:
+            stat = os.stat(path)
+            with open(self.index_path(path), "w", encoding="utf-8") as f:
+                json.dump({"size": stat.st_size, "mtime": stat.st_mtime_ns,
+                           "offsets": offsets}, f)
+
+    def __texts(self, keys, stubs, files):
+        """Yields the key and cached JSON text of the objects under keys
+
+        Records the (key, Stub) read in stubs; files holds the files
+        stubs read.
+        """
+        objects = FileStorage.__objects
+        fragments = FileStorage.__fragments
+        for k in keys:
+            v = fragments.get(k) or dict.__getitem__(objects, k)
+            if type(v) is Stub:
+                stubs.append((k, v))
+                v = v.read(files)
+            yield k, v
+
+    def __fsync_directory(self, path):
+        """Makes the rename of path durable"""
+        try:
+            fd = os.open(os.path.dirname(path) or ".", os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass  # not supported on this platform
+        finally:
+            os.close(fd)
+
+    def __read_index(self, path):
+        """Returns the offsets saved for path, or None if out of date"""
+        try:
+            with open(self.index_path(path), "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return None
+        stat = os.stat(path)
+        if (index["size"], index["mtime"]) != (stat.st_size,
+                                               stat.st_mtime_ns):
+            return None
+        return index["offsets"]
+
+    def __hydrate(self, key, stub):
+        """Builds the object stored at stub"""
+        fragment = stub.read()
+        v = json.loads(fragment)
+        FileStorage.__fragments[key] = fragment
+        return self.classes()[v["__class__"]](**v)
+
+    def __write_shards(self):
+        """Rewrites the shard of every class that changed"""
+        stale = FileStorage.__stale_shards
+        if stale is None:
+            stale = self.classes()
+        objects = FileStorage.__objects
+        for classname in stale:
+            self.__write(self.shard_path(classname),
+                         [k for k in self.__partition(classname)
+                          if k in objects])
+
+    def index_path(self, path):
+        """Returns the path of the offset index of path"""
+        return path + ".idx"
+
+    def shard_path(self, classname):
+        """Returns the path of the shard holding classname"""
+        return os.path.join(os.path.dirname(FileStorage.__file_path),
+                            classname + ".json")
+
+    def lock_path(self):
+        """Returns the path of the lock file of shared mode"""
+        return FileStorage.__file_path + ".lock"
+
+    def version_path(self):
+        """Returns the path of the object versions of shared mode"""
+        return FileStorage.__file_path + ".ver"
+
+    def log_path(self):
+        """Returns the path of the append-only log"""
+        return FileStorage.__file_path + ".log"
 
     def classes(self):
         """Returns a dictionary of valid classes and their references"""
@@ -45,16 +1442,144 @@ class FileStorage:
                    "Review": Review}
         return classes
 
+    def __paths(self):
+        """Returns the paths of the existing JSON files
+
+        A sharded store without any shard reads the single file, which
+        its first save then splits into shards.
+        """
+        paths = []
+        if self.sharded:
+            paths = [self.shard_path(classname)
+                     for classname in self.classes()]
+            paths = [path for path in paths if os.path.isfile(path)]
+        if not paths and os.path.isfile(FileStorage.__file_path):
+            paths = [FileStorage.__file_path]
+        return paths
+
     def reload(self):
-        """Reloads the stored objects"""
-        if not os.path.isfile(FileStorage.__file_path):
+        """Reloads the stored objects, replaying the log on top
+
+        In shared mode the files are read under a shared lock along
+        with the versions of the objects.
+        """
+        with self.__file_lock(exclusive=False):
+            self.__reload()
+
+    def __reload(self):
+        """Reads the files and swaps in the objects"""
+        paths = self.__paths()
+        has_log = os.path.isfile(self.log_path())
+        if not paths and not has_log:
             return
-        with open(FileStorage.__file_path, "r", encoding="utf-8") as f:
-            obj_dict = json.load(f)
-            obj_dict = {k: self.classes()[v["__class__"]](**v)
-                        for k, v in obj_dict.items()}
-            # TODO: should this overwrite or insert?
+        obj_dict = LazyObjects(self.__hydrate) if self.lazy else {}
+        fragments = {}
+        eager = []
+        for path in paths:
+            offsets = self.__read_index(path) if self.lazy else None
+            if offsets is None:
+                eager.append(path)
+                continue
+            for k, (offset, length) in offsets.items():
+                obj_dict[k] = Stub(path, offset, length)
+        for entries in self.__load(eager):
+            for k, obj, fragment in entries:
+                obj_dict[k] = obj
+                if fragment is not None:
+                    fragments[k] = fragment
+        records = 0
+        if has_log:
+            records = self.__replay(obj_dict, fragments)
+        # TODO: should this overwrite or insert?
+        with FileStorage.__lock:
             FileStorage.__objects = obj_dict
+            self.__sync()
+            FileStorage.__fragments = fragments
+            if not self.sharded:
+                FileStorage.__stale_shards = None
+            elif paths == [FileStorage.__file_path]:
+                FileStorage.__stale_shards = set(self.classes())
+            else:
+                FileStorage.__stale_shards = set()
+            FileStorage.__log_records = records
+            if self.shared:
+                generation, versions = self.__read_versions()
+                FileStorage.__generation = generation
+                FileStorage.__versions = {k: versions.get(k, 0)
+                                          for k in obj_dict}
+
+    def __load(self, paths):
+        """Reads the files in paths, in parallel when there are several
+
+        The shards are decoded by a pool of processes. Child processes
+        never start a pool of their own, so importing models there
+        does not fork again.
+        """
+        codec = self.codec.name
+        workers = self.workers or os.cpu_count() or 1
+        workers = min(workers, len(paths))
+        if workers < 2 or multiprocessing.parent_process() is not None:
+            return [load_shard(path, codec) for path in paths]
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context(
+            "fork" if "fork" in methods else None)
+        with ProcessPoolExecutor(workers, mp_context=context) as pool:
+            return list(pool.map(load_shard, paths,
+                                 [codec] * len(paths)))
+
+    def __replay(self, obj_dict, fragments):
+        """Applies the log records to obj_dict, returns how many
+
+        An unreadable last record is a torn write and is cut off; an
+        unreadable record followed by others is an error.
+        """
+        records = 0
+        with open(self.log_path(), "rb+") as f:
+            self.__mend_log(f)
+            f.seek(0)
+            good = 0
+            for line in iter(f.readline, b""):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    if f.read(1):
+                        raise ValueError("corrupt record at byte {} of {}"
+                                         .format(good, self.log_path()))
+                    f.truncate(good)
+                    break
+                if record["op"] == "set":
+                    v = record["value"]
+                    obj_dict[record["key"]] = self.classes()[
+                        v["__class__"]](**v)
+                else:
+                    obj_dict.pop(record["key"], None)
+                fragments.pop(record["key"], None)
+                good += len(line)
+                records += 1
+        return records
+
+    def relations(self):
+        """Returns the id attributes of each class and the class they
+        reference"""
+        relations = {
+            "City":
+                {"state_id": "State"},
+            "Place":
+                {"city_id": "City",
+                 "user_id": "User"},
+            "Review":
+                {"place_id": "Place",
+                 "user_id": "User"}
+        }
+        return relations
+
+    def texts(self):
+        """Returns the free-text attribute of each class"""
+        texts = {
+            "Place": "description",
+            "Review": "text"
+        }
+        return texts
 
     def attributes(self):
         """Returns the valid attributes and their types for classname"""
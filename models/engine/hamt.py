@@ -0,0 +1,279 @@
+#!/usr/bin/python3
+"""Module for the HAMT class, a persistent hash array mapped trie."""
+from collections.abc import ItemsView, Mapping, ValuesView
+
+
+BITS = 5
+MASK = (1 << BITS) - 1
+HASH_BITS = 64
+
+
+class Bitmap:
+
+    """Node holding up to 32 entries, one per 5 bits of the hash
+
+    Entries are (key, value) tuples or child nodes, stored in the
+    order of their bit in bitmap.
+    """
+    __slots__ = ("bitmap", "items")
+
+    def __init__(self, bitmap, items):
+        """Initializes the node"""
+        self.bitmap = bitmap
+        self.items = items
+
+
+class Collision:
+
+    """Node holding the (key, value) tuples of keys of the same hash"""
+    __slots__ = ("items",)
+
+    def __init__(self, items):
+        """Initializes the node"""
+        self.items = items
+
+
+EMPTY = Bitmap(0, ())
+
+
+def hash64(key):
+    """Returns the hash of key as an unsigned 64 bit integer"""
+    return hash(key) & ((1 << HASH_BITS) - 1)
+
+
+def find(node, h, key):
+    """Returns the value under key, raises KeyError if it is missing"""
+    shift = 0
+    while type(node) is Bitmap:
+        bit = 1 << ((h >> shift) & MASK)
+        if not node.bitmap & bit:
+            raise KeyError(key)
+        item = node.items[(node.bitmap & (bit - 1)).bit_count()]
+        if type(item) is tuple:
+            if item[0] is key or item[0] == key:
+                return item[1]
+            raise KeyError(key)
+        node = item
+        shift += BITS
+    for k, v in node.items:
+        if k is key or k == key:
+            return v
+    raise KeyError(key)
+
+
+def pair(shift, h1, e1, h2, e2):
+    """Returns the node holding the entries e1 and e2"""
+    if shift >= HASH_BITS:
+        return Collision((e1, e2))
+    i1 = (h1 >> shift) & MASK
+    i2 = (h2 >> shift) & MASK
+    if i1 == i2:
+        return Bitmap(1 << i1, (pair(shift + BITS, h1, e1, h2, e2),))
+    if i1 > i2:
+        e1, e2 = e2, e1
+    return Bitmap(1 << i1 | 1 << i2, (e1, e2))
+
+
+def assoc(node, shift, h, key, value):
+    """Returns a copy of node with key set to value, and whether the
+    key is new"""
+    if type(node) is Collision:
+        for i, (k, v) in enumerate(node.items):
+            if k is key or k == key:
+                if v is value:
+                    return node, False
+                items = node.items[:i] + ((key, value),) + \
+                    node.items[i + 1:]
+                return Collision(items), False
+        return Collision(node.items + ((key, value),)), True
+    bit = 1 << ((h >> shift) & MASK)
+    i = (node.bitmap & (bit - 1)).bit_count()
+    if not node.bitmap & bit:
+        items = node.items[:i] + ((key, value),) + node.items[i:]
+        return Bitmap(node.bitmap | bit, items), True
+    item = node.items[i]
+    if type(item) is tuple:
+        if item[0] is key or item[0] == key:
+            if item[1] is value:
+                return node, False
+            child, grown = (key, value), False
+        else:
+            child, grown = pair(shift + BITS, hash64(item[0]), item,
+                                h, (key, value)), True
+    else:
+        child, grown = assoc(item, shift + BITS, h, key, value)
+        if child is item:
+            return node, False
+    items = node.items[:i] + (child,) + node.items[i + 1:]
+    return Bitmap(node.bitmap, items), grown
+
+
+def dissoc(node, shift, h, key):
+    """Returns a copy of node without key, raises KeyError if missing
+
+    A node left with a single (key, value) tuple is returned as that
+    tuple, for the parent to hold in its place; an emptied node is
+    returned as None.
+    """
+    if type(node) is Collision:
+        items = tuple(e for e in node.items if not (e[0] is key or
+                                                    e[0] == key))
+        if len(items) == len(node.items):
+            raise KeyError(key)
+        return items[0] if len(items) == 1 else Collision(items)
+    bit = 1 << ((h >> shift) & MASK)
+    if not node.bitmap & bit:
+        raise KeyError(key)
+    i = (node.bitmap & (bit - 1)).bit_count()
+    item = node.items[i]
+    if type(item) is tuple:
+        if not (item[0] is key or item[0] == key):
+            raise KeyError(key)
+        child = None
+    else:
+        child = dissoc(item, shift + BITS, h, key)
+    if child is None:
+        items = node.items[:i] + node.items[i + 1:]
+        if not items:
+            return None
+        if shift and len(items) == 1 and type(items[0]) is tuple:
+            return items[0]
+        return Bitmap(node.bitmap & ~bit, items)
+    if shift and len(node.items) == 1 and type(child) is tuple:
+        return child
+    return Bitmap(node.bitmap, node.items[:i] + (child,) +
+                  node.items[i + 1:])
+
+
+def build(entries, shift):
+    """Returns the node holding the (hash, key, value) triples of
+    entries, whose keys are all different"""
+    if shift >= HASH_BITS:
+        return Collision(tuple((k, v) for _, k, v in entries))
+    groups = {}
+    for entry in entries:
+        groups.setdefault((entry[0] >> shift) & MASK, []).append(entry)
+    bitmap = 0
+    items = []
+    for i in sorted(groups):
+        group = groups[i]
+        bitmap |= 1 << i
+        if len(group) == 1:
+            items.append(group[0][1:])
+        else:
+            items.append(build(group, shift + BITS))
+    return Bitmap(bitmap, tuple(items))
+
+
+def entries(node):
+    """Yields the (key, value) tuples under node"""
+    stack = [iter(node.items)]
+    while stack:
+        for item in stack[-1]:
+            if type(item) is tuple:
+                yield item
+            else:
+                stack.append(iter(item.items))
+                break
+        else:
+            stack.pop()
+
+
+class HAMTItems(ItemsView):
+
+    """View of the (key, value) pairs of a HAMT"""
+
+    def __iter__(self):
+        """Iterates over the pairs without looking keys up"""
+        return entries(self._mapping.root)
+
+
+class HAMTValues(ValuesView):
+
+    """View of the values of a HAMT"""
+
+    def __iter__(self):
+        """Iterates over the values without looking keys up"""
+        return (v for _, v in entries(self._mapping.root))
+
+
+class HAMT(Mapping):
+
+    """Immutable mapping whose copies with one key set or deleted
+    share all but O(log n) of their nodes with it
+
+    Every change returns a new map and leaves the old one as it was,
+    so a reference to a map is a snapshot that costs nothing to take.
+    """
+    __slots__ = ("root", "length")
+
+    def __init__(self, items=()):
+        """Initializes the map with the pairs of a mapping or iterable
+
+        Args:
+            - items: mapping or iterable of (key, value) pairs
+        """
+        d = dict(items)
+        self.root = build([(hash64(k), k, v) for k, v in d.items()], 0) \
+            if d else EMPTY
+        self.length = len(d)
+
+    @classmethod
+    def __make(cls, root, length):
+        """Returns the map of root without building anything"""
+        m = cls.__new__(cls)
+        m.root = root
+        m.length = length
+        return m
+
+    def __getitem__(self, key):
+        """Returns the value under key"""
+        return find(self.root, hash64(key), key)
+
+    def __contains__(self, key):
+        """Tells whether key is in the map"""
+        try:
+            find(self.root, hash64(key), key)
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        """Iterates over the keys"""
+        return (k for k, _ in entries(self.root))
+
+    def __len__(self):
+        """Returns the number of keys"""
+        return self.length
+
+    def __repr__(self):
+        """Returns the map as HAMT({key: value, ...})"""
+        return "HAMT({!r})".format(dict(self.items()))
+
+    def items(self):
+        """Returns a view of the (key, value) pairs"""
+        return HAMTItems(self)
+
+    def values(self):
+        """Returns a view of the values"""
+        return HAMTValues(self)
+
+    def set(self, key, value):
+        """Returns a copy of the map with key set to value"""
+        root, grown = assoc(self.root, 0, hash64(key), key, value)
+        if root is self.root:
+            return self
+        return self.__make(root, self.length + grown)
+
+    def delete(self, key):
+        """Returns a copy of the map without key, raises KeyError if
+        it is missing"""
+        root = dissoc(self.root, 0, hash64(key), key)
+        return self.__make(root or EMPTY, self.length - 1)
+
+    def discard(self, key):
+        """Returns a copy of the map without key if it is in it"""
+        try:
+            return self.delete(key)
+        except KeyError:
+            return self
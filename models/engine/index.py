@@ -0,0 +1,834 @@
+#!/usr/bin/python3
+"""Module for the indexes kept by FileStorage."""
+import bisect
+import math
+import re
+from array import array
+from collections import Counter
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+EARTH_RADIUS = 6371.0088
+
+
+def distance(lat1, lon1, lat2, lon2):
+    """Returns the great-circle distance in km between two points"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) *
+         math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(a)))
+
+
+def finite(value):
+    """Tells whether value is an int or float other than nan and inf"""
+    return isinstance(value, (int, float)) and \
+        not isinstance(value, bool) and math.isfinite(value)
+
+
+class ClassIndex:
+
+    """Keys of the stored objects partitioned by class name"""
+
+    def __init__(self, keys=()):
+        """Initializes the partitions with the given keys"""
+        self.partitions = {}
+        for key in keys:
+            self.add(key)
+
+    def add(self, key, obj=None):
+        """Adds key to the partition of its class"""
+        classname = key.partition(".")[0]
+        if classname not in self.partitions:
+            self.partitions[classname] = {}
+        self.partitions[classname][key] = None
+
+    def remove(self, key):
+        """Removes key from the partition of its class"""
+        self.partitions.get(key.partition(".")[0], {}).pop(key, None)
+
+    def get(self, classname):
+        """Returns the keys of classname in insertion order"""
+        return self.partitions.get(classname, {}).keys()
+
+
+class ForeignKeyIndex:
+
+    """Keys of the objects of a class by the value of an id attribute"""
+
+    def __init__(self, classname, attribute):
+        """Initializes an empty index of classname.attribute"""
+        self.classname = classname
+        self.attribute = attribute
+        self.keys = {}
+        self.values = {}
+
+    def add(self, key, obj):
+        """Indexes key under the value of obj's attribute"""
+        value = getattr(obj, self.attribute, None)
+        if not isinstance(value, str):
+            return
+        if value not in self.keys:
+            self.keys[value] = {}
+        self.keys[value][key] = None
+        self.values[key] = value
+
+    def remove(self, key):
+        """Removes key from the index"""
+        value = self.values.pop(key, None)
+        if value is not None:
+            keys = self.keys[value]
+            del keys[key]
+            if not keys:
+                del self.keys[value]
+
+    def get(self, value):
+        """Returns the keys whose attribute equals value"""
+        return self.keys.get(value, {}).keys()
+
+    def lookup(self, tests):
+        """Returns the keys passing one of the (operator, value) tests,
+        or None if no test can use the index"""
+        for op, value in tests:
+            if op == "==":
+                return self.get(value)
+            if op == "in":
+                return [k for v in dict.fromkeys(value) for k in self.get(v)]
+        return None
+
+
+def tokenize(text):
+    """Returns the lowercase words of text"""
+    return re.findall(r"\w+", text.lower())
+
+
+class MaxKey:
+
+    """Sentinel sorting after every key"""
+
+    def __lt__(self, other):
+        """Nothing is greater"""
+        return False
+
+    def __gt__(self, other):
+        """Everything is smaller"""
+        return True
+
+
+class RangeIndex:
+
+    """Keys of the objects of a class sorted by a numeric attribute
+
+    Entries added or removed are set aside and sorted in at the next
+    lookup, so that indexing many objects sorts once.
+    """
+    settle_removed = 8
+
+    def __init__(self, classname, attribute):
+        """Initializes an empty index of classname.attribute"""
+        self.classname = classname
+        self.attribute = attribute
+        self.entries = []
+        self.values = {}
+        self.added = []
+        self.removed = set()
+
+    def add(self, key, obj):
+        """Indexes key under the value of obj's attribute"""
+        value = getattr(obj, self.attribute, None)
+        if not finite(value):
+            return
+        self.values[key] = value
+        entry = (value, key)
+        if entry in self.removed:
+            self.removed.discard(entry)
+        else:
+            self.added.append(entry)
+
+    def remove(self, key):
+        """Removes key from the index"""
+        if key in self.values:
+            self.removed.add((self.values.pop(key), key))
+
+    def settle(self):
+        """Sorts the entries set aside into entries"""
+        if self.removed:
+            if len(self.removed) <= self.settle_removed:
+                for entry in self.removed:
+                    i = bisect.bisect_left(self.entries, entry)
+                    if i < len(self.entries) and self.entries[i] == entry:
+                        del self.entries[i]
+                    else:
+                        self.added.remove(entry)
+            else:
+                self.entries = [e for e in self.entries
+                                if e not in self.removed]
+                self.added = [e for e in self.added if e not in self.removed]
+            self.removed = set()
+        if self.added:
+            self.entries += self.added
+            self.entries.sort()
+            self.added = []
+
+    def range(self, low=None, high=None, low_open=False, high_open=False):
+        """Returns the keys whose value lies between low and high
+
+        Args:
+            - low, high: bounds, None for no bound
+            - low_open, high_open: whether the bounds are excluded
+        """
+        self.settle()
+        start, stop = 0, len(self.entries)
+        if low is not None:
+            start = bisect.bisect_left(
+                self.entries, (low, MaxKey()) if low_open else (low,))
+        if high is not None:
+            stop = bisect.bisect_left(
+                self.entries, (high,) if high_open else (high, MaxKey()))
+        return [key for _, key in self.entries[start:stop]]
+
+    def lookup(self, tests):
+        """Returns the keys passing every comparison in the
+        (operator, value) tests, or None if no test can use the index"""
+        bounds = {}
+        for op, value in tests:
+            if op == "in":
+                if not isinstance(value, (list, tuple, set, frozenset)) or \
+                        not all(finite(v) for v in value):
+                    return None
+                return [k for v in dict.fromkeys(value)
+                        for k in self.range(v, v)]
+            if op in ("==", "<", "<=", ">", ">=") and not finite(value):
+                return None
+            if op in ("==", ">", ">="):
+                low = bounds.get("low")
+                if low is None or value > low[0] or \
+                        (value == low[0] and op == ">"):
+                    bounds["low"] = (value, op == ">")
+            if op in ("==", "<", "<="):
+                high = bounds.get("high")
+                if high is None or value < high[0] or \
+                        (value == high[0] and op == "<"):
+                    bounds["high"] = (value, op == "<")
+        if not bounds:
+            return None
+        low, low_open = bounds.get("low", (None, False))
+        high, high_open = bounds.get("high", (None, False))
+        return self.range(low, high, low_open, high_open)
+
+
+class GeoIndex:
+
+    """Keys of the objects of a class on a grid of latitude/longitude"""
+
+    def __init__(self, classname, latitude="latitude",
+                 longitude="longitude", cell=0.1):
+        """Initializes an empty index
+
+        Args:
+            - classname: name of the indexed class
+            - latitude, longitude: attributes holding the coordinates
+            - cell: size of the grid cells in degrees
+        """
+        self.classname = classname
+        self.latitude = latitude
+        self.longitude = longitude
+        self.cell = cell
+        self.columns = math.ceil(360 / cell)
+        self.cells = {}
+        self.points = {}
+
+    def position(self, lat, lon):
+        """Returns the (row, column) of the cell holding lat, lon"""
+        return (math.floor((lat + 90) / self.cell),
+                math.floor(((lon + 180) % 360) / self.cell) % self.columns)
+
+    def add(self, key, obj):
+        """Indexes key at the coordinates of obj"""
+        lat = getattr(obj, self.latitude, None)
+        lon = getattr(obj, self.longitude, None)
+        if not finite(lat) or not finite(lon) or not -90 <= lat <= 90:
+            return
+        cell = self.position(lat, lon)
+        if cell not in self.cells:
+            self.cells[cell] = {}
+        self.cells[cell][key] = None
+        self.points[key] = (lat, lon)
+
+    def remove(self, key):
+        """Removes key from the index"""
+        point = self.points.pop(key, None)
+        if point is not None:
+            cell = self.position(*point)
+            del self.cells[cell][key]
+            if not self.cells[cell]:
+                del self.cells[cell]
+
+    def within(self, south, west, north, east):
+        """Returns the keys inside the box, which may cross the
+        antimeridian when west > east"""
+        rows = range(self.position(south, 0)[0],
+                     self.position(north, 0)[0] + 1)
+        if east - west >= 360:
+            columns = range(self.columns)
+        else:
+            first = self.position(0, west)[1]
+            last = self.position(0, east)[1]
+            if first <= last:
+                columns = range(first, last + 1)
+            else:
+                columns = list(range(first, self.columns)) + \
+                    list(range(last + 1))
+        if len(rows) * len(columns) > len(self.cells):
+            columns = set(columns)
+            cells = [c for c in self.cells
+                     if c[0] in rows and c[1] in columns]
+        else:
+            cells = [(r, c) for r in rows for c in columns
+                     if (r, c) in self.cells]
+        keys = []
+        for cell in cells:
+            for key in self.cells[cell]:
+                lat, lon = self.points[key]
+                if not south <= lat <= north:
+                    continue
+                if east - west >= 360 or (west <= lon <= east if
+                                          west <= east else
+                                          lon >= west or lon <= east):
+                    keys.append(key)
+        return keys
+
+    def nearby(self, lat, lon, radius):
+        """Returns the (distance, key) within radius km, nearest first
+
+        The box searched spans the widest longitude the circle reaches,
+        or every longitude when the circle gets close to a pole.
+        """
+        angle = radius / EARTH_RADIUS
+        dlat = math.degrees(angle)
+        south, north = lat - dlat, lat + dlat
+        west, east = -180, 180
+        if -90 < south and north < 90 and \
+                math.sin(angle) < math.cos(math.radians(lat)):
+            dlon = math.degrees(math.asin(
+                math.sin(angle) / math.cos(math.radians(lat))))
+            west = (lon - dlon + 180) % 360 - 180
+            east = (lon + dlon + 180) % 360 - 180
+        found = []
+        for key in self.within(max(south, -90), west, min(north, 90), east):
+            d = distance(lat, lon, *self.points[key])
+            if d <= radius:
+                found.append((d, key))
+        found.sort()
+        return found
+
+    def nearest(self, lat, lon, k=1):
+        """Returns the k (distance, key) nearest to lat, lon
+
+        The search radius doubles until it holds k points; any point
+        nearer than the k-th found lies inside that radius.
+        """
+        radius = self.cell * math.pi * EARTH_RADIUS / 180
+        while True:
+            found = self.nearby(lat, lon, radius)
+            if len(found) >= k or radius > math.pi * EARTH_RADIUS:
+                return found[:k]
+            radius *= 2
+
+
+class TextIndex:
+
+    """Inverted index of the words of a text attribute, ranked by BM25"""
+
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self, classname, attribute):
+        """Initializes an empty index of classname.attribute"""
+        self.classname = classname
+        self.attribute = attribute
+        self.postings = {}
+        self.terms = {}
+        self.lengths = {}
+        self.total = 0
+
+    def add(self, key, obj):
+        """Indexes the words of obj's attribute under key"""
+        text = getattr(obj, self.attribute, None)
+        if not isinstance(text, str) or not text:
+            return
+        terms = Counter(tokenize(text))
+        for term, count in terms.items():
+            if term not in self.postings:
+                self.postings[term] = {}
+            self.postings[term][key] = count
+        self.terms[key] = list(terms)
+        self.lengths[key] = sum(terms.values())
+        self.total += self.lengths[key]
+
+    def remove(self, key):
+        """Removes the words of key from the index"""
+        terms = self.terms.pop(key, None)
+        if terms is None:
+            return
+        for term in terms:
+            postings = self.postings[term]
+            del postings[key]
+            if not postings:
+                del self.postings[term]
+        self.total -= self.lengths.pop(key)
+
+    def search(self, text, limit=None):
+        """Returns the (score, key) matching the words of text, best
+        first"""
+        n = len(self.terms)
+        if not n:
+            return []
+        average = self.total / n
+        scores = {}
+        for term in set(tokenize(text)):
+            postings = self.postings.get(term, {})
+            idf = math.log(1 + (n - len(postings) + 0.5) /
+                           (len(postings) + 0.5))
+            for key, count in postings.items():
+                norm = self.k1 * (1 - self.b + self.b *
+                                  self.lengths[key] / average)
+                scores[key] = scores.get(key, 0) + \
+                    idf * count * (self.k1 + 1) / (count + norm)
+        ranked = sorted(((score, key) for key, score in scores.items()),
+                        key=lambda item: (-item[0], item[1]))
+        return ranked[:limit]
+
+    def lookup(self, tests):
+        """Answers no test; the words serve search()"""
+        return None
+
+
+def bitset(slots):
+    """Returns the integer whose bits are set at slots"""
+    if not slots:
+        return 0
+    bits = bytearray(max(slots) // 8 + 1)
+    for slot in slots:
+        bits[slot >> 3] |= 1 << (slot & 7)
+    return int.from_bytes(bits, "little")
+
+
+class BitmapIndex:
+
+    """Bitsets of the objects of a class holding each value of a list
+    attribute
+
+    The slots set or cleared are set aside by value and merged into
+    the bitsets at the next lookup, each bitset once, so that indexing
+    many objects does not rebuild a growing integer per object.
+    """
+
+    def __init__(self, classname, attribute):
+        """Initializes an empty index of classname.attribute"""
+        self.classname = classname
+        self.attribute = attribute
+        self.slots = {}
+        self.keys = []
+        self.free = []
+        self.values = {}
+        self.bitmaps = {}
+        self.added = {}
+        self.removed = {}
+
+    def add(self, key, obj):
+        """Sets the bit of key in the bitset of each value of obj's list"""
+        values = getattr(obj, self.attribute, None)
+        if not isinstance(values, list) or not values:
+            return
+        if self.free:
+            slot = self.free.pop()
+            self.keys[slot] = key
+        else:
+            slot = len(self.keys)
+            self.keys.append(key)
+        self.slots[key] = slot
+        self.values[key] = set(values)
+        for value in self.values[key]:
+            self.added.setdefault(value, set()).add(slot)
+
+    def remove(self, key):
+        """Clears the bits of key"""
+        slot = self.slots.pop(key, None)
+        if slot is None:
+            return
+        for value in self.values.pop(key):
+            added = self.added.get(value)
+            if added and slot in added:
+                added.discard(slot)
+            else:
+                self.removed.setdefault(value, set()).add(slot)
+        self.keys[slot] = None
+        self.free.append(slot)
+
+    def settle(self):
+        """Merges the slots set aside into the bitsets"""
+        for value, slots in self.removed.items():
+            bitmap = self.bitmaps.get(value, 0) & ~bitset(slots)
+            if bitmap:
+                self.bitmaps[value] = bitmap
+            else:
+                self.bitmaps.pop(value, None)
+        for value, slots in self.added.items():
+            if slots:
+                self.bitmaps[value] = self.bitmaps.get(value, 0) | \
+                    bitset(slots)
+        self.added = {}
+        self.removed = {}
+
+    def having(self, values):
+        """Returns the keys whose list holds every one of values"""
+        self.settle()
+        bitmap = None
+        for value in values:
+            bitmap = self.bitmaps.get(value, 0) if bitmap is None \
+                else bitmap & self.bitmaps.get(value, 0)
+            if not bitmap:
+                return []
+        if bitmap is None:
+            return []
+        bits = bin(bitmap)[:1:-1]
+        keys = []
+        slot = bits.find("1")
+        while slot != -1:
+            keys.append(self.keys[slot])
+            slot = bits.find("1", slot + 1)
+        return keys
+
+    def lookup(self, tests):
+        """Returns the keys passing every "contains" test, or None if
+        there is none"""
+        values = [value for op, value in tests if op == "contains"]
+        if not values:
+            return None
+        return self.having(values)
+
+
+METRIC = re.compile(r"^\s*(\w+)\(\s*(\w*)\s*\)\s*$")
+FUNCTIONS = ("count", "sum", "avg", "min", "max")
+
+
+def parse_metrics(metrics):
+    """Returns the list of (name, function, attribute) of metrics
+
+    Args:
+        - metrics: dict of names to "function(attribute)" strings or
+          (function, attribute) tuples; the functions are count, sum,
+          avg, min, max, median and percentiles such as p90, and
+          count() takes no attribute
+    """
+    parsed = []
+    for name, spec in metrics.items():
+        if isinstance(spec, str):
+            match = METRIC.match(spec)
+            if not match:
+                raise ValueError("invalid metric {}".format(spec))
+            function, attribute = match.group(1), match.group(2)
+        else:
+            function, attribute = spec
+        function = "p50" if function == "median" else function
+        if function not in FUNCTIONS and not (
+                re.match(r"^p\d+$", function) and
+                int(function[1:]) <= 100):
+            raise ValueError("unknown function {}".format(function))
+        if not attribute and function != "count":
+            raise ValueError("{}() needs an attribute".format(function))
+        parsed.append((name, function, attribute or None))
+    return parsed
+
+
+class ColumnIndex:
+
+    """Columns of the numeric and reference attributes of a class
+
+    Each numeric attribute is packed in an array of doubles, NaN where
+    an object has no number, and each reference attribute in an array
+    of integer codes, -1 where it is unset. An object keeps its row
+    until it is removed; the row is then blanked and reused. With
+    NumPy installed the aggregates run as vectorized passes over the
+    arrays, otherwise as plain loops over them.
+    """
+
+    def __init__(self, classname, numbers, labels):
+        """Initializes empty columns of classname
+
+        Args:
+            - numbers: dict of the numeric attributes and their type,
+              int or float
+            - labels: names of the attributes to group by
+        """
+        self.classname = classname
+        self.attribute = "columns"
+        self.kinds = dict(numbers)
+        self.keys = []
+        self.slots = {}
+        self.free = []
+        self.columns = {name: array("d") for name in numbers}
+        self.codes = {name: array("q") for name in labels}
+        self.categories = {name: [] for name in labels}
+        self.category_codes = {name: {} for name in labels}
+
+    def __len__(self):
+        """Returns the number of objects in the columns"""
+        return len(self.slots)
+
+    def add(self, key, obj):
+        """Writes the attributes of obj to the row of key"""
+        if self.free:
+            slot = self.free.pop()
+            self.keys[slot] = key
+        else:
+            slot = len(self.keys)
+            self.keys.append(key)
+            for column in self.columns.values():
+                column.append(math.nan)
+            for codes in self.codes.values():
+                codes.append(-1)
+        self.slots[key] = slot
+        for name, column in self.columns.items():
+            value = getattr(obj, name, None)
+            if isinstance(value, (int, float)) and \
+                    not isinstance(value, bool):
+                column[slot] = value
+        for name, codes in self.codes.items():
+            value = getattr(obj, name, None)
+            if isinstance(value, str):
+                code = self.category_codes[name].get(value)
+                if code is None:
+                    code = self.category_codes[name][value] = \
+                        len(self.categories[name])
+                    self.categories[name].append(value)
+                codes[slot] = code
+
+    def remove(self, key):
+        """Blanks the row of key"""
+        slot = self.slots.pop(key, None)
+        if slot is None:
+            return
+        for column in self.columns.values():
+            column[slot] = math.nan
+        for codes in self.codes.values():
+            codes[slot] = -1
+        self.keys[slot] = None
+        self.free.append(slot)
+
+    def lookup(self, tests):
+        """Answers no test; the columns serve aggregates"""
+        return None
+
+    def copy(self):
+        """Returns a copy of the columns that changes to them leave as
+        it is"""
+        other = ColumnIndex(self.classname, self.kinds, list(self.codes))
+        other.keys = list(self.keys)
+        other.slots = dict(self.slots)
+        other.free = list(self.free)
+        other.columns = {name: array("d", column)
+                         for name, column in self.columns.items()}
+        other.codes = {name: array("q", codes)
+                       for name, codes in self.codes.items()}
+        other.categories = {name: list(values)
+                            for name, values in self.categories.items()}
+        other.category_codes = {name: dict(codes) for name, codes in
+                                self.category_codes.items()}
+        return other
+
+    def column(self, attribute):
+        """Returns a copy of the column of attribute, NaN for no value
+
+        The copy is a NumPy array if NumPy is installed, an array of
+        doubles otherwise. Blank rows are left out.
+        """
+        values = self.__values(attribute)
+        if numpy is not None:
+            return numpy.array(values)
+        return array("d", values)
+
+    def mean(self, attribute, by=None):
+        """Returns the mean of attribute, or a dict of the mean by value
+        of the reference attribute by"""
+        found = self.aggregate([("avg", "avg", attribute)], by)
+        if by is None:
+            return found["avg"]
+        return {value: row["avg"] for value, row in found.items()}
+
+    def aggregate(self, metrics, by=None):
+        """Returns the metrics over the rows, or a dict of them by value
+        of the reference attribute by
+
+        Args:
+            - metrics: list of (name, function, attribute) as returned
+              by parse_metrics()
+            - by: reference attribute to group by, None for one group
+        Values of a group with no number for the attribute are None;
+        groups without rows are left out.
+        """
+        if by is not None and by not in self.codes:
+            raise ValueError("cannot group by {}".format(by))
+        for _, function, attribute in metrics:
+            if attribute is not None and attribute not in self.columns:
+                raise ValueError("{} is not a numeric attribute".format(
+                    attribute))
+        if by is None:
+            categories = [None]
+            codes = [-1 if key is None else 0 for key in self.keys]
+        else:
+            categories = self.categories[by]
+            codes = self.codes[by]
+        if numpy is not None:
+            codes = numpy.array(codes, dtype=numpy.int64)
+        rows = self.__metric("count", None, codes, len(categories))
+        found = {}
+        for code, category in enumerate(categories):
+            if rows[code]:
+                found[category] = {}
+        for name, function, attribute in metrics:
+            values = self.__metric(function, attribute, codes,
+                                   len(categories))
+            for code, category in enumerate(categories):
+                if rows[code]:
+                    found[category][name] = values[code]
+        if by is None:
+            return found.get(None, {name: 0 if function == "count"
+                                    else None
+                                    for name, function, _ in metrics})
+        return found
+
+    def __metric(self, function, attribute, codes, n):
+        """Returns the value of function over attribute for each code"""
+        if attribute is None:
+            values, keep = None, None
+        elif numpy is not None:
+            values = self.__array(self.columns[attribute], numpy.float64)
+            keep = ~numpy.isnan(values)
+        else:
+            values = self.columns[attribute]
+        if numpy is not None:
+            keep = codes >= 0 if keep is None else keep & (codes >= 0)
+            groups = codes[keep]
+            counts = numpy.bincount(groups, minlength=n)
+            if function == "count":
+                return counts.tolist()
+            values = values[keep]
+            if function in ("sum", "avg"):
+                found = numpy.bincount(groups, weights=values, minlength=n)
+                if function == "avg":
+                    found = found / numpy.maximum(counts, 1)
+            else:
+                order = numpy.lexsort((values, groups))
+                values = values[order]
+                starts = numpy.searchsorted(groups[order], numpy.arange(n))
+                found = self.__ranked(function, values, starts, counts)
+            return [self.__cast(function, attribute, value) if count
+                    else None
+                    for value, count in zip(found.tolist(), counts)]
+        grouped = [[] for _ in range(n)]
+        if values is None:
+            for code in codes:
+                if code >= 0:
+                    grouped[code].append(None)
+        else:
+            for value, code in zip(values, codes):
+                if code >= 0 and value == value:
+                    grouped[code].append(value)
+        found = []
+        for group in grouped:
+            if function == "count":
+                found.append(len(group))
+            elif not group:
+                found.append(None)
+            elif function in ("sum", "avg"):
+                total = sum(group)
+                found.append(self.__cast(function, attribute, total if
+                                         function == "sum" else
+                                         total / len(group)))
+            else:
+                group.sort()
+                found.append(self.__cast(function, attribute,
+                                         self.__ranked(function, group, 0,
+                                                       len(group))))
+        return found
+
+    @staticmethod
+    def __ranked(function, values, starts, counts):
+        """Returns min, max or a percentile of the sorted values of the
+        groups at starts, working on NumPy arrays and plain numbers"""
+        if function == "min":
+            q = 0.0
+        elif function == "max":
+            q = 100.0
+        else:
+            q = float(function[1:])
+        if not len(values):
+            return starts * 0.0
+        position = starts + (counts - 1) * q / 100
+        if numpy is not None and not isinstance(position, (int, float)):
+            position = numpy.clip(position, 0, len(values) - 1)
+            low = numpy.floor(position).astype(numpy.int64)
+            high = numpy.ceil(position).astype(numpy.int64)
+        else:
+            low, high = math.floor(position), math.ceil(position)
+        return values[low] + (values[high] - values[low]) * (position - low)
+
+    def __cast(self, function, attribute, value):
+        """Returns value as an int if it is a sum, min or max of ints"""
+        if function in ("sum", "min", "max") and \
+                self.kinds.get(attribute) is int:
+            return int(value)
+        return float(value) if function != "count" else value
+
+    def __array(self, column, dtype):
+        """Returns a NumPy copy of the array column"""
+        if not len(column):
+            return numpy.empty(0, dtype=dtype)
+        return numpy.frombuffer(column, dtype=dtype).copy()
+
+    def __values(self, attribute):
+        """Returns the values of attribute in the rows in use"""
+        column = self.columns[attribute]
+        if numpy is not None:
+            return self.__array(column, numpy.float64)[self.__used()]
+        return [column[slot] for slot in sorted(self.slots.values())]
+
+    def __used(self):
+        """Returns the NumPy mask of the rows in use"""
+        used = numpy.ones(len(self.keys), dtype=bool)
+        used[self.free] = False
+        return used
+
+    def histogram(self, attribute, bins=10):
+        """Returns the counts and the edges of a histogram of attribute
+
+        Args:
+            - bins: number of bins of equal width between the smallest
+              and largest value, or the list of the bin edges; the last
+              bin includes its upper edge
+        """
+        values = self.__values(attribute)
+        if numpy is not None:
+            counts, edges = numpy.histogram(values[~numpy.isnan(values)],
+                                            bins)
+            return counts.tolist(), edges.tolist()
+        values = [v for v in values if v == v]
+        if isinstance(bins, int):
+            low = min(values) if values else 0.0
+            high = max(values) if values else 1.0
+            if low == high:
+                low, high = low - 0.5, high + 0.5
+            edges = [low + (high - low) * i / bins for i in range(bins)]
+            edges.append(high)
+        else:
+            edges = [float(edge) for edge in bins]
+        counts = [0] * (len(edges) - 1)
+        for value in values:
+            if edges[0] <= value <= edges[-1]:
+                i = bisect.bisect_right(edges, value) - 1
+                counts[min(i, len(counts) - 1)] += 1
+        return counts, edges
@@ -0,0 +1,79 @@
+#!/usr/bin/python3
+"""Module for the Query class."""
+import itertools
+import operator
+
+
+OPERATORS = {"==": operator.eq,
+             "!=": operator.ne,
+             "<": operator.lt,
+             "<=": operator.le,
+             ">": operator.gt,
+             ">=": operator.ge,
+             "in": lambda a, b: a in b,
+             "contains": lambda a, b: b in a}
+
+
+class Query:
+
+    """Filters, ordering and paging of a storage query"""
+
+    def __init__(self, classname, where=None, order_by=None, limit=None,
+                 offset=0):
+        """Initializes the query
+
+        Args:
+            - classname: name of the class of the objects to return
+            - where: dict of attribute to value, (operator, value)
+              tuple or list of such tuples, all of which must match;
+              "contains" tests membership in a list attribute
+            - order_by: attribute to sort on, "-attribute" for
+              descending order
+            - limit: maximum number of objects to return
+            - offset: number of matching objects to skip
+        """
+        self.classname = classname
+        self.conditions = []
+        for attribute, tests in (where or {}).items():
+            if not isinstance(tests, list):
+                tests = [tests]
+            for test in tests:
+                if not isinstance(test, tuple):
+                    test = ("==", test)
+                op, value = test
+                if op not in OPERATORS:
+                    raise ValueError("unknown operator {}".format(op))
+                self.conditions.append((attribute, op, value))
+        self.order_by = order_by
+        self.limit = limit
+        self.offset = offset
+
+    def matches(self, obj):
+        """Tells whether obj passes every condition"""
+        for attribute, op, value in self.conditions:
+            try:
+                if not OPERATORS[op](getattr(obj, attribute, None), value):
+                    return False
+            except TypeError:
+                return False
+        return True
+
+    def run(self, objects):
+        """Returns the page of matching objects out of objects
+
+        Without order_by, objects are consumed only until the page is
+        full. Objects missing the order_by attribute, or holding None,
+        come last in either direction.
+        """
+        matches = (obj for obj in objects if self.matches(obj))
+        if self.order_by:
+            attribute = self.order_by.lstrip("-")
+            descending = self.order_by.startswith("-")
+
+            def key(obj):
+                """Returns the sort key of obj, None last"""
+                value = getattr(obj, attribute, None)
+                return (value is None) != descending, value
+            matches = sorted(matches, key=key, reverse=descending)
+        stop = None if self.limit is None else self.offset + self.limit
+        return list(itertools.islice(matches, self.offset, stop))
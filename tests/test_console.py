@@ -11,11 +11,13 @@ Unittest classes:
     TestHBNBCommand_destroy
     TestHBNBCommand_update
 """
+import json
 import os
 import sys
+import time
 import unittest
 from models import storage
-from models.engine.file_storage import FileStorage
+from models.engine.file_storage import ConflictError, FileStorage
 from console import HBNBCommand
 from io import StringIO
 from unittest.mock import patch
@@ -99,7 +101,8 @@ class TestHBNBCommand_help(unittest.TestCase):
     def test_help(self):
         h = ("Documented commands (type help <topic>):\n"
              "========================================\n"
-             "EOF  all  count  create  destroy  help  quit  show  update")
+             "EOF        all     count   destroy  lastsave  search  update\n"
+             "aggregate  bgsave  create  help     quit      show")
         with patch("sys.stdout", new=StringIO()) as output:
             self.assertFalse(HBNBCommand().onecmd("help"))
             self.assertEqual(h, output.getvalue().strip())
@@ -1500,6 +1503,102 @@ class TestHBNBCommand_update(unittest.TestCase):
         test_dict = storage.all()["Place.{}".format(testId)].__dict__
         self.assertEqual(9.8, test_dict["latitude"])
 
+    def test_update_dictionary_is_all_or_nothing(self):
+        with patch("sys.stdout", new=StringIO()) as output:
+            HBNBCommand().onecmd("create Place")
+            testId = output.getvalue().strip()
+        testCmd = 'Place.update("{}", '.format(testId)
+        testCmd += "{'max_guest': 98, 'latitude': 'north'})"
+        with self.assertRaises(ValueError):
+            HBNBCommand().onecmd(testCmd)
+        test_dict = storage.all()["Place.{}".format(testId)].__dict__
+        self.assertNotIn("max_guest", test_dict)
+
+
+class TestHBNBCommand_conflict(unittest.TestCase):
+    """Unittests for changes refused because of another process."""
+
+    def test_conflict_is_reported(self):
+        with patch("sys.stdout", new=StringIO()) as output:
+            HBNBCommand().onecmd("create User")
+            testId = output.getvalue().strip()
+        error = ConflictError(["User.{}".format(testId)])
+        with patch.object(type(storage), "save", side_effect=error):
+            for command in ["update User {} first_name A".format(testId),
+                            'User.update("{}", '.format(testId) +
+                            "{'first_name': 'A'})",
+                            "create User",
+                            "destroy User {}".format(testId)]:
+                with patch("sys.stdout", new=StringIO()) as output:
+                    self.assertFalse(HBNBCommand().onecmd(command))
+                    self.assertEqual(
+                        "** changed by another process: User.{} **".format(
+                            testId), output.getvalue().strip())
+
+
+class TestHBNBCommand_search(unittest.TestCase):
+    """Unittests for testing search method of HBNB comand interpreter."""
+
+    @classmethod
+    def setUp(self):
+        try:
+            os.rename("file.json", "tmp")
+        except IOError:
+            pass
+        FileStorage._FileStorage__objects = {}
+
+    @classmethod
+    def tearDown(self):
+        try:
+            os.remove("file.json")
+        except IOError:
+            pass
+        try:
+            os.rename("tmp", "file.json")
+        except IOError:
+            pass
+
+    def create_review(self, text):
+        with patch("sys.stdout", new=StringIO()) as output:
+            self.assertFalse(HBNBCommand().onecmd("create Review"))
+            testId = output.getvalue().strip()
+        storage.all()["Review.{}".format(testId)].text = text
+        return testId
+
+    def test_search_missing_class(self):
+        correct = "** class name missing **"
+        with patch("sys.stdout", new=StringIO()) as output:
+            self.assertFalse(HBNBCommand().onecmd("search"))
+            self.assertEqual(correct, output.getvalue().strip())
+
+    def test_search_invalid_class(self):
+        correct = "** class doesn't exist **"
+        with patch("sys.stdout", new=StringIO()) as output:
+            self.assertFalse(HBNBCommand().onecmd("MyModel.search(\"a\")"))
+            self.assertEqual(correct, output.getvalue().strip())
+
+    def test_search_missing_text(self):
+        correct = "** search text missing **"
+        with patch("sys.stdout", new=StringIO()) as output:
+            self.assertFalse(HBNBCommand().onecmd("search Review"))
+            self.assertEqual(correct, output.getvalue().strip())
+
+    def test_search_class_without_text(self):
+        correct = "** class has no text **"
+        with patch("sys.stdout", new=StringIO()) as output:
+            self.assertFalse(HBNBCommand().onecmd("User.search(\"a\")"))
+            self.assertEqual(correct, output.getvalue().strip())
+
+    def test_search_ranked(self):
+        quiet = self.create_review("Quiet room, very quiet street")
+        noisy = self.create_review("Noisy but quiet at night")
+        other = self.create_review("Great breakfast")
+        with patch("sys.stdout", new=StringIO()) as output:
+            self.assertFalse(HBNBCommand().onecmd("Review.search(\"quiet\")"))
+            result = output.getvalue().strip()
+        self.assertLess(result.index(quiet), result.index(noisy))
+        self.assertNotIn(other, result)
+
 
 class TestHBNBCommand_count(unittest.TestCase):
     """Unittests for testing count method of HBNB comand interpreter."""
@@ -1566,5 +1665,126 @@ class TestHBNBCommand_count(unittest.TestCase):
             self.assertEqual("1", output.getvalue().strip())
 
 
+class TestHBNBCommand_bgsave(unittest.TestCase):
+    """Unittests for testing bgsave and lastsave of HBNB comand interpreter."""
+
+    @classmethod
+    def setUp(self):
+        try:
+            os.rename("file.json", "tmp")
+        except IOError:
+            pass
+        FileStorage._FileStorage__objects = {}
+
+    @classmethod
+    def tearDown(self):
+        storage.bgsave_status()
+        try:
+            os.remove("file.json")
+        except IOError:
+            pass
+        try:
+            os.rename("tmp", "file.json")
+        except IOError:
+            pass
+
+    def test_bgsave(self):
+        with patch("sys.stdout", new=StringIO()) as output:
+            self.assertFalse(HBNBCommand().onecmd("create User"))
+            testId = output.getvalue().strip()
+        with patch("sys.stdout", new=StringIO()) as output:
+            self.assertFalse(HBNBCommand().onecmd("bgsave"))
+            self.assertEqual("Background saving started",
+                             output.getvalue().strip())
+        storage.compact()
+        with open("file.json", "r") as f:
+            self.assertIn("User.{}".format(testId), json.load(f))
+
+    def test_lastsave(self):
+        with patch("sys.stdout", new=StringIO()) as output:
+            self.assertFalse(HBNBCommand().onecmd("bgsave"))
+        while storage.bgsave_status()["in_progress"]:
+            time.sleep(0.01)
+        with patch("sys.stdout", new=StringIO()) as output:
+            self.assertFalse(HBNBCommand().onecmd("lastsave"))
+            lines = output.getvalue().strip().split("\n")
+        self.assertTrue(lines[0].startswith("last_save: "))
+        self.assertNotEqual("last_save: never", lines[0])
+        self.assertEqual("in_progress: False", lines[1])
+        self.assertEqual("last_status: ok", lines[2])
+
+
+class TestHBNBCommand_aggregate(unittest.TestCase):
+    """Unittests for testing aggregate method of HBNB comand interpreter."""
+
+    @classmethod
+    def setUp(self):
+        try:
+            os.rename("file.json", "tmp")
+        except IOError:
+            pass
+        FileStorage._FileStorage__objects = {}
+
+    @classmethod
+    def tearDown(self):
+        try:
+            os.remove("file.json")
+        except IOError:
+            pass
+        try:
+            os.rename("tmp", "file.json")
+        except IOError:
+            pass
+
+    def create_place(self, city_id, price):
+        with patch("sys.stdout", new=StringIO()) as output:
+            self.assertFalse(HBNBCommand().onecmd("create Place"))
+            testId = output.getvalue().strip()
+        place = storage.all()["Place.{}".format(testId)]
+        place.city_id = city_id
+        place.price_by_night = price
+
+    def test_aggregate_missing_class(self):
+        correct = "** class name missing **"
+        with patch("sys.stdout", new=StringIO()) as output:
+            self.assertFalse(HBNBCommand().onecmd("aggregate"))
+            self.assertEqual(correct, output.getvalue().strip())
+
+    def test_aggregate_invalid_class(self):
+        correct = "** class doesn't exist **"
+        with patch("sys.stdout", new=StringIO()) as output:
+            self.assertFalse(HBNBCommand().onecmd("MyModel.aggregate()"))
+            self.assertEqual(correct, output.getvalue().strip())
+
+    def test_aggregate_invalid_metric(self):
+        correct = "** unknown function mode **"
+        with patch("sys.stdout", new=StringIO()) as output:
+            self.assertFalse(HBNBCommand().onecmd(
+                "Place.aggregate(city_id, mode(price_by_night))"))
+            self.assertEqual(correct, output.getvalue().strip())
+
+    def test_aggregate_dot_notation(self):
+        self.create_place("c1", 100)
+        self.create_place("c1", 200)
+        self.create_place("c2", 60)
+        correct = str([{"city_id": "c1", "avg(price_by_night)": 150.0,
+                        "count()": 2},
+                       {"city_id": "c2", "avg(price_by_night)": 60.0,
+                        "count()": 1}])
+        with patch("sys.stdout", new=StringIO()) as output:
+            self.assertFalse(HBNBCommand().onecmd(
+                "Place.aggregate(city_id, avg(price_by_night), count())"))
+            self.assertEqual(correct, output.getvalue().strip())
+
+    def test_aggregate_space_notation(self):
+        self.create_place("c1", 100)
+        self.create_place("c2", 60)
+        correct = str([{"max(price_by_night)": 100, "count()": 2}])
+        with patch("sys.stdout", new=StringIO()) as output:
+            self.assertFalse(HBNBCommand().onecmd(
+                "aggregate Place max(price_by_night) count()"))
+            self.assertEqual(correct, output.getvalue().strip())
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,147 @@
+#!/usr/bin/python3
+"""Unittest module for the codecs of FileStorage."""
+
+import io
+import json
+import unittest
+import uuid
+from models.engine.codec import CODECS, COMPRESSIONS, BinaryCodec, \
+    JSONCodec, PickleCodec, compressor, decompressor, detect
+
+
+def items():
+    """Return (key, dict) pairs like those of Place.to_dict()."""
+    state_id = "0a4f7dd2-5a52-4f14-8a1a-4b64b8d37c6e"
+    pairs = []
+    for i, uid in enumerate(["b6a6e15c-c67d-4312-9a75-9d084935e579",
+                             "c1d9b1b6-1a36-4f0e-9a76-2d2bd4d7f5a0"]):
+        pairs.append(("City." + uid, {
+            "__class__": "City", "id": uid, "state_id": state_id,
+            "name": "Town {}".format(i), "created_at":
+            "2017-09-28T21:03:54.052298", "updated_at":
+            "2017-09-28T21:03:54", "rank": -i, "ratio": 0.5,
+            "tags": ["a", None, True, False, 2 ** 70],
+            "notes": "x" * 100, "code": "not-a-uuid"}))
+    return pairs
+
+
+class TestCodecs(unittest.TestCase):
+    """Test Cases shared by every codec."""
+
+    def test_round_trip(self):
+        """Every codec reads back what it wrote."""
+        for name, codec in CODECS.items():
+            with self.subTest(codec=name):
+                f = io.BytesIO()
+                codec.dump(items(), f)
+                f.seek(0)
+                self.assertEqual(items(), list(codec.load(f)))
+
+    def test_detect(self):
+        """Files are told apart by their first bytes."""
+        for codec in CODECS.values():
+            f = io.BytesIO()
+            codec.dump(items(), f)
+            self.assertIs(codec, detect(f.getvalue()[:16], codec.name))
+        self.assertIsInstance(detect(b' {"a": 1}'), JSONCodec)
+
+    def test_detect_refuses_pickles(self):
+        """Only a pickle store reads pickles."""
+        f = io.BytesIO()
+        PickleCodec().dump(items(), f)
+        for codec in ("json", "binary"):
+            with self.assertRaises(ValueError):
+                detect(f.getvalue()[:16], codec)
+
+    def test_json_is_the_storage_format(self):
+        """JSONCodec writes one object per line."""
+        f = io.BytesIO()
+        JSONCodec().dump(items(), f)
+        lines = f.getvalue().decode("utf-8").split("\n")
+        self.assertEqual("{", lines[0])
+        self.assertEqual(4, len(lines) - 1)
+        self.assertEqual(dict(items()), json.loads(f.getvalue()))
+
+    def test_json_offsets(self):
+        """write() records where the text of each object starts."""
+        f = io.BytesIO()
+        texts = [(k, json.dumps(v)) for k, v in items()]
+        offsets = {}
+        JSONCodec().write(texts, f, offsets)
+        data = f.getvalue()
+        for k, text in texts:
+            offset, length = offsets[k]
+            self.assertEqual(text, data[offset:offset + length].decode())
+
+
+class TestBinaryCodec(unittest.TestCase):
+    """Test Cases for the BinaryCodec class."""
+
+    def test_smaller_than_json(self):
+        """Repeated names, uuids and dates take less room."""
+        pairs = items() * 50
+        binary = io.BytesIO()
+        BinaryCodec().dump(pairs, binary)
+        text = io.BytesIO()
+        JSONCodec().dump(pairs, text)
+        self.assertLess(len(binary.getvalue()), len(text.getvalue()) / 2)
+
+    def test_repeated_uuid_is_stored_once(self):
+        """The second use of a uuid is a reference to the first."""
+        f = io.BytesIO()
+        BinaryCodec().dump(items(), f)
+        state_id = "0a4f7dd2-5a52-4f14-8a1a-4b64b8d37c6e"
+        self.assertEqual(1, f.getvalue().count(uuid.UUID(state_id).bytes))
+
+    def test_truncated(self):
+        """A cut file is an error, not a silent partial read."""
+        f = io.BytesIO()
+        BinaryCodec().dump(items(), f)
+        with self.assertRaises(ValueError):
+            list(BinaryCodec().load(io.BytesIO(f.getvalue()[:-10])))
+
+    def test_unsupported_type(self):
+        """Values JSON could not hold are refused."""
+        with self.assertRaises(TypeError):
+            BinaryCodec().dump([("City.1", {"a": object()})], io.BytesIO())
+
+
+class TestPickleCodec(unittest.TestCase):
+    """Test Cases for the PickleCodec class."""
+
+    def test_protocol_5(self):
+        """Files start with the protocol 5 header."""
+        f = io.BytesIO()
+        PickleCodec().dump(items(), f)
+        self.assertTrue(f.getvalue().startswith(b"\x80\x05"))
+
+
+class TestCompression(unittest.TestCase):
+    """Test Cases for compressor() and decompressor()."""
+
+    def test_round_trip(self):
+        """Compressed streams are told apart and read back."""
+        for compression in COMPRESSIONS:
+            with self.subTest(compression=compression):
+                raw = io.BytesIO()
+                with compressor(raw, compression) as f:
+                    BinaryCodec().dump(items(), f)
+                self.assertFalse(raw.closed)
+                self.assertTrue(raw.getvalue().startswith(
+                    COMPRESSIONS[compression]))
+                raw = io.BufferedReader(io.BytesIO(raw.getvalue()))
+                f = decompressor(raw)
+                self.assertIs(BinaryCodec, type(detect(f.peek(16))))
+                self.assertEqual(items(), list(BinaryCodec().load(f)))
+
+    def test_uncompressed(self):
+        """Without compression the file is used as it is."""
+        raw = io.BufferedReader(io.BytesIO(b"{}"))
+        self.assertIs(raw, decompressor(raw))
+        f = io.BytesIO()
+        with compressor(f, None) as out:
+            self.assertIs(f, out)
+
+
+if __name__ == "__main__":
+    unittest.main()
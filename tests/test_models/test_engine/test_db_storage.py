@@ -0,0 +1,196 @@
+#!/usr/bin/python3
+"""Unittest module for the DBStorage class."""
+
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest.mock import patch
+from models.engine.db_storage import DBStorage
+from models.city import City
+from models.place import Place
+from models.state import State
+from models.user import User
+
+
+class TestDBStorage(unittest.TestCase):
+    """Test Cases for the DBStorage class."""
+
+    def setUp(self):
+        """Open a storage on a scratch database."""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "hbnb.db")
+        self.storage = DBStorage(self.db_path)
+        self.storage.reload()
+
+    def tearDown(self):
+        """Remove the scratch database."""
+        self.tmp.cleanup()
+
+    def reopen(self):
+        """Return a fresh storage on the same database."""
+        storage = DBStorage(self.db_path)
+        storage.reload()
+        return storage
+
+    def test_classes_and_attributes(self):
+        """classes() and attributes() match FileStorage."""
+        self.assertIn("Place", self.storage.classes())
+        self.assertIs(int, self.storage.attributes()["Place"]["max_guest"])
+
+    def test_typed_columns(self):
+        """Each class gets a table with typed columns."""
+        conn = sqlite3.connect(self.db_path)
+        columns = {row[1]: row[2] for row in
+                   conn.execute('PRAGMA table_info("Place")')}
+        conn.close()
+        self.assertEqual("INTEGER", columns["price_by_night"])
+        self.assertEqual("REAL", columns["latitude"])
+        self.assertEqual("TEXT", columns["city_id"])
+
+    def test_new_save_reload(self):
+        """Saved objects come back with their attributes."""
+        place = Place()
+        place.price_by_night = 120
+        place.amenity_ids = ["a", "b"]
+        place.nickname = "Loft"
+        self.storage.new(place)
+        self.storage.save()
+        obj = self.reopen().all()["Place." + place.id]
+        self.assertIsInstance(obj, Place)
+        self.assertEqual(120, obj.price_by_night)
+        self.assertEqual(["a", "b"], obj.amenity_ids)
+        self.assertEqual("Loft", obj.nickname)
+        self.assertEqual(place.created_at, obj.created_at)
+        self.assertNotIn("city_id", obj.__dict__)
+
+    def test_unsaved_objects_are_listed(self):
+        """New objects are visible before save()."""
+        user = User()
+        self.storage.new(user)
+        self.assertIn("User." + user.id, self.storage.all())
+        self.assertIs(user, self.storage.all()["User." + user.id])
+        self.assertNotIn("User." + user.id, self.reopen().all())
+
+    def test_update_is_saved(self):
+        """Attribute changes on a loaded object are written back."""
+        user = User()
+        self.storage.new(user)
+        self.storage.save()
+        storage = self.reopen()
+        with patch("models.base_model.storage", storage):
+            obj = storage.all()["User." + user.id]
+            obj.first_name = "Betty"
+            obj.save()
+        obj = self.reopen().all()["User." + user.id]
+        self.assertEqual("Betty", obj.first_name)
+
+    def test_delete(self):
+        """Deleted objects are removed from the database."""
+        user = User()
+        self.storage.new(user)
+        self.storage.save()
+        del self.storage.all()["User." + user.id]
+        self.assertNotIn("User." + user.id, self.storage.all())
+        self.storage.save()
+        self.assertNotIn("User." + user.id, self.reopen().all())
+
+    def test_len_and_iteration(self):
+        """The mapping lists every stored key once."""
+        users = [User() for _ in range(3)]
+        for user in users:
+            self.storage.new(user)
+        self.storage.save()
+        self.storage.new(users[0])
+        self.assertEqual(3, len(self.storage.all()))
+        self.assertEqual(sorted("User." + u.id for u in users),
+                         sorted(self.storage.all()))
+
+    def test_all_and_count_by_class(self):
+        """all(cls) and count(cls) only see objects of cls."""
+        user = User()
+        place = Place()
+        self.storage.new(user)
+        self.storage.new(place)
+        self.storage.save()
+        storage = self.reopen()
+        self.assertEqual(["Place." + place.id], list(storage.all(Place)))
+        self.assertEqual(1, storage.count("User"))
+        self.assertEqual(0, storage.count("Review"))
+
+    def test_children(self):
+        """children() follows the id columns, saved or not."""
+        saved = City()
+        saved.state_id = "s1"
+        self.storage.new(saved)
+        self.storage.save()
+        unsaved = City()
+        unsaved.state_id = "s1"
+        self.storage.new(unsaved)
+        cities = self.storage.children(State, "s1", City)
+        self.assertEqual({"City." + saved.id, "City." + unsaved.id},
+                         set(cities))
+
+    def test_aggregate(self):
+        """aggregate() reads the saved and unsaved objects."""
+        for price, city in [(100, "c1"), (200, "c1"), (60, "c2")]:
+            place = Place()
+            place.price_by_night = price
+            place.city_id = city
+            self.storage.new(place)
+        self.storage.save()
+        self.assertEqual({"c1": {"max": 200}, "c2": {"max": 60}},
+                         self.reopen().aggregate(
+                             Place, "city_id",
+                             {"max": "max(price_by_night)"}))
+
+    def test_snapshot(self):
+        """snapshot() is a copy of the saved and unsaved objects."""
+        saved = City()
+        self.storage.new(saved)
+        self.storage.save()
+        unsaved = City()
+        self.storage.new(unsaved)
+        snapshot = self.storage.snapshot()
+        self.storage.delete(saved)
+        self.assertEqual({"City." + saved.id, "City." + unsaved.id},
+                         set(snapshot))
+        self.assertEqual(["City." + unsaved.id],
+                         [key for key, _ in self.storage.items(City)])
+
+    def test_transaction(self):
+        """The block is saved once, or undone if it raises."""
+        city = City()
+        city.name = "Tulsa"
+        self.storage.new(city)
+        self.storage.save()
+        with self.assertRaises(KeyError):
+            with self.storage.transaction():
+                self.storage.touch(city)
+                city.name = "Boston"
+                other = City()
+                self.storage.new(other)
+                self.storage.save()
+                self.storage.delete(city)
+                raise KeyError("boom")
+        self.assertEqual("Tulsa", city.name)
+        self.assertEqual(["City." + city.id], list(self.storage.keys()))
+        with self.storage.transaction():
+            self.storage.new(other)
+            self.storage.save()
+            self.assertEqual(["City." + city.id],
+                             list(self.reopen().keys()))
+        self.assertEqual(2, self.reopen().count(City))
+
+    def test_bulk(self):
+        """bulk_new() and bulk_delete() save once each."""
+        cities = [City() for _ in range(4)]
+        self.assertEqual(4, self.storage.bulk_new(cities))
+        self.assertEqual(4, self.reopen().count(City))
+        self.assertEqual(2, self.storage.bulk_delete(
+            ["City." + cities[0].id, "City." + cities[1].id, "City.nope"]))
+        self.assertEqual(2, self.reopen().count(City))
+
+
+if __name__ == "__main__":
+    unittest.main()
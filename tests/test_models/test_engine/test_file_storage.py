@@ -1,15 +1,24 @@
 #!/usr/bin/python3
 """Unittest module for the FileStorage class."""
 
+import asyncio
 import unittest
 from models.city import City
 from datetime import datetime
-from models.engine.file_storage import FileStorage
+from models.engine.file_storage import ConflictError, FileLock, \
+    FileStorage, ReadWriteLock, Stub
 from models.base_model import BaseModel
 from models.user import User
+from models.place import Place
+from models.review import Review
+from models.state import State
 from models import storage
 import os
 import json
+import tempfile
+import threading
+import time
+from unittest.mock import patch
 
 
 class TestFileStorage(unittest.TestCase):
@@ -75,5 +84,1675 @@ class TestFileStorage(unittest.TestCase):
         self.assertIn(f"User.{user.id}", objects)
 
 
+class TestFileStorage_partitions(unittest.TestCase):
+    """Test Cases for the class partitions of FileStorage."""
+
+    def setUp(self):
+        """Start from an empty storage."""
+        self.objects = FileStorage._FileStorage__objects
+        FileStorage._FileStorage__objects = {}
+        self.storage = FileStorage()
+
+    def tearDown(self):
+        """Restore the objects."""
+        FileStorage._FileStorage__objects = self.objects
+
+    def test_all_by_class(self):
+        """all(cls) returns only the objects of cls."""
+        user = User()
+        place = Place()
+        self.assertEqual({"User." + user.id: user}, self.storage.all(User))
+        self.assertEqual({"Place." + place.id: place},
+                         self.storage.all("Place"))
+        self.assertEqual({}, self.storage.all("Review"))
+
+    def test_count(self):
+        """count() follows new() and delete()."""
+        users = [User() for _ in range(3)]
+        City()
+        self.assertEqual(3, self.storage.count(User))
+        self.assertEqual(1, self.storage.count("City"))
+        self.assertEqual(4, self.storage.count())
+        self.storage.delete(users[0])
+        self.assertEqual(2, self.storage.count("User"))
+        self.assertNotIn("User." + users[0].id, self.storage.all(User))
+
+    def test_replaced_objects(self):
+        """The partitions are rebuilt when __objects is replaced."""
+        User()
+        FileStorage._FileStorage__objects = {}
+        self.assertEqual(0, self.storage.count("User"))
+
+
+class TestFileStorage_children(unittest.TestCase):
+    """Test Cases for the reverse id indexes of FileStorage."""
+
+    def setUp(self):
+        """Start from a small State/City/Place tree."""
+        self.objects = FileStorage._FileStorage__objects
+        FileStorage._FileStorage__objects = {}
+        self.storage = FileStorage()
+        self.state = State()
+        self.cities = [City() for _ in range(2)]
+        for city in self.cities:
+            city.state_id = self.state.id
+        City().state_id = "other"
+
+    def tearDown(self):
+        """Restore the objects."""
+        FileStorage._FileStorage__objects = self.objects
+
+    def test_children(self):
+        """children() returns the objects referencing the parent."""
+        cities = self.storage.children(State, self.state.id, City)
+        self.assertEqual({"City." + c.id: c for c in self.cities}, cities)
+        self.assertEqual({}, self.storage.children("State", "none", "City"))
+
+    def test_children_follow_changes(self):
+        """The index follows new(), attribute updates and delete()."""
+        self.storage.children(State, self.state.id, City)
+        city = City()
+        city.state_id = self.state.id
+        self.cities[0].state_id = "other"
+        self.storage.delete(self.cities[1])
+        cities = self.storage.children(State, self.state.id, City)
+        self.assertEqual(["City." + city.id], list(cities))
+
+    def test_children_of_user(self):
+        """A class with several references picks the right one."""
+        user = User()
+        review = Review()
+        review.user_id = user.id
+        review.place_id = "p1"
+        self.assertEqual([review], list(
+            self.storage.children(User, user.id, Review).values()))
+        self.assertEqual([review], list(
+            self.storage.children(Place, "p1", Review).values()))
+
+    def test_no_relation(self):
+        """Unrelated classes raise ValueError."""
+        with self.assertRaises(ValueError):
+            self.storage.children(City, self.cities[0].id, State)
+
+    def test_builds_only_its_index(self):
+        """children() indexes neither other attributes nor classes."""
+        review = Review()
+        review.text = "quiet room"
+        with patch("models.engine.file_storage.TextIndex.add") as add:
+            self.storage.children(State, self.state.id, City)
+            self.assertEqual(["City.state_id"], list(
+                FileStorage._FileStorage__indexes))
+            self.storage.search(Review, "quiet")
+            review.text = "noisy room"
+            self.storage.children(State, self.state.id, City)
+        self.assertEqual(1, add.call_count)
+        self.assertEqual([review], self.storage.search(Review, "noisy"))
+
+
+class TestFileStorage_query(unittest.TestCase):
+    """Test Cases for the query() and explain() of FileStorage."""
+
+    def setUp(self):
+        """Start from a few places in two cities."""
+        self.objects = FileStorage._FileStorage__objects
+        FileStorage._FileStorage__objects = {}
+        self.storage = FileStorage()
+        self.places = []
+        for i in range(6):
+            place = Place()
+            place.city_id = "c1" if i < 4 else "c2"
+            place.price_by_night = 50 * i
+            place.name = "place{}".format(i)
+            self.places.append(place)
+
+    def tearDown(self):
+        """Restore the objects."""
+        FileStorage._FileStorage__objects = self.objects
+
+    def test_where(self):
+        """Every condition must match."""
+        found = self.storage.query(Place, where={
+            "city_id": "c1", "price_by_night": [(">=", 50), ("<", 150)]})
+        self.assertEqual(self.places[1:3], found)
+
+    def test_order_limit_offset(self):
+        """Results are sorted, then paged."""
+        found = self.storage.query("Place", order_by="-price_by_night",
+                                   limit=2, offset=1)
+        self.assertEqual([self.places[4], self.places[3]], found)
+
+    def test_order_missing_last(self):
+        """Objects without the attribute, or holding None, come last."""
+        self.places[1].rank = 2
+        self.places[3].rank = 1
+        self.places[4].rank = None
+        found = self.storage.query(Place, order_by="rank")
+        self.assertEqual([self.places[3], self.places[1]], found[:2])
+        self.assertEqual(6, len(found))
+        found = self.storage.query(Place, order_by="-rank", limit=3)
+        self.assertEqual(self.places[1], found[0])
+        self.assertEqual(self.places[3], found[1])
+        self.assertNotIn(found[2], self.places[1:4:2])
+
+    def test_limit_stops_early(self):
+        """Without order_by the objects are read only until limit."""
+        seen = []
+        with patch("models.engine.query.Query.matches", autospec=True,
+                   side_effect=lambda q, o: seen.append(o) or True):
+            found = self.storage.query(Place, where={"city_id": "c1"},
+                                       limit=2)
+        self.assertEqual(2, len(found))
+        self.assertEqual(2, len(seen))
+
+    def test_explain_uses_index(self):
+        """An equality on an id attribute is answered by its index."""
+        plan = self.storage.explain(Place, where={"city_id": "c2",
+                                                  "name": "place5"})
+        self.assertEqual("index", plan["access"])
+        self.assertEqual("Place.city_id", plan["index"])
+        self.assertEqual(2, plan["rows"])
+        self.assertEqual([self.places[5]], self.storage.query(
+            Place, where={"city_id": "c2", "name": "place5"}))
+
+    def test_explain_scan(self):
+        """Without a usable index the class partition is scanned."""
+        plan = self.storage.explain(Place, where={"name": "place5"})
+        self.assertEqual("scan", plan["access"])
+        self.assertEqual(6, plan["rows"])
+
+    def test_explain_uses_range_index(self):
+        """Comparisons on a number are answered by its range index."""
+        where = {"price_by_night": [(">=", 100), ("<=", 150)]}
+        plan = self.storage.explain(Place, where=where)
+        self.assertEqual("Place.price_by_night", plan["index"])
+        self.assertEqual(2, plan["rows"])
+        self.assertEqual(self.places[2:4], self.storage.query(
+            Place, where=where, order_by="price_by_night"))
+
+    def test_range_index_follows_updates(self):
+        """Console updates, cast to int, move the place in the index."""
+        from console import HBNBCommand
+        where = {"price_by_night": (">", 260)}
+        self.assertEqual([], self.storage.query(Place, where=where))
+        with patch("sys.stdout"), patch.object(FileStorage, "save"):
+            HBNBCommand().onecmd('update Place {} price_by_night "270"'
+                                 .format(self.places[0].id))
+        self.assertEqual(270, self.places[0].price_by_night)
+        self.assertEqual([self.places[0]],
+                         self.storage.query(Place, where=where))
+
+    def test_range_index_not_numbers(self):
+        """Tests on values that are not numbers match nothing."""
+        for where in ({"price_by_night": "100"},
+                      {"price_by_night": ("in", ["x"])},
+                      {"price_by_night": (">", None)}):
+            self.assertEqual([], self.storage.query("Place", where=where))
+            self.assertEqual("scan",
+                             self.storage.explain(Place, where=where)[
+                                 "access"])
+
+    def test_unknown_operator(self):
+        """An unknown operator raises ValueError."""
+        with self.assertRaises(ValueError):
+            self.storage.query(Place, where={"name": ("like", "p%")})
+
+
+class TestFileStorage_geo(unittest.TestCase):
+    """Test Cases for the location index of FileStorage."""
+
+    def setUp(self):
+        """Start from a few places."""
+        self.objects = FileStorage._FileStorage__objects
+        FileStorage._FileStorage__objects = {}
+        self.storage = FileStorage()
+        self.paris = Place()
+        self.paris.latitude, self.paris.longitude = 48.8566, 2.3522
+        self.london = Place()
+        self.london.latitude, self.london.longitude = 51.5074, -0.1278
+
+    def tearDown(self):
+        """Restore the objects."""
+        FileStorage._FileStorage__objects = self.objects
+
+    def test_queries(self):
+        """nearby(), nearest() and within() return places."""
+        self.assertEqual([self.paris],
+                         self.storage.nearby(48.85, 2.35, 50))
+        self.assertEqual([self.london, self.paris],
+                         self.storage.nearest(51, 0, 2))
+        self.assertEqual([self.london],
+                         self.storage.within(50, -1, 52, 1))
+
+    def test_follows_updates(self):
+        """Moving or deleting a place updates the index."""
+        self.storage.nearby(0, 0, 1)
+        self.london.latitude = 48.86
+        self.london.longitude = 2.34
+        self.storage.delete(self.paris)
+        self.assertEqual([self.london],
+                         self.storage.nearby(48.85, 2.35, 50))
+
+    def test_not_finite_skipped(self):
+        """Places moved to nan, inf or off the globe are not indexed."""
+        from console import HBNBCommand
+        self.paris.city_id = "c1"
+        self.storage.nearby(0, 0, 1)
+        for value in ("nan", "inf", "-inf", "91"):
+            with patch("sys.stdout"), patch.object(FileStorage, "save"):
+                HBNBCommand().onecmd('update Place {} latitude "{}"'
+                                     .format(self.paris.id, value))
+            self.assertEqual(str(float(value)), str(self.paris.latitude))
+            self.assertEqual([self.london],
+                             self.storage.nearby(50, 1, 500))
+            self.assertEqual([self.paris], list(self.storage.children(
+                City, "c1", Place).values()))
+
+
+class TestFileStorage_amenities(unittest.TestCase):
+    """Test Cases for the amenity bitsets of FileStorage."""
+
+    def setUp(self):
+        """Start from a few places."""
+        self.objects = FileStorage._FileStorage__objects
+        FileStorage._FileStorage__objects = {}
+        self.storage = FileStorage()
+        self.places = [Place() for _ in range(3)]
+        self.places[0].amenity_ids = ["wifi", "tv"]
+        self.places[1].amenity_ids = ["wifi", "tv", "pets"]
+        self.places[2].amenity_ids = ["pets"]
+
+    def tearDown(self):
+        """Restore the objects."""
+        FileStorage._FileStorage__objects = self.objects
+
+    def test_with_amenities(self):
+        """with_amenities() follows updates of amenity_ids."""
+        self.assertEqual(self.places[:2],
+                         self.storage.with_amenities(["wifi", "tv"]))
+        self.places[0].amenity_ids = ["wifi"]
+        self.assertEqual([self.places[1]],
+                         self.storage.with_amenities(["wifi", "tv"]))
+
+    def test_query_contains(self):
+        """query() answers contains tests from the bitsets."""
+        where = {"amenity_ids": [("contains", "pets"), ("contains", "tv")]}
+        plan = self.storage.explain(Place, where=where)
+        self.assertEqual("Place.amenity_ids", plan["index"])
+        self.assertEqual([self.places[1]],
+                         self.storage.query(Place, where=where))
+
+
+class TestFileStorage_columns(unittest.TestCase):
+    """Test Cases for the columns of Place in FileStorage."""
+
+    def setUp(self):
+        """Start from places in two cities."""
+        self.objects = FileStorage._FileStorage__objects
+        FileStorage._FileStorage__objects = {}
+        self.storage = FileStorage()
+        self.places = [Place() for _ in range(3)]
+        for p, price, city in zip(self.places, [100, 200, 60],
+                                  ["c1", "c1", "c2"]):
+            p.price_by_night = price
+            p.city_id = city
+
+    def tearDown(self):
+        """Restore the objects."""
+        FileStorage._FileStorage__objects = self.objects
+
+    def test_mean_by_city(self):
+        """columnar() follows new, changed and deleted places."""
+        columns = self.storage.columnar(Place)
+        self.assertEqual({"c1": 150.0, "c2": 60.0},
+                         columns.mean("price_by_night", by="city_id"))
+        self.places[1].price_by_night = 100
+        self.storage.delete(self.places[2])
+        p = Place()
+        p.price_by_night = 90
+        p.city_id = "c3"
+        columns = self.storage.columnar("Place")
+        self.assertEqual({"c1": 100.0, "c3": 90.0},
+                         columns.mean("price_by_night", by="city_id"))
+
+    def test_columnar_is_a_copy(self):
+        """Changes after columnar() do not reach the columns it gave."""
+        columns = self.storage.columnar(Place)
+        self.places[0].price_by_night = 300
+        self.storage.aggregate(Place)
+        self.assertEqual(120.0, columns.mean("price_by_night"))
+        self.assertEqual(
+            {"c1": 250.0, "c2": 60.0},
+            self.storage.columnar(Place).mean("price_by_night",
+                                              by="city_id"))
+
+    def test_aggregate(self):
+        """aggregate() groups the metrics by the reference attribute."""
+        self.assertEqual(
+            {"c1": {"avg": 150.0, "count": 2}, "c2": {"avg": 60.0,
+                                                      "count": 1}},
+            self.storage.aggregate(Place, group_by="city_id",
+                                   metrics={"avg": "avg(price_by_night)",
+                                            "count": "count()"}))
+        self.assertEqual({"count": 3}, self.storage.aggregate("Place"))
+
+    def test_no_columns(self):
+        """Classes without numbers have no columns."""
+        with self.assertRaises(ValueError):
+            self.storage.columnar(User)
+
+
+class TestFileStorage_search(unittest.TestCase):
+    """Test Cases for the full-text search of FileStorage."""
+
+    def setUp(self):
+        """Start from an empty storage."""
+        self.objects = FileStorage._FileStorage__objects
+        FileStorage._FileStorage__objects = {}
+        self.storage = FileStorage()
+
+    def tearDown(self):
+        """Restore the objects."""
+        FileStorage._FileStorage__objects = self.objects
+
+    def test_search_follows_updates(self):
+        """Changed descriptions are searched by their new words."""
+        place = Place()
+        place.description = "Sunny loft"
+        self.assertEqual([place], self.storage.search(Place, "loft"))
+        place.description = "Dark basement"
+        self.assertEqual([], self.storage.search(Place, "loft"))
+        self.assertEqual([place], self.storage.search("Place", "dark"))
+
+    def test_query_text(self):
+        """query() on the text attribute scans for the exact text."""
+        review = Review()
+        review.text = "quiet room"
+        Review().text = "noisy room"
+        self.assertEqual([review], self.storage.query(
+            Review, where={"text": "quiet room"}))
+        self.assertEqual("scan", self.storage.explain(
+            Review, where={"text": "quiet room"})["access"])
+
+    def test_search_without_text(self):
+        """Classes without free text raise ValueError."""
+        with self.assertRaises(ValueError):
+            self.storage.search(User, "Betty")
+
+
+class TestFileStorage_journal(unittest.TestCase):
+    """Test Cases for the append-only log of FileStorage."""
+
+    def setUp(self):
+        """Point the storage at a scratch directory."""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = FileStorage._FileStorage__file_path
+        FileStorage._FileStorage__file_path = os.path.join(
+            self.tmp.name, "file.json")
+        FileStorage._FileStorage__objects = {}
+        self.storage = FileStorage(journal=True, compact_every=100)
+
+    def tearDown(self):
+        """Restore the storage path and objects."""
+        FileStorage._FileStorage__file_path = self.path
+        self.tmp.cleanup()
+        FileStorage._FileStorage__objects = {}
+        storage.reload()
+
+    def test_save_appends_to_log(self):
+        """save() appends records instead of writing the JSON file."""
+        user = User()
+        self.storage.new(user)
+        self.storage.save()
+        self.assertFalse(os.path.exists(
+            FileStorage._FileStorage__file_path))
+        with open(self.storage.log_path(), "r") as f:
+            lines = f.readlines()
+        self.assertEqual(1, len(lines))
+        self.assertEqual("User." + user.id, json.loads(lines[0])["key"])
+
+    def test_reload_replays_log(self):
+        """reload() replays sets and deletes on top of the snapshot."""
+        u1 = User()
+        u2 = User()
+        self.storage.compact()
+        u1.first_name = "Betty"
+        self.storage.new(u1)
+        self.storage.delete(u2)
+        self.storage.save()
+        FileStorage._FileStorage__objects = {}
+        self.storage.reload()
+        objects = self.storage.all()
+        self.assertEqual("Betty", objects["User." + u1.id].first_name)
+        self.assertNotIn("User." + u2.id, objects)
+
+    def test_reload_drops_torn_record(self):
+        """A partial record at the end of the log is discarded."""
+        user = User()
+        self.storage.save()
+        with open(self.storage.log_path(), "a") as f:
+            f.write('{"op": "set", "key"')
+        self.storage.reload()
+        self.assertIn("User." + user.id, self.storage.all())
+        with open(self.storage.log_path(), "r") as f:
+            self.assertEqual(1, len(f.readlines()))
+
+    def test_record_missing_its_newline_is_kept(self):
+        """A whole last record without its newline is not lost."""
+        users = []
+        for _ in range(3):
+            users.append(User())
+            self.storage.save()
+        with open(self.storage.log_path(), "rb+") as f:
+            f.truncate(f.seek(0, os.SEEK_END) - 1)
+        for _ in range(2):
+            users.append(User())
+            self.storage.save()
+        FileStorage._FileStorage__objects = {}
+        self.storage.reload()
+        for user in users:
+            self.assertIn("User." + user.id, self.storage.all())
+        with open(self.storage.log_path(), "rb+") as f:
+            f.truncate(f.seek(0, os.SEEK_END) - 1)
+        FileStorage._FileStorage__objects = {}
+        self.storage.reload()
+        self.assertEqual(5, self.storage.count(User))
+
+    def test_torn_record_before_an_append(self):
+        """A torn record is cut off before the next append."""
+        user = User()
+        self.storage.save()
+        with open(self.storage.log_path(), "a") as f:
+            f.write('{"op": "set", "key"')
+        other = User()
+        self.storage.save()
+        FileStorage._FileStorage__objects = {}
+        self.storage.reload()
+        self.assertIn("User." + user.id, self.storage.all())
+        self.assertIn("User." + other.id, self.storage.all())
+
+    def test_corrupt_record_in_the_middle(self):
+        """A bad record followed by good ones is an error."""
+        User()
+        self.storage.save()
+        with open(self.storage.log_path(), "a") as f:
+            f.write("not json\n")
+        User()
+        self.storage.save()
+        FileStorage._FileStorage__objects = {}
+        with self.assertRaises(ValueError):
+            self.storage.reload()
+
+    def test_compaction(self):
+        """The log is folded into the JSON file after compact_every."""
+        self.storage.compact_every = 3
+        for _ in range(3):
+            User().save()
+        self.assertFalse(os.path.exists(self.storage.log_path()))
+        with open(FileStorage._FileStorage__file_path, "r") as f:
+            self.assertEqual(3, len(json.load(f)))
+
+
+class TestFileStorage_dirty(unittest.TestCase):
+    """Test Cases for the change tracking of FileStorage."""
+
+    def setUp(self):
+        """Point the storage at a scratch directory."""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = FileStorage._FileStorage__file_path
+        FileStorage._FileStorage__file_path = os.path.join(
+            self.tmp.name, "file.json")
+        FileStorage._FileStorage__objects = {}
+        self.storage = FileStorage()
+        self.users = [User() for _ in range(3)]
+        self.storage.save()
+
+    def tearDown(self):
+        """Restore the storage path and objects."""
+        FileStorage._FileStorage__file_path = self.path
+        self.tmp.cleanup()
+        FileStorage._FileStorage__objects = {}
+        storage.reload()
+
+    def test_save_serializes_only_dirty(self):
+        """Only the changed object goes through to_dict()."""
+        with patch.object(User, "to_dict", autospec=True,
+                          side_effect=BaseModel.to_dict) as to_dict:
+            self.users[1].first_name = "Betty"
+            self.storage.save()
+        self.assertEqual(1, to_dict.call_count)
+        self.storage.reload()
+        key = "User." + self.users[1].id
+        self.assertEqual("Betty", self.storage.all()[key].first_name)
+
+    def test_reload_keeps_text(self):
+        """A reloaded store saves again without serializing."""
+        self.storage.reload()
+        with patch.object(User, "to_dict", autospec=True,
+                          side_effect=BaseModel.to_dict) as to_dict:
+            self.storage.save()
+        self.assertEqual(0, to_dict.call_count)
+        with open(FileStorage._FileStorage__file_path, "r") as f:
+            self.assertEqual(3, len(json.load(f)))
+
+    def test_delete_is_saved(self):
+        """Deleted objects disappear from the file."""
+        self.storage.delete(self.users[0])
+        self.storage.save()
+        with open(FileStorage._FileStorage__file_path, "r") as f:
+            self.assertNotIn("User." + self.users[0].id, json.load(f))
+
+    def test_replaced_objects_are_all_written(self):
+        """Replacing __objects drops the cached text."""
+        FileStorage._FileStorage__objects = {}
+        user = User()
+        self.storage.save()
+        with open(FileStorage._FileStorage__file_path, "r") as f:
+            self.assertEqual(["User." + user.id], list(json.load(f)))
+
+
+class TestFileStorage_sharded(unittest.TestCase):
+    """Test Cases for the per-class files of FileStorage."""
+
+    def setUp(self):
+        """Point the storage at a scratch directory."""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = FileStorage._FileStorage__file_path
+        FileStorage._FileStorage__file_path = os.path.join(
+            self.tmp.name, "file.json")
+        FileStorage._FileStorage__objects = {}
+        self.storage = FileStorage(sharded=True, workers=2)
+
+    def tearDown(self):
+        """Restore the storage path and objects."""
+        FileStorage._FileStorage__file_path = self.path
+        self.tmp.cleanup()
+        FileStorage._FileStorage__objects = {}
+        storage.reload()
+
+    def test_save_writes_one_file_per_class(self):
+        """Each class is saved to <class name>.json."""
+        user = User()
+        place = Place()
+        self.storage.save()
+        with open(os.path.join(self.tmp.name, "User.json")) as f:
+            self.assertEqual(["User." + user.id], list(json.load(f)))
+        with open(os.path.join(self.tmp.name, "Place.json")) as f:
+            self.assertEqual(["Place." + place.id], list(json.load(f)))
+        self.assertFalse(os.path.exists(
+            FileStorage._FileStorage__file_path))
+
+    def test_save_rewrites_changed_shards(self):
+        """Only the shards of changed classes are rewritten."""
+        user = User()
+        Place()
+        self.storage.save()
+        place_path = os.path.join(self.tmp.name, "Place.json")
+        os.remove(place_path)
+        user.first_name = "Betty"
+        self.storage.save()
+        self.assertFalse(os.path.exists(place_path))
+
+    def test_parallel_reload(self):
+        """reload() rebuilds every shard."""
+        users = [User() for _ in range(3)]
+        place = Place()
+        self.storage.save()
+        FileStorage._FileStorage__objects = {}
+        self.storage.reload()
+        objects = self.storage.all()
+        self.assertEqual(4, len(objects))
+        self.assertIsInstance(objects["Place." + place.id], Place)
+        self.assertEqual(users[0].created_at,
+                         objects["User." + users[0].id].created_at)
+
+    def test_migrates_single_file(self):
+        """The single file is read, then split at the first save."""
+        user = User()
+        place = Place()
+        FileStorage().save()
+        FileStorage._FileStorage__objects = {}
+        self.storage.reload()
+        self.assertEqual(1, self.storage.count(User))
+        State()
+        self.storage.save()
+        for obj in (user, place):
+            name = type(obj).__name__
+            with open(os.path.join(self.tmp.name, name + ".json")) as f:
+                self.assertEqual(["{}.{}".format(name, obj.id)],
+                                 list(json.load(f)))
+        FileStorage._FileStorage__objects = {}
+        self.storage.reload()
+        self.assertEqual(3, len(self.storage.all()))
+
+    def test_serial_reload(self):
+        """A single worker reloads the shards in process."""
+        user = User()
+        self.storage.save()
+        self.storage.workers = 1
+        FileStorage._FileStorage__objects = {}
+        self.storage.reload()
+        self.assertIn("User." + user.id, self.storage.all())
+
+
+class TestFileStorage_lazy(unittest.TestCase):
+    """Test Cases for the lazy reload of FileStorage."""
+
+    def setUp(self):
+        """Point the storage at a scratch directory."""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = FileStorage._FileStorage__file_path
+        FileStorage._FileStorage__file_path = os.path.join(
+            self.tmp.name, "file.json")
+        FileStorage._FileStorage__objects = {}
+        self.storage = FileStorage(lazy=True)
+        self.users = [User() for _ in range(3)]
+        self.storage.save()
+        FileStorage._FileStorage__objects = {}
+        self.storage.reload()
+
+    def tearDown(self):
+        """Restore the storage path and objects."""
+        FileStorage._FileStorage__file_path = self.path
+        self.tmp.cleanup()
+        FileStorage._FileStorage__objects = {}
+        storage.reload()
+
+    def raw(self, user):
+        """Return the undecoded entry of user."""
+        return dict.__getitem__(self.storage.all(), "User." + user.id)
+
+    def test_reload_reads_offsets_only(self):
+        """Nothing is decoded by reload()."""
+        objects = self.storage.all()
+        self.assertEqual(3, len(objects))
+        self.assertIn("User." + self.users[0].id, objects)
+        for user in self.users:
+            self.assertIs(Stub, type(self.raw(user)))
+
+    def test_access_decodes_one_object(self):
+        """Reading a key decodes only that object."""
+        obj = self.storage.all()["User." + self.users[1].id]
+        self.assertIsInstance(obj, User)
+        self.assertEqual(self.users[1].created_at, obj.created_at)
+        self.assertIs(obj, self.raw(self.users[1]))
+        self.assertIs(Stub, type(self.raw(self.users[0])))
+
+    def test_threads_decode_one_object(self):
+        """Threads reading a key at once get the same object."""
+        objects = self.storage.all()
+        hydrate = objects.hydrate
+        barrier = threading.Barrier(2)
+        key = "User." + self.users[1].id
+
+        def slow(k, stub):
+            """Decode once both threads are decoding."""
+            barrier.wait(5)
+            return hydrate(k, stub)
+        objects.hydrate = slow
+        found = []
+        threads = [threading.Thread(target=lambda: found.append(
+            objects[key])) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertIs(found[0], found[1])
+        self.assertIs(found[0], self.raw(self.users[1]))
+        found[1].first_name = "Betty"
+        self.storage.save()
+        with open(FileStorage._FileStorage__file_path, "r") as f:
+            self.assertEqual("Betty", json.load(f)[key]["first_name"])
+
+    def test_snapshot_decodes(self):
+        """snapshot() holds decoded objects, the ones all() returns."""
+        snapshot = self.storage.snapshot()
+        for user in self.users:
+            obj = snapshot["User." + user.id]
+            self.assertIsInstance(obj, User)
+            self.assertIs(obj, self.raw(user))
+
+    def test_save_keeps_undecoded_objects(self):
+        """Saving writes undecoded objects back and keeps them lazy."""
+        obj = self.storage.all()["User." + self.users[1].id]
+        obj.first_name = "Betty"
+        self.storage.save()
+        self.assertIs(Stub, type(self.raw(self.users[0])))
+        self.assertEqual(self.users[0].id,
+                         self.storage.all()["User." + self.users[0].id].id)
+        with open(FileStorage._FileStorage__file_path, "r") as f:
+            d = json.load(f)
+        self.assertEqual(3, len(d))
+        self.assertEqual("Betty", d["User." + self.users[1].id]["first_name"])
+
+    def test_out_of_date_index(self):
+        """A file changed behind the index is read eagerly."""
+        User()
+        FileStorage().save()
+        self.storage.reload()
+        self.assertIsInstance(self.raw(self.users[0]), User)
+
+
+class TestFileStorage_flush(unittest.TestCase):
+    """Test Cases for the background writer of FileStorage."""
+
+    def setUp(self):
+        """Point the storage at a scratch directory."""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = FileStorage._FileStorage__file_path
+        FileStorage._FileStorage__file_path = os.path.join(
+            self.tmp.name, "file.json")
+        FileStorage._FileStorage__objects = {}
+        self.file_path = FileStorage._FileStorage__file_path
+
+    def tearDown(self):
+        """Restore the storage path and objects."""
+        FileStorage._FileStorage__file_path = self.path
+        self.tmp.cleanup()
+        FileStorage._FileStorage__objects = {}
+        storage.reload()
+
+    def wait_for_file(self):
+        """Wait up to 5 seconds for the writer to create the file."""
+        deadline = time.monotonic() + 5
+        while not os.path.exists(self.file_path):
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+
+    def test_save_is_deferred(self):
+        """save() returns before writing; flush() writes at once."""
+        fs = FileStorage(flush_delay=60)
+        users = [User() for _ in range(10)]
+        for user in users:
+            fs.save()
+        self.assertFalse(os.path.exists(self.file_path))
+        fs.flush()
+        with open(self.file_path, "r") as f:
+            self.assertEqual(10, len(json.load(f)))
+
+    def test_saves_are_coalesced(self):
+        """A burst of saves is written once after the delay."""
+        fs = FileStorage(flush_delay=0.2)
+        with patch.object(FileStorage, "compact", autospec=True,
+                          side_effect=FileStorage.compact) as compact:
+            for _ in range(50):
+                User()
+                fs.save()
+            self.wait_for_file()
+            time.sleep(0.1)
+        self.assertEqual(1, compact.call_count)
+
+    def test_flush_every(self):
+        """Enough requests trigger the write before the delay."""
+        fs = FileStorage(flush_delay=60, flush_every=5)
+        for _ in range(5):
+            User()
+            fs.save()
+        self.wait_for_file()
+        with open(self.file_path, "r") as f:
+            self.assertEqual(5, len(json.load(f)))
+
+    def test_failed_write_is_retried(self):
+        """The writer outlives a failed write and tries again."""
+        fs = FileStorage(flush_delay=0.05)
+        calls = []
+        original = FileStorage.compact
+
+        def compact(self):
+            calls.append(self)
+            if len(calls) == 1:
+                raise OSError("disk full")
+            return original(self)
+
+        User()
+        with patch.object(FileStorage, "compact", autospec=True,
+                          side_effect=compact):
+            with self.assertLogs("models.engine.file_storage", "ERROR"):
+                fs.save()
+                self.wait_for_file()
+        self.assertEqual(2, len(calls))
+        self.assertTrue(fs._FileStorage__writer.is_alive())
+
+    def test_dead_writer_is_restarted(self):
+        """save() starts a new writer if the last one is gone."""
+        fs = FileStorage(flush_delay=0.05)
+        dead = threading.Thread(target=lambda: None)
+        dead.start()
+        dead.join()
+        fs._FileStorage__writer = dead
+        User()
+        fs.save()
+        self.wait_for_file()
+        self.assertIsNot(dead, fs._FileStorage__writer)
+
+
+class TestFileStorage_durability(unittest.TestCase):
+    """Test Cases for the fsync policies of FileStorage."""
+
+    def setUp(self):
+        """Point the storage at a scratch directory."""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = FileStorage._FileStorage__file_path
+        FileStorage._FileStorage__file_path = os.path.join(
+            self.tmp.name, "file.json")
+        FileStorage._FileStorage__objects = {}
+
+    def tearDown(self):
+        """Restore the storage path and objects."""
+        FileStorage._FileStorage__file_path = self.path
+        self.tmp.cleanup()
+        FileStorage._FileStorage__objects = {}
+        storage.reload()
+
+    def test_unknown_policy(self):
+        """Only always, everysec and no are accepted."""
+        with self.assertRaises(ValueError):
+            FileStorage(fsync="sometimes")
+
+    def test_always_syncs_each_flush(self):
+        """Each journal append is synced before flush() returns."""
+        fs = FileStorage(journal=True, fsync="always")
+        with patch("os.fsync") as fsync:
+            for _ in range(3):
+                User()
+                fs.flush()
+        self.assertEqual(3, fsync.call_count)
+
+    def test_no_never_syncs(self):
+        """The default policy leaves syncing to the OS."""
+        fs = FileStorage(journal=True)
+        with patch("os.fsync") as fsync:
+            User()
+            fs.flush()
+            fs.compact()
+        fsync.assert_not_called()
+
+    def test_group_commit(self):
+        """Concurrent flushes share fsyncs of the log."""
+        fs = FileStorage(journal=True, fsync="always")
+
+        def flush():
+            User()
+            fs.flush()
+
+        with patch("os.fsync", side_effect=lambda fd: time.sleep(0.05)) \
+                as fsync:
+            threads = [threading.Thread(target=flush) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertLess(fsync.call_count, 8)
+        with open(fs.log_path(), "r") as f:
+            self.assertEqual(8, len(f.readlines()))
+
+    def test_snapshot_is_synced(self):
+        """Snapshots are synced before they replace the file."""
+        fs = FileStorage(fsync="always")
+        User()
+        with patch("os.fsync") as fsync:
+            fs.save()
+        self.assertGreaterEqual(fsync.call_count, 1)
+        self.assertFalse(os.path.exists(
+            FileStorage._FileStorage__file_path + ".tmp"))
+
+
+class TestFileStorage_bgsave(unittest.TestCase):
+    """Test Cases for the background saves of FileStorage."""
+
+    def setUp(self):
+        """Point the storage at a scratch directory."""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = FileStorage._FileStorage__file_path
+        FileStorage._FileStorage__file_path = os.path.join(
+            self.tmp.name, "file.json")
+        FileStorage._FileStorage__objects = {}
+        self.file_path = FileStorage._FileStorage__file_path
+
+    def tearDown(self):
+        """Restore the storage path and objects."""
+        storage.compact()
+        FileStorage._FileStorage__file_path = self.path
+        self.tmp.cleanup()
+        FileStorage._FileStorage__objects = {}
+        storage.reload()
+
+    def wait(self, fs):
+        """Wait up to 5 seconds for the background save to end."""
+        deadline = time.monotonic() + 5
+        while fs.bgsave_status()["in_progress"]:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+        return fs.bgsave_status()
+
+    def test_bgsave_writes_the_fork_image(self):
+        """The child writes the objects as they were at the fork."""
+        fs = FileStorage()
+        before = User()
+        self.assertIsInstance(fs.bgsave(), int)
+        after = User()
+        status = self.wait(fs)
+        self.assertEqual("ok", status["last_status"])
+        self.assertIsNotNone(status["last_save"])
+        with open(self.file_path, "r") as f:
+            self.assertEqual(["User." + before.id], list(json.load(f)))
+        self.assertIn("User." + after.id, fs.all())
+
+    def test_one_bgsave_at_a_time(self):
+        """A second bgsave fails while the first is running."""
+        fs = FileStorage()
+        snapshot = FileStorage._FileStorage__snapshot
+
+        def slow(self):
+            time.sleep(0.3)
+            snapshot(self)
+
+        with patch.object(FileStorage, "_FileStorage__snapshot", slow):
+            fs.bgsave()
+            self.assertTrue(fs.bgsave_status()["in_progress"])
+            with self.assertRaises(RuntimeError):
+                fs.bgsave()
+        self.assertEqual("ok", self.wait(fs)["last_status"])
+
+    def test_failed_bgsave(self):
+        """A child that fails is reported as err."""
+        fs = FileStorage()
+        with patch.object(FileStorage, "_FileStorage__snapshot",
+                          side_effect=OSError):
+            fs.bgsave()
+        self.assertEqual("err", self.wait(fs)["last_status"])
+        self.assertFalse(os.path.exists(self.file_path))
+
+    def test_bgsave_trims_the_log(self):
+        """The records covered by the snapshot leave the log."""
+        fs = FileStorage(journal=True)
+        User()
+        fs.bgsave()
+        self.wait(fs)
+        late = User()
+        fs.flush()
+        with open(fs.log_path(), "r") as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual(["User." + late.id], [r["key"] for r in records])
+        FileStorage._FileStorage__objects = {}
+        fs.reload()
+        self.assertEqual(2, fs.count(User))
+
+    def test_lazy_is_refused(self):
+        """Lazy stubs would point into the replaced file."""
+        with self.assertRaises(ValueError):
+            FileStorage(lazy=True).bgsave()
+
+
+class TestFileStorage_transaction(unittest.TestCase):
+    """Test Cases for the transactions of FileStorage."""
+
+    def setUp(self):
+        """Point the storage at a scratch directory."""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = FileStorage._FileStorage__file_path
+        FileStorage._FileStorage__file_path = os.path.join(
+            self.tmp.name, "file.json")
+        FileStorage._FileStorage__objects = {}
+        self.storage = FileStorage(journal=True)
+        self.user = User()
+        self.user.first_name = "Betty"
+        self.state = State()
+        self.storage.save()
+
+    def tearDown(self):
+        """Restore the storage path and objects."""
+        FileStorage._FileStorage__file_path = self.path
+        self.tmp.cleanup()
+        FileStorage._FileStorage__objects = {}
+        storage.reload()
+
+    def test_single_write(self):
+        """The saves of the block become one write when it ends."""
+        written = FileStorage._FileStorage__written
+        with self.storage.transaction():
+            state = State()
+            state.save()
+            for _ in range(3):
+                city = City()
+                city.state_id = state.id
+                city.save()
+            self.assertEqual(written, FileStorage._FileStorage__written)
+        self.assertEqual(written + 1, FileStorage._FileStorage__written)
+        FileStorage._FileStorage__objects = {}
+        self.storage.reload()
+        self.assertEqual(3, len(self.storage.children(State, state.id,
+                                                      City)))
+
+    def test_rollback(self):
+        """An error puts the objects back as they were."""
+        self.assertEqual(1, self.storage.count(User))
+        with open(self.storage.log_path()) as f:
+            log = f.read()
+        with self.assertRaises(KeyError):
+            with self.storage.transaction():
+                self.user.first_name = "Holberton"
+                self.user.save()
+                city = City()
+                self.storage.delete(self.state)
+                raise KeyError("boom")
+        self.assertEqual("Betty", self.user.first_name)
+        self.assertNotIn("City." + city.id, self.storage.all())
+        self.assertIs(self.state,
+                      self.storage.all()["State." + self.state.id])
+        self.assertEqual(0, self.storage.count(City))
+        self.assertEqual([self.user], self.storage.query(
+            User, where={"first_name": "Betty"}))
+        self.storage.save()
+        with open(self.storage.log_path()) as f:
+            self.assertEqual(log, f.read())
+
+    def test_rollback_keeps_earlier_changes(self):
+        """Changes made before the transaction are still saved."""
+        self.user.last_name = "Holberton"
+        with self.assertRaises(ValueError):
+            with self.storage.transaction():
+                self.user.first_name = "John"
+                raise ValueError
+        self.assertEqual("Betty", self.user.first_name)
+        self.assertEqual("Holberton", self.user.last_name)
+        self.storage.save()
+        FileStorage._FileStorage__objects = {}
+        self.storage.reload()
+        user = self.storage.all()["User." + self.user.id]
+        self.assertEqual("Holberton", user.last_name)
+
+    def test_nested(self):
+        """A transaction inside another one joins it."""
+        with self.storage.transaction():
+            with self.storage.transaction():
+                user = User()
+                user.save()
+            with open(self.storage.log_path()) as f:
+                self.assertNotIn(user.id, f.read())
+        with open(self.storage.log_path()) as f:
+            self.assertIn(user.id, f.read())
+
+    def test_other_threads_wait(self):
+        """Other threads cannot change the objects meanwhile."""
+        done = threading.Event()
+
+        def create():
+            User()
+            done.set()
+
+        with self.storage.transaction():
+            thread = threading.Thread(target=create)
+            thread.start()
+            self.assertFalse(done.wait(0.1))
+        self.assertTrue(done.wait(5))
+        thread.join()
+
+
+class TestFileStorage_bulk(unittest.TestCase):
+    """Test Cases for the bulk methods of FileStorage."""
+
+    def setUp(self):
+        """Point the storage at a scratch directory."""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = FileStorage._FileStorage__file_path
+        FileStorage._FileStorage__file_path = os.path.join(
+            self.tmp.name, "file.json")
+        FileStorage._FileStorage__objects = {}
+        self.storage = FileStorage()
+
+    def tearDown(self):
+        """Restore the storage path and objects."""
+        FileStorage._FileStorage__file_path = self.path
+        self.tmp.cleanup()
+        FileStorage._FileStorage__objects = {}
+        storage.reload()
+
+    def reviews(self, n):
+        """Return n reviews built from keyword arguments."""
+        now = datetime.now().isoformat()
+        return [Review(id="r{}".format(i), created_at=now, updated_at=now,
+                       place_id="p{}".format(i % 3), text="stay {}".format(i))
+                for i in range(n)]
+
+    def test_bulk_new(self):
+        """The objects are added, indexed and saved once."""
+        self.assertEqual(0, self.storage.count(Review))
+        with patch.object(FileStorage, "save", autospec=True,
+                          side_effect=FileStorage.save) as save:
+            self.assertEqual(300, self.storage.bulk_new(self.reviews(300)))
+        self.assertEqual(1, save.call_count)
+        self.assertEqual(300, self.storage.count(Review))
+        self.assertEqual(100, len(self.storage.query(
+            Review, where={"place_id": "p1"})))
+        self.assertEqual(["Review.r7"], [
+            "Review." + r.id for r in self.storage.search(Review, "7")])
+        FileStorage._FileStorage__objects = {}
+        self.storage.reload()
+        self.assertEqual(300, self.storage.count(Review))
+
+    def test_bulk_delete(self):
+        """The objects are deleted, unindexed and saved once."""
+        self.storage.bulk_new(self.reviews(30))
+        self.storage.query(Review, where={"place_id": "p0"})
+        keys = ["Review.r{}".format(i) for i in range(0, 30, 2)]
+        with patch.object(FileStorage, "save", autospec=True,
+                          side_effect=FileStorage.save) as save:
+            self.assertEqual(15, self.storage.bulk_delete(
+                keys + ["Review.nope"]))
+        self.assertEqual(1, save.call_count)
+        self.assertEqual(15, self.storage.count(Review))
+        self.assertEqual(5, len(self.storage.query(
+            Review, where={"place_id": "p0"})))
+        self.assertEqual(0, self.storage.bulk_delete(keys))
+        FileStorage._FileStorage__objects = {}
+        self.storage.reload()
+        self.assertNotIn("Review.r0", self.storage.all())
+        self.assertIn("Review.r1", self.storage.all())
+
+    def test_bulk_in_transaction(self):
+        """In a transaction the bulk methods are undone with the rest."""
+        with self.assertRaises(KeyError):
+            with self.storage.transaction():
+                self.storage.bulk_new(self.reviews(5))
+                raise KeyError("boom")
+        self.assertEqual(0, self.storage.count(Review))
+        self.assertFalse(os.path.exists(
+            FileStorage._FileStorage__file_path))
+
+
+class TestFileStorage_async(unittest.TestCase):
+    """Test Cases for the asyncio methods of FileStorage."""
+
+    def setUp(self):
+        """Point the storage at a scratch directory."""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = FileStorage._FileStorage__file_path
+        FileStorage._FileStorage__file_path = os.path.join(
+            self.tmp.name, "file.json")
+        FileStorage._FileStorage__objects = {}
+        self.file_path = FileStorage._FileStorage__file_path
+
+    def tearDown(self):
+        """Restore the storage path and objects."""
+        FileStorage._FileStorage__file_path = self.path
+        self.tmp.cleanup()
+        FileStorage._FileStorage__objects = {}
+        storage.reload()
+
+    def test_asave_and_areload(self):
+        """asave() writes the objects and areload() reads them back."""
+        fs = FileStorage()
+        user = User()
+        asyncio.run(fs.asave())
+        FileStorage._FileStorage__objects = {}
+        asyncio.run(fs.areload())
+        self.assertIn("User." + user.id, fs.all())
+
+    def test_concurrent_asave_is_coalesced(self):
+        """A burst of asave() calls writes at most twice."""
+        fs = FileStorage()
+        for _ in range(3):
+            User()
+
+        async def burst():
+            await asyncio.gather(*(fs.asave() for _ in range(20)))
+
+        with patch.object(FileStorage, "compact", autospec=True,
+                          side_effect=FileStorage.compact) as compact:
+            asyncio.run(burst())
+        self.assertLessEqual(compact.call_count, 2)
+        with open(self.file_path, "r") as f:
+            self.assertEqual(3, len(json.load(f)))
+
+    def test_asave_error(self):
+        """Every caller sharing a failed flush gets the error."""
+        fs = FileStorage()
+
+        async def burst():
+            return await asyncio.gather(*(fs.asave() for _ in range(3)),
+                                        return_exceptions=True)
+
+        with patch.object(FileStorage, "flush", side_effect=OSError):
+            errors = asyncio.run(burst())
+        self.assertTrue(all(isinstance(e, OSError) for e in errors))
+
+    def test_aget(self):
+        """aget() finds an object by class and id."""
+        fs = FileStorage()
+        place = Place()
+        self.assertIs(place, asyncio.run(fs.aget(Place, place.id)))
+        self.assertIs(place, asyncio.run(fs.aget("Place", place.id)))
+        self.assertIsNone(asyncio.run(fs.aget(User, place.id)))
+
+    def test_aiter(self):
+        """aiter() yields every object of the class across batches."""
+        fs = FileStorage()
+        users = {User().id for _ in range(5)}
+        Place()
+
+        async def collect():
+            return [obj async for obj in fs.aiter(User, batch=2)]
+
+        self.assertEqual(users, {obj.id for obj in asyncio.run(collect())})
+
+
+class TestFileStorage_codec(unittest.TestCase):
+    """Test Cases for the codecs of FileStorage."""
+
+    def setUp(self):
+        """Point the storage at a scratch directory."""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = FileStorage._FileStorage__file_path
+        FileStorage._FileStorage__file_path = os.path.join(
+            self.tmp.name, "file.json")
+        FileStorage._FileStorage__objects = {}
+        self.file_path = FileStorage._FileStorage__file_path
+
+    def tearDown(self):
+        """Restore the storage path and objects."""
+        FileStorage._FileStorage__file_path = self.path
+        self.tmp.cleanup()
+        FileStorage._FileStorage__objects = {}
+        storage.reload()
+
+    def test_unknown_codec(self):
+        """Only the known codecs are accepted."""
+        with self.assertRaises(ValueError):
+            FileStorage(codec="xml")
+        with self.assertRaises(ValueError):
+            FileStorage(lazy=True, codec="binary")
+
+    def test_round_trip(self):
+        """Each codec writes a file that reload() reads back."""
+        for codec in ("binary", "pickle", "json"):
+            with self.subTest(codec=codec):
+                FileStorage._FileStorage__objects = {}
+                fs = FileStorage(codec=codec)
+                place = Place()
+                place.price_by_night = 80
+                place.amenity_ids = ["a1"]
+                fs.save()
+                FileStorage._FileStorage__objects = {}
+                fs.reload()
+                obj = fs.all()["Place." + place.id]
+                self.assertEqual(place.to_dict(), obj.to_dict())
+
+    def test_reload_detects_the_codec(self):
+        """A store reads files written with another codec."""
+        user = User()
+        FileStorage(codec="binary").save()
+        with open(self.file_path, "rb") as f:
+            self.assertNotEqual(b"{", f.read(1))
+        FileStorage._FileStorage__objects = {}
+        fs = FileStorage()
+        fs.reload()
+        self.assertIn("User." + user.id, fs.all())
+        fs.save()
+        with open(self.file_path, "r") as f:
+            self.assertIn("User." + user.id, json.load(f))
+
+    def test_reload_refuses_pickles(self):
+        """Only a pickle store unpickles its files."""
+        User()
+        FileStorage(codec="pickle").save()
+        FileStorage._FileStorage__objects = {}
+        for codec in ("json", "binary"):
+            with patch("pickle.Unpickler") as unpickler:
+                with self.assertRaises(ValueError):
+                    FileStorage(codec=codec).reload()
+            unpickler.assert_not_called()
+        FileStorage(codec="pickle").reload()
+        self.assertEqual(1, len(FileStorage._FileStorage__objects))
+
+    def test_sharded_binary(self):
+        """Shards are written with the codec too."""
+        fs = FileStorage(sharded=True, codec="binary")
+        state = State()
+        fs.save()
+        FileStorage._FileStorage__objects = {}
+        fs.reload()
+        self.assertIn("State." + state.id, fs.all())
+
+
+class TestFileStorage_compression(unittest.TestCase):
+    """Test Cases for the compressed files of FileStorage."""
+
+    def setUp(self):
+        """Point the storage at a scratch directory."""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = FileStorage._FileStorage__file_path
+        FileStorage._FileStorage__file_path = os.path.join(
+            self.tmp.name, "file.json")
+        FileStorage._FileStorage__objects = {}
+        self.file_path = FileStorage._FileStorage__file_path
+
+    def tearDown(self):
+        """Restore the storage path and objects."""
+        FileStorage._FileStorage__file_path = self.path
+        self.tmp.cleanup()
+        FileStorage._FileStorage__objects = {}
+        storage.reload()
+
+    def test_unknown_compression(self):
+        """Only gzip, bz2 and lzma are accepted."""
+        with self.assertRaises(ValueError):
+            FileStorage(compression="zip")
+        with self.assertRaises(ValueError):
+            FileStorage(lazy=True, compression="gzip")
+
+    def test_round_trip(self):
+        """Compressed files are smaller and read back whole."""
+        for _ in range(50):
+            place = Place()
+            place.description = "A quiet loft near the river"
+        FileStorage().save()
+        size = os.path.getsize(self.file_path)
+        for compression in ("gzip", "bz2", "lzma"):
+            with self.subTest(compression=compression):
+                FileStorage(compression=compression).save()
+                self.assertLess(os.path.getsize(self.file_path), size / 2)
+                FileStorage._FileStorage__objects = {}
+                fs = FileStorage()
+                fs.reload()
+                self.assertEqual(place.to_dict(),
+                                 fs.all()["Place." + place.id].to_dict())
+
+    def test_compressed_binary(self):
+        """Compression applies to every codec."""
+        user = User()
+        FileStorage(codec="binary", compression="lzma").save()
+        FileStorage._FileStorage__objects = {}
+        fs = FileStorage()
+        fs.reload()
+        self.assertIn("User." + user.id, fs.all())
+
+
+class TestFileStorage_shared(unittest.TestCase):
+    """Test Cases for several processes sharing FileStorage files."""
+
+    def setUp(self):
+        """Point the storage at a scratch directory."""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = FileStorage._FileStorage__file_path
+        FileStorage._FileStorage__file_path = os.path.join(
+            self.tmp.name, "file.json")
+        FileStorage._FileStorage__objects = {}
+        self.file_path = FileStorage._FileStorage__file_path
+        self.storage = FileStorage(shared=True)
+
+    def tearDown(self):
+        """Restore the storage path and objects."""
+        FileStorage._FileStorage__file_path = self.path
+        self.tmp.cleanup()
+        FileStorage._FileStorage__objects = {}
+        storage.reload()
+
+    def other_process(self, change):
+        """Run change(storage) and save in a forked process."""
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                FileStorage._FileStorage__objects = {}
+                fs = FileStorage(shared=True)
+                fs.reload()
+                change(fs)
+                fs.save()
+                status = 0
+            finally:
+                os._exit(status)
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(0, status)
+
+    def saved(self):
+        """Return the saved objects."""
+        with open(self.file_path, "r") as f:
+            return json.load(f)
+
+    def test_options(self):
+        """Shared mode rewrites whole files under a lock."""
+        with self.assertRaises(ValueError):
+            FileStorage(shared=True, journal=True)
+        with self.assertRaises(ValueError):
+            FileStorage(shared=True, lazy=True)
+        with self.assertRaises(ValueError):
+            self.storage.bgsave()
+
+    def test_creates_are_merged(self):
+        """Objects created by both processes are all kept."""
+        mine = User()
+        self.other_process(lambda fs: User())
+        self.storage.save()
+        saved = self.saved()
+        self.assertIn("User." + mine.id, saved)
+        self.assertEqual(2, len(saved))
+        self.assertEqual(2, self.storage.count(User))
+
+    def test_changes_to_other_objects_are_merged(self):
+        """Changes to different objects do not conflict."""
+        a, b = User(), User()
+        self.storage.save()
+
+        def change(fs):
+            fs.all()["User." + b.id].first_name = "Betty"
+
+        self.other_process(change)
+        a.first_name = "Anna"
+        self.storage.save()
+        saved = self.saved()
+        self.assertEqual("Anna", saved["User." + a.id]["first_name"])
+        self.assertEqual("Betty", saved["User." + b.id]["first_name"])
+        self.assertEqual("Betty",
+                         self.storage.all()["User." + b.id].first_name)
+
+    def test_conflict(self):
+        """The second change to an object is refused, the rest kept."""
+        user = User()
+        self.storage.save()
+
+        def change(fs):
+            fs.all()["User." + user.id].first_name = "Betty"
+
+        self.other_process(change)
+        user.first_name = "Anna"
+        other = State()
+        with self.assertRaises(ConflictError) as cm:
+            self.storage.save()
+        self.assertEqual(["User." + user.id], cm.exception.keys)
+        saved = self.saved()
+        self.assertEqual("Betty", saved["User." + user.id]["first_name"])
+        self.assertIn("State." + other.id, saved)
+        obj = self.storage.all()["User." + user.id]
+        self.assertEqual("Betty", obj.first_name)
+        obj.first_name = "Anna"
+        self.storage.save()
+        self.assertEqual("Anna", self.saved()["User." + user.id]["first_name"])
+
+    def test_deletes_are_merged(self):
+        """Objects deleted by another process go away here too."""
+        user = User()
+        self.storage.save()
+        self.other_process(lambda fs: fs.delete(
+            fs.all()["User." + user.id]))
+        State()
+        self.storage.save()
+        self.assertNotIn("User." + user.id, self.saved())
+        self.assertNotIn("User." + user.id, self.storage.all())
+
+    def test_deletes_of_unversioned_objects_are_merged(self):
+        """Objects saved before shared mode can be deleted too."""
+        user = User()
+        FileStorage().save()
+        self.assertFalse(os.path.exists(self.storage.version_path()))
+        FileStorage._FileStorage__objects = {}
+        self.storage.reload()
+        self.other_process(lambda fs: fs.delete(
+            fs.all()["User." + user.id]))
+        State()
+        self.storage.save()
+        self.assertNotIn("User." + user.id, self.saved())
+        self.assertNotIn("User." + user.id, self.storage.all())
+
+    def test_unversioned_objects_conflict(self):
+        """Changing an object another process deleted is a conflict."""
+        user = User()
+        FileStorage().save()
+        FileStorage._FileStorage__objects = {}
+        self.storage.reload()
+        self.other_process(lambda fs: fs.delete(
+            fs.all()["User." + user.id]))
+        self.storage.all()["User." + user.id].first_name = "Anna"
+        with self.assertRaises(ConflictError):
+            self.storage.save()
+        self.assertNotIn("User." + user.id, self.saved())
+
+    def test_lock_is_exclusive(self):
+        """The lock file is held by one process at a time."""
+        pid = os.fork()
+        if pid == 0:
+            with FileLock(self.storage.lock_path()):
+                time.sleep(0.3)
+            os._exit(0)
+        time.sleep(0.1)
+        start = time.monotonic()
+        with FileLock(self.storage.lock_path()):
+            self.assertGreater(time.monotonic() - start, 0.1)
+        os.waitpid(pid, 0)
+
+
+class TestReadWriteLock(unittest.TestCase):
+    """Test Cases for the ReadWriteLock class."""
+
+    def test_readers_share(self):
+        """Several threads read at once."""
+        lock = ReadWriteLock()
+        barrier = threading.Barrier(2, timeout=5)
+
+        def read():
+            with lock.read():
+                barrier.wait()
+
+        thread = threading.Thread(target=read)
+        thread.start()
+        read()
+        thread.join()
+
+    def test_writer_excludes_readers(self):
+        """Readers wait for the writer to finish."""
+        lock = ReadWriteLock()
+        done = threading.Event()
+
+        def read():
+            with lock.read():
+                done.set()
+
+        with lock:
+            thread = threading.Thread(target=read)
+            thread.start()
+            self.assertFalse(done.wait(0.1))
+        self.assertTrue(done.wait(5))
+        thread.join()
+
+    def test_reentrant(self):
+        """The writer writes and reads again; a reader cannot write."""
+        lock = ReadWriteLock()
+        with lock:
+            with lock:
+                with lock.read():
+                    pass
+        with lock.read():
+            with lock.read():
+                pass
+            with self.assertRaises(RuntimeError):
+                with lock:
+                    pass
+        with lock:
+            pass
+
+
+class TestFileStorage_threadsafe(unittest.TestCase):
+    """Test Cases for the thread-safe mode of FileStorage."""
+
+    def setUp(self):
+        """Start from no objects."""
+        self.objects = FileStorage._FileStorage__objects
+        self.lock = FileStorage._FileStorage__lock
+        FileStorage._FileStorage__objects = {}
+        self.storage = FileStorage(threadsafe=True)
+
+    def tearDown(self):
+        """Restore the objects and the lock."""
+        FileStorage._FileStorage__objects = self.objects
+        FileStorage._FileStorage__lock = self.lock
+
+    def test_lock(self):
+        """Thread-safe mode locks with a ReadWriteLock."""
+        self.assertIsInstance(FileStorage._FileStorage__lock,
+                              ReadWriteLock)
+
+    def test_snapshot(self):
+        """snapshot() and items() do not see later changes."""
+        users = [User() for _ in range(3)]
+        items = self.storage.items()
+        snapshot = self.storage.snapshot()
+        User()
+        self.storage.delete(users[0])
+        self.assertEqual(3, len(snapshot))
+        self.assertEqual(3, len(list(items)))
+        self.assertIn("User." + users[0].id, snapshot)
+        self.assertNotIn("User." + users[0].id, self.storage.snapshot(User))
+
+    def test_snapshot_is_shared(self):
+        """Taking a snapshot copies nothing until the objects change."""
+        User()
+        snapshot = self.storage.snapshot()
+        self.assertIs(snapshot, self.storage.snapshot())
+        user = User()
+        self.assertIsNot(snapshot, self.storage.snapshot())
+        self.assertNotIn("User." + user.id, snapshot)
+        self.assertIs(user, self.storage.snapshot()["User." + user.id])
+
+    def test_snapshot_after_replacing_objects(self):
+        """A new dictionary of objects gets a new snapshot."""
+        User()
+        FileStorage._FileStorage__objects = {}
+        self.assertEqual(0, len(self.storage.snapshot()))
+
+    def test_concurrent_reads_and_writes(self):
+        """Readers iterate while writers create and delete objects."""
+        errors = []
+        stop = threading.Event()
+
+        def write():
+            try:
+                while not stop.is_set():
+                    user = User()
+                    user.first_name = "Betty"
+                    self.storage.delete(user)
+            except Exception as e:
+                errors.append(e)
+
+        def read():
+            try:
+                for _ in range(200):
+                    for key, obj in self.storage.items():
+                        pass
+                    self.storage.all(User)
+                    self.storage.query(User, where={"first_name": "Betty"})
+            except Exception as e:
+                errors.append(e)
+
+        writers = [threading.Thread(target=write) for _ in range(2)]
+        readers = [threading.Thread(target=read) for _ in range(4)]
+        for thread in writers + readers:
+            thread.start()
+        for thread in readers:
+            thread.join()
+        stop.set()
+        for thread in writers:
+            thread.join()
+        self.assertEqual([], errors)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,97 @@
+#!/usr/bin/python3
+"""Unittest module for the HAMT class."""
+
+import random
+import unittest
+from models.engine.hamt import HAMT
+
+
+class Colliding:
+    """Key whose hash is shared with other keys."""
+
+    def __init__(self, n):
+        """Initialize the key."""
+        self.n = n
+
+    def __hash__(self):
+        """Return one of three hashes."""
+        return self.n % 3
+
+    def __eq__(self, other):
+        """Compare by number."""
+        return isinstance(other, Colliding) and self.n == other.n
+
+
+class TestHAMT(unittest.TestCase):
+    """Test Cases for the HAMT class."""
+
+    def test_mapping(self):
+        """A HAMT reads like the dictionary it was built from."""
+        d = {"City.{}".format(i): i for i in range(1000)}
+        m = HAMT(d)
+        self.assertEqual(1000, len(m))
+        self.assertEqual(d, m)
+        self.assertEqual(d, dict(m.items()))
+        self.assertEqual(sorted(d.values()), sorted(m.values()))
+        self.assertIn("City.7", m)
+        self.assertNotIn("City.1000", m)
+        self.assertIsNone(m.get("City.1000"))
+        with self.assertRaises(KeyError):
+            m["City.1000"]
+
+    def test_persistent(self):
+        """set() and delete() leave the map they were called on as is."""
+        m = HAMT({"a": 1, "b": 2})
+        changed = m.set("a", 3).set("c", 4).delete("b")
+        self.assertEqual({"a": 1, "b": 2}, m)
+        self.assertEqual({"a": 3, "c": 4}, changed)
+        self.assertIs(m, m.set("a", 1))
+        self.assertIs(m, m.discard("d"))
+        with self.assertRaises(KeyError):
+            m.delete("d")
+
+    def test_collisions(self):
+        """Keys of the same hash are told apart."""
+        keys = [Colliding(n) for n in range(20)]
+        m = HAMT()
+        for key in keys:
+            m = m.set(key, key.n)
+        self.assertEqual(20, len(m))
+        self.assertEqual(list(range(20)), sorted(m[key] for key in keys))
+        for key in keys[:19]:
+            m = m.delete(key)
+        self.assertEqual({keys[19]: 19}, dict(m.items()))
+
+    def test_random(self):
+        """Random changes match those of a dictionary, old maps kept."""
+        rng = random.Random(0)
+        keys = ["k{}".format(i) for i in range(300)] + \
+            [Colliding(n) for n in range(30)]
+        d = {}
+        m = HAMT()
+        saved = []
+        for step in range(5000):
+            key = rng.choice(keys)
+            if rng.random() < 0.6:
+                d[key] = step
+                m = m.set(key, step)
+            elif key in d:
+                del d[key]
+                m = m.delete(key)
+            if step % 1000 == 0:
+                saved.append((dict(d), m))
+        self.assertEqual(d, dict(m.items()))
+        for d, m in saved:
+            self.assertEqual(len(d), len(m))
+            self.assertEqual(d, dict(m.items()))
+
+    def test_empty(self):
+        """Deleting every key leaves an empty map."""
+        m = HAMT({"a": 1})
+        self.assertEqual(0, len(m.delete("a")))
+        self.assertEqual([], list(m.delete("a")))
+        self.assertEqual({}, HAMT())
+
+
+if __name__ == "__main__":
+    unittest.main()
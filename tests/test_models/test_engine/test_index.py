@@ -0,0 +1,425 @@
+#!/usr/bin/python3
+"""Unittest module for the indexes of FileStorage."""
+
+import math
+import random
+import unittest
+from models.engine.index import BitmapIndex, ClassIndex, ColumnIndex, \
+    ForeignKeyIndex, GeoIndex, RangeIndex, TextIndex, distance, \
+    parse_metrics, tokenize
+from models.place import Place
+from models.review import Review
+
+
+def place(price, key):
+    """Return a Place with price_by_night and an id."""
+    return Place(id=key, price_by_night=price,
+                 created_at="2017-09-28T21:03:54.052298",
+                 updated_at="2017-09-28T21:03:54.052302")
+
+
+class TestClassIndex(unittest.TestCase):
+    """Test Cases for the ClassIndex class."""
+
+    def test_partitions(self):
+        """Keys are grouped by class, in insertion order."""
+        index = ClassIndex(["User.1", "Place.1", "User.2"])
+        self.assertEqual(["User.1", "User.2"], list(index.get("User")))
+        index.remove("User.1")
+        self.assertEqual(["User.2"], list(index.get("User")))
+        self.assertEqual([], list(index.get("Review")))
+
+
+class TestForeignKeyIndex(unittest.TestCase):
+    """Test Cases for the ForeignKeyIndex class."""
+
+    def test_add_remove(self):
+        """Keys are found by value until removed."""
+        index = ForeignKeyIndex("Place", "city_id")
+        p = Place()
+        p.city_id = "c1"
+        index.add("Place.1", p)
+        index.add("Place.2", p)
+        index.remove("Place.1")
+        self.assertEqual(["Place.2"], list(index.get("c1")))
+        self.assertEqual(["Place.2"], list(index.lookup([("==", "c1")])))
+        self.assertIsNone(index.lookup([("<", "c1")]))
+
+    def test_lookup_in_repeated(self):
+        """Repeated values of an in test give each key once."""
+        index = ForeignKeyIndex("Place", "city_id")
+        p = Place()
+        p.city_id = "c1"
+        index.add("Place.1", p)
+        self.assertEqual(["Place.1"],
+                         index.lookup([("in", ["c1", "c2", "c1"])]))
+
+
+class TestRangeIndex(unittest.TestCase):
+    """Test Cases for the RangeIndex class."""
+
+    def setUp(self):
+        """Index a few prices, with duplicates."""
+        self.index = RangeIndex("Place", "price_by_night")
+        for i, price in enumerate([100, 50, 150, 100, 80, 200]):
+            self.index.add("Place.{}".format(i), place(price, str(i)))
+
+    def prices(self, keys):
+        """Return the sorted indexed prices of keys."""
+        return sorted(self.index.values[k] for k in keys)
+
+    def test_range(self):
+        """Bounds are inclusive unless open."""
+        self.assertEqual([80, 100, 100, 150],
+                         self.prices(self.index.range(80, 150)))
+        self.assertEqual([100, 100],
+                         self.prices(self.index.range(80, 150, True, True)))
+        self.assertEqual([150, 200], self.prices(self.index.range(150)))
+        self.assertEqual([50], self.prices(self.index.range(None, 50)))
+
+    def test_lookup(self):
+        """Comparisons on one attribute narrow a single range."""
+        keys = self.index.lookup([(">=", 80), ("<", 150), (">", 50)])
+        self.assertEqual([80, 100, 100], self.prices(keys))
+        self.assertEqual([100, 100],
+                         self.prices(self.index.lookup([("==", 100)])))
+        self.assertEqual([50, 200],
+                         self.prices(self.index.lookup([("in", [50, 200])])))
+        self.assertIsNone(self.index.lookup([("!=", 100)]))
+
+    def test_lookup_in_repeated(self):
+        """Repeated values of an in test give each key once."""
+        keys = self.index.lookup([("in", [100, 50, 100.0])])
+        self.assertEqual(3, len(keys))
+        self.assertEqual([50, 100, 100], self.prices(keys))
+
+    def test_remove(self):
+        """Removing one duplicate keeps the other."""
+        self.index.remove("Place.0")
+        self.assertEqual(["Place.3"], self.index.range(100, 100))
+        self.index.remove("Place.0")
+        self.assertEqual(5, len(self.index.entries))
+
+    def test_non_numbers_skipped(self):
+        """Values that are not numbers are not indexed."""
+        self.index.add("Place.9", place("cheap", "9"))
+        self.assertNotIn("Place.9", self.index.values)
+
+    def test_not_finite_skipped(self):
+        """nan and inf are not indexed and leave the order intact."""
+        index = RangeIndex("Place", "price_by_night")
+        prices = [5, math.nan, 3, 7, 1, 9, 2, math.inf, -math.inf]
+        for i, price in enumerate(prices):
+            index.add("Place.{}".format(i), place(price, str(i)))
+        self.assertEqual(["Place.6", "Place.2", "Place.0", "Place.3"],
+                         index.range(2, 7))
+        index.remove("Place.1")
+        index.remove("Place.4")
+        self.assertEqual([2, 3, 5, 7, 9],
+                         [index.values[k] for k in index.range()])
+
+    def test_lookup_not_numbers(self):
+        """Tests on values that are not numbers are left to the scan."""
+        self.assertIsNone(self.index.lookup([("==", "100")]))
+        self.assertIsNone(self.index.lookup([(">", None)]))
+        self.assertIsNone(self.index.lookup([("<", math.nan)]))
+        self.assertIsNone(self.index.lookup([("in", ["x", 100])]))
+        self.assertIsNone(self.index.lookup([("in", 100)]))
+
+    def test_changes_set_aside(self):
+        """Changes between lookups are sorted in at the next one."""
+        self.index.remove("Place.1")
+        self.index.add("Place.1", place(50, "1"))
+        self.index.remove("Place.2")
+        self.index.add("Place.2", place(90, "2"))
+        self.index.add("Place.6", place(60, "6"))
+        self.index.remove("Place.6")
+        self.assertEqual([50, 80, 90, 100, 100, 200],
+                         self.prices(self.index.range()))
+        for i in range(6):
+            self.index.remove("Place.{}".format(i))
+        for i in range(20):
+            self.index.add("Place.{}".format(i), place(20 - i, str(i)))
+        for i in range(0, 20, 2):
+            self.index.remove("Place.{}".format(i))
+        self.assertEqual(list(range(1, 20, 2)),
+                         self.prices(self.index.range()))
+        self.assertEqual(10, len(self.index.entries))
+
+
+class TestGeoIndex(unittest.TestCase):
+    """Test Cases for the GeoIndex class."""
+
+    points = {"paris": (48.8566, 2.3522),
+              "versailles": (48.8049, 2.1204),
+              "london": (51.5074, -0.1278),
+              "fiji": (-17.7134, 178.065),
+              "samoa": (-13.759, -172.1046)}
+
+    def setUp(self):
+        """Index a few cities."""
+        self.index = GeoIndex("Place")
+        for name, (lat, lon) in self.points.items():
+            p = Place()
+            p.latitude, p.longitude = lat, lon
+            self.index.add(name, p)
+
+    def test_distance(self):
+        """distance() is the great-circle distance in km."""
+        self.assertAlmostEqual(343.5, distance(*self.points["paris"],
+                                               *self.points["london"]), 0)
+
+    def test_nearby(self):
+        """nearby() returns the points in the radius, nearest first."""
+        found = self.index.nearby(48.85, 2.35, 30)
+        self.assertEqual(["paris", "versailles"], [k for _, k in found])
+        self.assertEqual([], self.index.nearby(0, 0, 100))
+
+    def test_within(self):
+        """within() handles boxes crossing the antimeridian."""
+        self.assertEqual({"paris", "versailles", "london"},
+                         set(self.index.within(45, -5, 55, 5)))
+        self.assertEqual({"fiji", "samoa"},
+                         set(self.index.within(-20, 170, -10, -170)))
+
+    def test_nearest(self):
+        """nearest() widens its search until it finds k points."""
+        found = self.index.nearest(-15, 179.9, 2)
+        self.assertEqual(["fiji", "samoa"], [k for _, k in found])
+        self.assertEqual(5, len(self.index.nearest(0, 0, 10)))
+
+    def test_nearby_wide_radius(self):
+        """Points near the widest longitude of the circle are found."""
+        p = Place()
+        p.latitude, p.longitude = 66, 37
+        self.index.add("kandalaksha", p)
+        found = self.index.nearby(60, 0, 2000)
+        self.assertIn("kandalaksha", [k for _, k in found])
+
+    def test_nearby_matches_distance(self):
+        """nearby() finds what a scan of every point finds."""
+        for i in range(200):
+            p = Place()
+            p.latitude = (i * 37) % 170 - 85
+            p.longitude = (i * 91) % 360 - 180
+            self.index.add("p{}".format(i), p)
+        for lat, lon, radius in [(60, 0, 2000), (-70, 120, 3000),
+                                 (10, 179, 800), (45, -90, 5000)]:
+            expected = {k for k, point in self.index.points.items()
+                        if distance(lat, lon, *point) <= radius}
+            self.assertEqual(expected, {k for _, k in self.index.nearby(
+                lat, lon, radius)})
+
+    def test_remove(self):
+        """Removed points are not found anymore."""
+        self.index.remove("paris")
+        self.assertEqual(["versailles"],
+                         [k for _, k in self.index.nearby(48.85, 2.35, 30)])
+
+
+class TestTextIndex(unittest.TestCase):
+    """Test Cases for the TextIndex class."""
+
+    def setUp(self):
+        """Index a few reviews."""
+        self.index = TextIndex("Review", "text")
+        texts = ["Quiet and clean, quiet street",
+                 "Clean room but noisy street at night",
+                 "Great host",
+                 "Quiet"]
+        for i, text in enumerate(texts):
+            review = Review()
+            review.text = text
+            self.index.add("Review.{}".format(i), review)
+
+    def test_tokenize(self):
+        """Words are lowercased and split on non-word characters."""
+        self.assertEqual(["quiet", "room", "5"], tokenize("Quiet-room, 5!"))
+
+    def test_search_ranks(self):
+        """Shorter documents with more matches rank first."""
+        keys = [k for _, k in self.index.search("quiet")]
+        self.assertEqual(["Review.3", "Review.0"], keys)
+        keys = [k for _, k in self.index.search("clean street", limit=1)]
+        self.assertEqual(["Review.0"], keys)
+        self.assertEqual([], self.index.search("pool"))
+
+    def test_remove(self):
+        """Removed documents are not found anymore."""
+        self.index.remove("Review.3")
+        self.assertEqual(["Review.0"],
+                         [k for _, k in self.index.search("quiet")])
+        self.assertNotIn("great", [t for t in self.index.postings
+                                   if "Review.3" in self.index.postings[t]])
+
+
+class TestBitmapIndex(unittest.TestCase):
+    """Test Cases for the BitmapIndex class."""
+
+    def setUp(self):
+        """Index a few amenity lists."""
+        self.index = BitmapIndex("Place", "amenity_ids")
+        lists = [["wifi", "tv"], ["wifi"], ["wifi", "tv", "pets"], []]
+        for i, amenity_ids in enumerate(lists):
+            p = Place()
+            p.amenity_ids = amenity_ids
+            self.index.add("Place.{}".format(i), p)
+
+    def test_having(self):
+        """having() intersects the bitsets of the values."""
+        self.assertEqual(["Place.0", "Place.2"],
+                         self.index.having(["wifi", "tv"]))
+        self.assertEqual(["Place.2"],
+                         self.index.having(["wifi", "tv", "pets"]))
+        self.assertEqual([], self.index.having(["pool"]))
+        self.assertEqual(["Place.0", "Place.2"],
+                         self.index.lookup([("contains", "tv")]))
+        self.assertIsNone(self.index.lookup([("==", "tv")]))
+
+    def test_remove_reuses_slot(self):
+        """Removed keys free their slot for the next key."""
+        self.index.remove("Place.0")
+        self.assertEqual(["Place.2"], self.index.having(["tv"]))
+        p = Place()
+        p.amenity_ids = ["tv"]
+        self.index.add("Place.9", p)
+        self.assertEqual(3, len(self.index.keys))
+        self.assertEqual(["Place.9", "Place.2"], self.index.having(["tv"]))
+
+    def test_changes_set_aside(self):
+        """Bits are merged in at the next lookup, as if set at once."""
+        rng = random.Random(0)
+        index = BitmapIndex("Place", "amenity_ids")
+        lists = {}
+        for step in range(2000):
+            key = "Place.{}".format(rng.randrange(60))
+            index.remove(key)
+            lists.pop(key, None)
+            if rng.random() < 0.7:
+                p = Place()
+                p.amenity_ids = rng.sample(["wifi", "tv", "pets"],
+                                           rng.randrange(4))
+                index.add(key, p)
+                if p.amenity_ids:
+                    lists[key] = p.amenity_ids
+            if step % 50 == 0:
+                self.assertEqual(
+                    sorted(k for k, ids in lists.items() if "tv" in ids),
+                    sorted(index.having(["tv"])))
+                self.assertEqual({}, index.added)
+        self.assertEqual(sorted(lists), sorted(
+            k for k in index.keys if k is not None))
+
+
+class TestColumnIndex(unittest.TestCase):
+    """Test Cases for the ColumnIndex class."""
+
+    def setUp(self):
+        """Fill columns with prices of places in two cities."""
+        self.index = ColumnIndex("Place", {"price_by_night": int,
+                                           "latitude": float}, ["city_id"])
+        for key, price, city in [("Place.1", 100, "c1"),
+                                 ("Place.2", 200, "c1"),
+                                 ("Place.3", 60, "c2"),
+                                 ("Place.4", None, "c2")]:
+            p = place(price, key)
+            p.city_id = city
+            self.index.add(key, p)
+
+    def test_column(self):
+        """Missing values are NaN."""
+        column = list(self.index.column("price_by_night"))
+        self.assertEqual([100.0, 200.0, 60.0], column[:3])
+        self.assertTrue(math.isnan(column[3]))
+        self.assertEqual(4, len(self.index))
+
+    def test_copy(self):
+        """A copy keeps its values when the columns change."""
+        copy = self.index.copy()
+        self.index.remove("Place.1")
+        p = place(500, "Place.5")
+        p.city_id = "c3"
+        self.index.add("Place.5", p)
+        self.assertEqual({"c1": 150.0, "c2": 60.0},
+                         copy.mean("price_by_night", by="city_id"))
+        self.assertEqual({"c1": 200.0, "c2": 60.0, "c3": 500.0},
+                         self.index.mean("price_by_night", by="city_id"))
+
+    def test_mean(self):
+        """Means skip missing values, overall or by city."""
+        self.assertEqual(120.0, self.index.mean("price_by_night"))
+        self.assertEqual({"c1": 150.0, "c2": 60.0},
+                         self.index.mean("price_by_night", by="city_id"))
+        self.assertEqual(0.0, self.index.mean("latitude"))
+
+    def test_remove_reuses_rows(self):
+        """Removed rows are blanked and taken by the next object."""
+        self.index.remove("Place.2")
+        self.assertEqual({"c1": 100.0, "c2": 60.0},
+                         self.index.mean("price_by_night", by="city_id"))
+        self.index.add("Place.5", place(300, "Place.5"))
+        self.assertEqual(4, len(self.index.keys))
+        self.assertEqual("Place.5", self.index.keys[1])
+        self.assertEqual(460 / 3, self.index.mean("price_by_night"))
+
+    def test_aggregate(self):
+        """Each metric is computed per city, skipping missing values."""
+        metrics = parse_metrics({"n": "count()",
+                                 "priced": "count(price_by_night)",
+                                 "total": "sum(price_by_night)",
+                                 "low": "min(price_by_night)",
+                                 "high": ("max", "price_by_night"),
+                                 "mid": "median(price_by_night)"})
+        self.assertEqual(
+            {"c1": {"n": 2, "priced": 2, "total": 300, "low": 100,
+                    "high": 200, "mid": 150.0},
+             "c2": {"n": 2, "priced": 1, "total": 60, "low": 60,
+                    "high": 60, "mid": 60.0}},
+            self.index.aggregate(metrics, "city_id"))
+
+    def test_aggregate_percentiles(self):
+        """Percentiles interpolate between the nearest values."""
+        for i in range(11):
+            key = "Place.x{}".format(i)
+            self.index.add(key, place(i * 10, key))
+        self.index.remove("Place.1")
+        self.index.remove("Place.2")
+        self.index.remove("Place.3")
+        found = self.index.aggregate(parse_metrics(
+            {"p90": "p90(price_by_night)", "p25": "p25(price_by_night)",
+             "p100": "p100(price_by_night)"}))
+        self.assertEqual({"p90": 90.0, "p25": 25.0, "p100": 100.0}, found)
+
+    def test_aggregate_errors(self):
+        """Unknown functions and attributes are refused."""
+        with self.assertRaises(ValueError):
+            parse_metrics({"m": "mode(price_by_night)"})
+        with self.assertRaises(ValueError):
+            parse_metrics({"m": "avg()"})
+        with self.assertRaises(ValueError):
+            parse_metrics({"m": "p101(price_by_night)"})
+        with self.assertRaises(ValueError):
+            self.index.aggregate(parse_metrics({"m": "avg(name)"}))
+        with self.assertRaises(ValueError):
+            self.index.aggregate([], "name")
+
+    def test_aggregate_empty(self):
+        """Without rows there are no groups and no values."""
+        index = ColumnIndex("Place", {"price_by_night": int}, ["city_id"])
+        metrics = parse_metrics({"n": "count()",
+                                 "avg": "avg(price_by_night)"})
+        self.assertEqual({}, index.aggregate(metrics, "city_id"))
+        self.assertEqual({"n": 0, "avg": None}, index.aggregate(metrics))
+
+    def test_histogram(self):
+        """Bins are of equal width, or given by their edges."""
+        counts, edges = self.index.histogram("price_by_night", 2)
+        self.assertEqual([2, 1], counts)
+        self.assertEqual([60.0, 130.0, 200.0], edges)
+        counts, edges = self.index.histogram("price_by_night",
+                                             [0, 100, 150, 200])
+        self.assertEqual([1, 1, 1], counts)
+
+
+if __name__ == "__main__":
+    unittest.main()